@@ -0,0 +1,186 @@
+"""
+Batch analysis of many ECG .csv files across a pool of worker processes
+
+Usage: python batch_analysis.py test_data/ 'more_data/*.csv' --workers 8
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+
+def find_csv_files(inputs):
+    """
+    Expands directories and glob patterns into a sorted list of .csv paths
+
+    :param inputs: list of directories, glob patterns or .csv paths
+    :returns csv_paths: sorted list of unique .csv paths
+    """
+    csv_paths = set()
+    for target in inputs:
+        if(os.path.isdir(target)):
+            csv_paths.update(glob.glob(os.path.join(target, '*.csv')))
+        else:
+            csv_paths.update(glob.glob(target))
+    return(sorted(csv_paths))
+
+
+def analyze_file(target_csv_path, output_dir, use_cache=False, png_dir=None,
+                 memoize=False, on_invalid='reject', peak_detector='numpy'):
+    """
+    Worker function: runs HeartRateMonitor on one .csv file
+
+    :param target_csv_path: location of .csv ECG data
+    :param output_dir: directory the .json results are written to
+    :param use_cache: reuse parsed data from the csv_cache/ sidecar cache.
+                      Default: False (each file is usually parsed once)
+    :param png_dir: directory a review .png is written to (None: no plot)
+    :param memoize: reuse results of identical .csv contents (result_cache/)
+    :param on_invalid: 'reject' or 'repair' malformed .csv data
+    :param peak_detector: detectors.DETECTORS name or 'auto'
+    :returns result: dict with path, samples (None when cached), num_beats,
+                     mean_hr_bpm, cached and secs, or path and error if
+                     the analysis failed
+    """
+    from heart_rate_monitor import HeartRateMonitor
+    start = time.perf_counter()
+    result_cache = None
+    if(memoize):
+        from result_cache import ResultCache
+        result_cache = ResultCache()
+    try:
+        hrm = HeartRateMonitor(target_csv_path, use_cache=use_cache,
+                               output_dir=output_dir,
+                               result_cache=result_cache,
+                               on_invalid=on_invalid,
+                               peak_detector=peak_detector)
+        if(png_dir is not None):
+            csv_filename = os.path.basename(target_csv_path)
+            hrm.plot_ecg_lod(os.path.join(
+                png_dir, os.path.splitext(csv_filename)[0] + '.png'))
+    except Exception as error:
+        # CRV one bad file must not stop the rest of the batch
+        return({'path': target_csv_path,
+                'error': type(error).__name__ + ': ' + str(error)})
+    samples = None if hrm.result_cache_hit else len(hrm.voltages)
+    return({'path': target_csv_path,
+            'samples': samples,
+            'num_beats': hrm.num_beats,
+            'mean_hr_bpm': hrm.mean_hr_bpm,
+            'cached': hrm.result_cache_hit,
+            'secs': time.perf_counter() - start})
+
+
+def run_batch(csv_paths, output_dir, workers=None, use_cache=False,
+              png_dir=None, memoize=False, on_invalid='reject',
+              peak_detector='numpy'):
+    """
+    Analyzes .csv files in parallel with a ProcessPoolExecutor
+
+    :param csv_paths: list of .csv paths
+    :param output_dir: directory the .json results are written to
+    :param workers: number of worker processes. Default: os.cpu_count()
+    :param use_cache: reuse parsed data from the csv_cache/ sidecar cache.
+                      Default: False (each file is usually parsed once)
+    :param png_dir: directory review .png plots are written to (optional)
+    :param memoize: reuse results of identical .csv contents (result_cache/)
+    :param on_invalid: 'reject' or 'repair' malformed .csv data
+    :param peak_detector: detectors.DETECTORS name or 'auto' (each worker
+                          process auto-selects once per length bucket)
+    :returns (results, elapsed): list of analyze_file results (same order
+                                 as csv_paths) and wall-clock seconds
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+    for target_dir in [output_dir, png_dir]:
+        if(target_dir is not None and not os.path.isdir(target_dir)):
+            os.makedirs(target_dir)
+    workers = workers or os.cpu_count()
+    # CRV a few chunks per worker amortizes IPC without starving the pool
+    chunksize = max(1, len(csv_paths) // (workers * 4))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(analyze_file, csv_paths,
+                                    repeat(output_dir), repeat(use_cache),
+                                    repeat(png_dir), repeat(memoize),
+                                    repeat(on_invalid), repeat(peak_detector),
+                                    chunksize=chunksize))
+    return(results, time.perf_counter() - start)
+
+
+def summarize(results, elapsed):
+    """
+    Builds the throughput report of a batch
+
+    :param results: list of analyze_file results
+    :param elapsed: wall-clock seconds of the batch
+    :returns report: multi-line string
+    """
+    lines = []
+    samples = 0
+    errors = 0
+    cached = 0
+    for result in results:
+        if('error' in result):
+            errors += 1
+            lines.append('ERROR %s: %s' % (result['path'], result['error']))
+        else:
+            if(result['cached']):
+                cached += 1
+            else:
+                samples += result['samples']
+            lines.append('%s: %d beats, %.1f bpm' % (result['path'],
+                                                     result['num_beats'],
+                                                     result['mean_hr_bpm']))
+    elapsed = max(elapsed, 1e-9)
+    lines.append('%d files (%d errors, %d cached) in %.2f s: %.1f '
+                 'files/sec, %.0f samples/sec' % (len(results), errors,
+                                                  cached, elapsed,
+                                                  len(results) / elapsed,
+                                                  samples / elapsed))
+    return('\n'.join(lines))
+
+
+def main(argv=None):
+    from detectors import available_detectors
+    parser = argparse.ArgumentParser(
+        description='Run HeartRateMonitor on many .csv files in parallel')
+    parser.add_argument('inputs', nargs='+',
+                        help='directories, glob patterns or .csv files')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: cpu count)')
+    parser.add_argument('--output-dir', default='output_json_files/',
+                        help='where .json results are written')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep parsed data in the csv_cache/ sidecar '
+                             'cache for later runs')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='do not use the csv_cache/ sidecar cache '
+                             '(default)')
+    parser.add_argument('--memoize', action='store_true',
+                        help='reuse results of identical .csv contents')
+    parser.add_argument('--png-dir', default=None,
+                        help='also write a review .png per file here')
+    parser.add_argument('--on-invalid', choices=['reject', 'repair'],
+                        default='reject',
+                        help='reject malformed files (default) or repair '
+                             'them (drop bad timestamps, interpolate NaN)')
+    parser.add_argument('--peak-detector', default='numpy',
+                        choices=available_detectors() + ['auto'],
+                        help="beat detection engine, or 'auto' for the "
+                             'fastest one that agrees with numpy')
+    args = parser.parse_args(argv)
+    csv_paths = find_csv_files(args.inputs)
+    if(len(csv_paths) == 0):
+        parser.error('no .csv files found')
+    results, elapsed = run_batch(csv_paths, args.output_dir, args.workers,
+                                 args.cache, args.png_dir,
+                                 args.memoize, args.on_invalid,
+                                 args.peak_detector)
+    print(summarize(results, elapsed))
+    return(1 if any('error' in result for result in results) else 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Benchmarks every registered beat detector on synthetic ECG traces
+
+For each signal length, every available engine runs the
+HeartRateMonitor rule (shift, median threshold, retry at 0.9) and is
+scored against the true R peak positions of the trace (1 - F1 score,
+beats within 50 ms match). The last column is the engine
+detectors.select_detector picks for --max-error.
+
+Usage: python benchmarks/bench_detectors.py [--sizes 1e4 1e6] \\
+           [--noise 0.05] [--max-error 0.01]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+import numpy as np  # noqa: E402
+import detectors  # noqa: E402
+from synthetic_ecg import DEFAULT_FS, synthetic_ecg  # noqa: E402
+
+
+def true_beats(n_samples, fs, hr_bpm):
+    """
+    :returns indexes: numpy array of the R peak samples of synthetic_ecg
+    """
+    period = 60.0 / hr_bpm
+    peaks = np.arange(0.1 * period, n_samples / fs, period)
+    return(np.rint(peaks * fs).astype(np.int64))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=float,
+                        default=[1e4, 1e5, 1e6],
+                        help='signal lengths (samples)')
+    parser.add_argument('--fs', type=float, default=DEFAULT_FS)
+    parser.add_argument('--hr-bpm', type=float, default=75.0)
+    parser.add_argument('--noise', type=float, default=0.02)
+    parser.add_argument('--max-error', type=float,
+                        default=detectors.DEFAULT_MAX_ERROR,
+                        help='largest accepted 1 - F1 score')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%12s %14s %8s %10s %8s %14s' % ('samples', 'detector', 'beats',
+                                           'secs', 'error', 'selected'))
+    for size in args.sizes:
+        timestamps, voltages = synthetic_ecg(int(size), args.fs, args.hr_bpm,
+                                             args.noise)
+        reference = true_beats(len(voltages), args.fs, args.hr_bpm)
+        results = detectors.benchmark_detectors(voltages, args.fs, reference,
+                                                repeat=args.repeat)
+        selected = next((result['name'] for result in results
+                         if result['error'] <= args.max_error), 'numpy')
+        for result in results:
+            print('%12d %14s %8d %10.4f %8.4f %14s' % (
+                len(voltages), result['name'], result['num_beats'],
+                result['secs'], result['error'],
+                selected if result is results[0] else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmarks hrv.hrv_metrics against a per-beat Python loop
+
+The loop is the script we used to run over the exported .json beats list:
+one pass per metric and one pass over the beats per window. Beats are a
+75 bpm rhythm with random RR jitter; both must give the same metrics.
+
+Usage: python benchmarks/bench_hrv.py [--sizes 1e3 1e5] [--window 60]
+"""
+import argparse
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+import numpy as np  # noqa: E402
+import hrv  # noqa: E402
+
+
+def best_of(func, repeat):
+    """
+    :returns secs: fastest of repeat timed calls of func
+    """
+    return(min(timeit.repeat(func, number=1, repeat=repeat)))
+
+
+def loop_stats(rr):
+    """
+    :param rr: list of RR intervals (seconds)
+    :returns (sdnn_ms, rmssd_ms, pnn50): metrics of the intervals
+    """
+    sdnn = rmssd = pnn50 = float('nan')
+    if(len(rr) > 1):
+        mean = sum(rr) / len(rr)
+        sdnn = 1000 * math.sqrt(sum((value - mean) ** 2 for value in rr) /
+                                (len(rr) - 1))
+        squares = 0.0
+        nn50 = 0
+        for i in range(1, len(rr)):
+            squares += (rr[i] - rr[i - 1]) ** 2
+            if(abs(rr[i] - rr[i - 1]) > hrv.NN50_SECS):
+                nn50 += 1
+        rmssd = 1000 * math.sqrt(squares / (len(rr) - 1))
+        pnn50 = 100.0 * nn50 / (len(rr) - 1)
+    return(sdnn, rmssd, pnn50)
+
+
+def loop_hrv(beats, window_secs):
+    """
+    :param beats: list of beat timestamps (seconds)
+    :param window_secs: window length (seconds)
+    :returns (whole, windows): loop_stats of the recording and per window
+    """
+    rr = [beats[i] - beats[i - 1] for i in range(1, len(beats))]
+    windows = []
+    start = beats[0]
+    while start <= beats[-1]:
+        rr_window = [beats[i] - beats[i - 1] for i in range(1, len(beats))
+                     if start <= beats[i] < start + window_secs]
+        windows.append(loop_stats(rr_window))
+        start += window_secs
+    return(loop_stats(rr), windows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=float,
+                        default=[1e3, 1e4, 3e4],
+                        help='number of beats')
+    parser.add_argument('--window', type=float,
+                        default=hrv.DEFAULT_HRV_WINDOW_SECS,
+                        help='window length (seconds)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(590)
+    print('%10s %9s %12s %12s %9s' % ('beats', 'windows', 'loop s',
+                                      'numpy s', 'speedup'))
+    for size in args.sizes:
+        beats = np.cumsum(0.8 + rng.normal(0, 0.05, int(size)))
+        beats_list = beats.tolist()
+        metrics = hrv.hrv_metrics(beats, args.window)
+        whole, windows = loop_hrv(beats_list, args.window)
+        assert np.allclose([metrics['sdnn_ms'], metrics['rmssd_ms'],
+                            metrics['pnn50']], whole), 'metrics disagree'
+        assert np.allclose(np.column_stack((metrics['window_sdnn_ms'],
+                                            metrics['window_rmssd_ms'],
+                                            metrics['window_pnn50'])),
+                           windows, equal_nan=True), 'windows disagree'
+        slow = best_of(lambda: loop_hrv(beats_list, args.window),
+                       args.repeat)
+        fast = best_of(lambda: hrv.hrv_metrics(beats, args.window),
+                       args.repeat)
+        print('%10d %9d %12.4f %12.4f %8.1fx' % (
+            len(beats), len(windows), slow, fast, slow / fast))
+
+
+if __name__ == '__main__':
+    main()
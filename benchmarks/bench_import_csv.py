@@ -0,0 +1,93 @@
+"""
+Benchmarks the ImportCSV loader backends
+
+Scales test_data/test_data1.csv up (timestamps offset so they keep
+increasing) and reports rows/sec and peak RSS for every loader. Each
+loader runs in its own child process so peak RSS is not shared.
+
+Usage: python benchmarks/bench_import_csv.py [--scale 1000]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+import import_csv  # noqa: E402
+
+SOURCE_CSV = os.path.join(os.path.dirname(__file__), '..',
+                          'test_data', 'test_data1.csv')
+
+
+def write_scaled_csv(dest_path, scale):
+    """
+    Writes the source .csv repeated scale times with shifted timestamps
+
+    :param dest_path: where to write the scaled .csv
+    :param scale: number of copies of the source data
+    """
+    with open(SOURCE_CSV) as source:
+        rows = [line.strip().split(',') for line in source if line.strip()]
+    period = float(rows[-1][0]) + float(rows[1][0])
+    with open(dest_path, 'w') as dest:
+        for copy in range(scale):
+            offset = copy * period
+            dest.write(''.join('%.3f,%s\n' % (float(ts) + offset, voltage)
+                               for ts, voltage in rows))
+
+
+def peak_rss_bytes():
+    """
+    :returns peak_rss: peak resident set size of this process (bytes)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # CRV ru_maxrss is kB on Linux and bytes on macOS
+    return(peak if sys.platform == 'darwin' else peak * 1024)
+
+
+def run_loader(loader, csv_path, results):
+    """
+    Child process body: time one loader and report rows and peak RSS
+    """
+    start_rss = peak_rss_bytes()
+    start = time.perf_counter()
+    imported = import_csv.ImportCSV(csv_path, loader=loader,
+                                    use_cache=False)
+    elapsed = time.perf_counter() - start
+    results.put((len(imported.timestamps), elapsed,
+                 peak_rss_bytes() - start_rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', type=int, default=1000,
+                        help='copies of test_data1.csv (default: 1000)')
+    parser.add_argument('--loaders', nargs='+', default=sorted(
+        import_csv.LOADERS), help='loader backends to benchmark')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    csv_path = os.path.join(workdir, 'scaled.csv')
+    write_scaled_csv(csv_path, args.scale)
+    print('%s: %.1f MB' % (csv_path, os.path.getsize(csv_path) / 1e6))
+    print('%-12s %12s %10s %14s %12s' % ('loader', 'rows', 'secs',
+                                         'rows/sec', 'peak RSS MB'))
+    results = multiprocessing.Queue()
+    for loader in args.loaders:
+        child = multiprocessing.Process(target=run_loader,
+                                        args=(loader, csv_path, results))
+        child.start()
+        rows, elapsed, rss = results.get()
+        child.join()
+        print('%-12s %12d %10.3f %14.0f %12.1f' % (loader, rows, elapsed,
+                                                   rows / elapsed, rss / 1e6))
+    os.remove(csv_path)
+    os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
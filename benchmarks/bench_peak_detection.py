@@ -0,0 +1,76 @@
+"""
+Benchmarks peak_detection.indexes against peakutils.indexes
+
+Tiles the voltages of test_data/test_data1.csv up to each signal length,
+checks that all detectors return the same peaks and reports the speedup
+of indexes and of the threaded parallel_indexes.
+
+Usage: python benchmarks/bench_peak_detection.py [--sizes 1e4 1e6] \\
+           [--workers 4]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+import numpy as np  # noqa: E402
+import peakutils  # noqa: E402
+import peak_detection  # noqa: E402
+from import_csv import load_chunked  # noqa: E402
+
+SOURCE_CSV = os.path.join(os.path.dirname(__file__), '..',
+                          'test_data', 'test_data1.csv')
+
+
+def best_of(func, repeat):
+    """
+    :returns secs: fastest of repeat timed calls of func
+    """
+    return(min(timeit.repeat(func, number=1, repeat=repeat)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=float,
+                        default=[1e4, 1e5, 1e6, 1e7],
+                        help='signal lengths (samples)')
+    parser.add_argument('--min-dist', type=int, default=1,
+                        help='refractory period in samples (default: 1)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='parallel_indexes threads (default: cpu count)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    timestamps, voltages = load_chunked(SOURCE_CSV)
+    # CRV same shift and threshold as HeartRateMonitor.find_beats
+    voltages = voltages + 1
+    threshold = float(np.median(voltages))
+    print('%12s %8s %12s %12s %9s %12s %9s' % (
+        'samples', 'peaks', 'peakutils s', 'numpy s', 'speedup',
+        'threads s', 'speedup'))
+    for size in args.sizes:
+        data = np.resize(voltages, int(size))
+        expected = peakutils.indexes(data, threshold, args.min_dist)
+        found = peak_detection.indexes(data, threshold, args.min_dist)
+        assert np.array_equal(expected, found), 'detectors disagree'
+        found = peak_detection.parallel_indexes(data, threshold,
+                                                args.min_dist,
+                                                workers=args.workers)
+        assert np.array_equal(expected, found), 'detectors disagree'
+        slow = best_of(lambda: peakutils.indexes(data, threshold,
+                                                 args.min_dist), args.repeat)
+        fast = best_of(lambda: peak_detection.indexes(data, threshold,
+                                                      args.min_dist),
+                       args.repeat)
+        threaded = best_of(lambda: peak_detection.parallel_indexes(
+            data, threshold, args.min_dist, workers=args.workers),
+            args.repeat)
+        print('%12d %8d %12.4f %12.4f %8.1fx %12.4f %8.1fx' % (
+            len(data), len(found), slow, fast, slow / fast, threaded,
+            slow / threaded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmarks every HeartRateMonitor stage across synthetic signal sizes
+
+For each size a synthetic ECG .csv is generated and analyzed in a fresh
+child process with instrumentation timers on. The per-stage seconds,
+peak RSS and detected/expected beats are printed and saved as JSON (with
+every recorded timer, including stages missing from the table).
+
+HeartRateMonitor's rule has no refractory period, so noise can split the
+top of an R wave into two peaks a few samples apart: with the default
+noise about 2% more beats are detected than the trace holds (39 vs 38 at
+1e4 samples, 383 vs 376 at 1e5). A run whose count is further from the
+expected one than --beat-tolerance is flagged with '!', and the script
+exits 1.
+
+Usage: python benchmarks/bench_pipeline.py --sizes 1e4 1e5 1e6 \\
+           --hr-bpm 75 --noise 0.02 --baseline -0.145 --output results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+from synthetic_ecg import write_synthetic_csv  # noqa: E402
+
+# CRV table columns in pipeline order; validate runs inside import and
+# preprocess/detect_peaks inside find_beats
+STAGES = ['import', 'validate', 'extremes', 'duration', 'preprocess',
+          'detect_peaks', 'find_beats', 'mean_hr', 'hrv', 'json_write']
+# CRV largest |detected - expected| / expected beats before a run is flagged
+DEFAULT_BEAT_TOLERANCE = 0.05
+
+
+def peak_rss_bytes():
+    """
+    :returns peak_rss: peak resident set size of this process (bytes)
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # CRV ru_maxrss is kB on Linux and bytes on macOS
+    return(peak if sys.platform == 'darwin' else peak * 1024)
+
+
+def analyze(csv_path, output_dir, results):
+    """
+    Child process body: run the pipeline once with stage timers on
+    """
+    import instrumentation
+    from heart_rate_monitor import HeartRateMonitor
+    instrumentation.enable_timers()
+    start_rss = peak_rss_bytes()
+    start = time.perf_counter()
+    hrm = HeartRateMonitor(csv_path, use_cache=False, output_dir=output_dir)
+    total = time.perf_counter() - start
+    timings = instrumentation.timings()
+    results.put({'stages': {name: timing['secs']
+                            for name, timing in timings.items()},
+                 'total_secs': total,
+                 'num_beats': hrm.num_beats,
+                 'peak_rss_bytes': peak_rss_bytes() - start_rss})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=float,
+                        default=[1e4, 1e5, 1e6, 1e7, 1e8],
+                        help='signal lengths in samples (default: 1e4..1e8)')
+    parser.add_argument('--fs', type=float, default=333.0)
+    parser.add_argument('--hr-bpm', type=float, default=75.0)
+    parser.add_argument('--noise', type=float, default=0.02)
+    parser.add_argument('--baseline', type=float, default=-0.145)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_pipeline_results.json',
+                        help='machine-readable results file')
+    parser.add_argument('--beat-tolerance', type=float,
+                        default=DEFAULT_BEAT_TOLERANCE,
+                        help='largest accepted |detected - expected| / '
+                             'expected beats')
+    args = parser.parse_args()
+
+    signal = {'fs': args.fs, 'hr_bpm': args.hr_bpm, 'noise': args.noise,
+              'baseline': args.baseline, 'seed': args.seed}
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'signal': signal,
+              'beat_tolerance': args.beat_tolerance,
+              'runs': []}
+    workdir = tempfile.mkdtemp()
+    print('%12s %8s %8s ' % ('samples', 'beats', 'expected') +
+          ' '.join('%12s' % name for name in STAGES) +
+          ' %10s %10s' % ('total s', 'RSS MB'))
+    results = multiprocessing.Queue()
+    try:
+        for size in args.sizes:
+            csv_path = os.path.join(workdir, 'synthetic.csv')
+            expected = write_synthetic_csv(csv_path, int(size), **signal)
+            child = multiprocessing.Process(target=analyze,
+                                            args=(csv_path, workdir, results))
+            child.start()
+            run = results.get()
+            child.join()
+            beats_ok = (abs(run['num_beats'] - expected) <=
+                        args.beat_tolerance * expected)
+            run.update({'samples': int(size), 'expected_beats': expected,
+                        'beats_ok': beats_ok,
+                        'csv_bytes': os.path.getsize(csv_path)})
+            report['runs'].append(run)
+            print('%12d %7d%s %8d ' % (size, run['num_beats'],
+                                       ' ' if beats_ok else '!', expected) +
+                  ' '.join('%12.4f' % run['stages'].get(name, 0)
+                           for name in STAGES) +
+                  ' %10.3f %10.1f' % (run['total_secs'],
+                                      run['peak_rss_bytes'] / 1e6))
+            os.remove(csv_path)
+    finally:
+        shutil.rmtree(workdir)
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print('results written to ' + args.output)
+    if(not all(run['beats_ok'] for run in report['runs'])):
+        print('detected beats outside --beat-tolerance (marked !)')
+        return(1)
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
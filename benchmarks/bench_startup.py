@@ -0,0 +1,95 @@
+"""
+Benchmarks interpreter startup cost of the analysis modules
+
+Runs `python -X importtime -c "import heart_rate_monitor"` in fresh
+processes and reports the median import time, split into numpy and our
+own modules. It then analyzes a .csv headless (lazy mode, build_results)
+in another fresh process and lists any of HEADLESS_FORBIDDEN that got
+imported. Exits 1 when our own import time is over --target-ms or a
+forbidden module was loaded.
+
+Usage: python benchmarks/bench_startup.py --repeat 20 --target-ms 12
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SOURCE_CSV = os.path.join(REPO_DIR, 'test_data', 'test_data1.csv')
+MODULES = ['heart_rate_monitor', 'import_csv', 'instrumentation', 'numpy']
+# CRV optional dependencies a headless worker must never import
+HEADLESS_FORBIDDEN = ['peakutils', 'scipy', 'matplotlib', 'msgpack']
+# CRV own modules' import time on top of numpy (milliseconds)
+DEFAULT_TARGET_MS = 12.0
+
+HEADLESS_SCRIPT = '''
+import json, sys
+from heart_rate_monitor import HeartRateMonitor
+HeartRateMonitor(sys.argv[1], use_cache=False, lazy=True).build_results()
+print(json.dumps(sorted(name for name in sys.modules
+                        if name.split('.')[0] in sys.argv[2:])))
+'''
+
+
+def import_times(module_name='heart_rate_monitor'):
+    """
+    Imports a module in a fresh interpreter with -X importtime
+
+    :param module_name: module to import
+    :returns times: dict module -> cumulative import time (milliseconds)
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+        cwd=REPO_DIR, stderr=subprocess.PIPE, universal_newlines=True,
+        check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if(not line.startswith('import time:') or 'cumulative' in line):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative_us) / 1000
+    return(times)
+
+
+def headless_imports(csv_path=SOURCE_CSV):
+    """
+    :param csv_path: .csv analyzed in a fresh interpreter
+    :returns loaded: HEADLESS_FORBIDDEN modules imported by the analysis
+    """
+    completed = subprocess.run(
+        [sys.executable, '-c', HEADLESS_SCRIPT, csv_path] +
+        HEADLESS_FORBIDDEN, cwd=REPO_DIR, stdout=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    return(json.loads(completed.stdout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--target-ms', type=float, default=DEFAULT_TARGET_MS,
+                        help='budget for our modules on top of numpy')
+    args = parser.parse_args()
+
+    runs = [import_times() for repeat in range(args.repeat)]
+    medians = {name: statistics.median(run[name] for run in runs)
+               for name in MODULES if name in runs[0]}
+    own_ms = statistics.median(run['heart_rate_monitor'] - run['numpy']
+                               for run in runs)
+    for name in MODULES:
+        if(name in medians):
+            print('%-20s %8.2f ms' % (name, medians[name]))
+        else:
+            print('%-20s %11s' % (name, 'deferred'))
+    print('%-20s %8.2f ms (target %.2f ms)' % ('own (total - numpy)',
+                                               own_ms, args.target_ms))
+    loaded = headless_imports()
+    print('optional modules loaded headless: ' + (', '.join(loaded) or
+                                                  'none'))
+    return(0 if own_ms <= args.target_ms and not loaded else 1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Synthetic ECG traces for benchmarks
+
+Each beat is a narrow Gaussian R wave followed by a wider T wave, on a
+constant (optionally negative) baseline with Gaussian noise.
+"""
+import numpy as np
+
+DEFAULT_FS = 333.0
+DEFAULT_CHUNK_SAMPLES = 10 ** 6
+
+
+def synthetic_ecg(n_samples, fs=DEFAULT_FS, hr_bpm=75.0, noise=0.02,
+                  baseline=-0.145, start=0, seed=0):
+    """
+    Generates samples start .. start + n_samples of a synthetic ECG trace
+
+    :param n_samples: number of samples
+    :param fs: sampling rate (Hz)
+    :param hr_bpm: heart rate (bpm)
+    :param noise: standard deviation of the added noise
+    :param baseline: voltage between beats (negative to test the shift)
+    :param start: index of the first sample (for chunked generation)
+    :param seed: random seed (mixed with start so chunks differ)
+    :returns (timestamps, voltages): numpy arrays
+    """
+    timestamps = (start + np.arange(n_samples)) / fs
+    period = 60.0 / hr_bpm
+    phase = np.mod(timestamps, period)
+    voltages = (baseline +
+                1.2 * np.exp(-0.5 * ((phase - 0.1 * period) / 0.012) ** 2) +
+                0.3 * np.exp(-0.5 * ((phase - 0.45 * period) / 0.04) ** 2))
+    rng = np.random.RandomState((seed + start) % 2 ** 32)
+    voltages += rng.normal(0, noise, n_samples)
+    return(timestamps, voltages)
+
+
+def write_synthetic_csv(path, n_samples, chunk_samples=DEFAULT_CHUNK_SAMPLES,
+                        **kwargs):
+    """
+    Writes a synthetic ECG .csv chunk by chunk (bounded memory)
+
+    :param path: destination .csv path
+    :param n_samples: number of samples
+    :param chunk_samples: samples generated and written at a time
+    :param kwargs: passed to synthetic_ecg
+    :returns expected_beats: number of complete beats in the trace
+    """
+    with open(path, 'w') as csv_file:
+        for start in range(0, n_samples, chunk_samples):
+            size = min(chunk_samples, n_samples - start)
+            timestamps, voltages = synthetic_ecg(size, start=start, **kwargs)
+            np.savetxt(csv_file, np.column_stack((timestamps, voltages)),
+                       fmt=('%.4f', '%.4f'), delimiter=',')
+    fs = kwargs.get('fs', DEFAULT_FS)
+    period = 60.0 / kwargs.get('hr_bpm', 75.0)
+    return(int(((n_samples - 1) / fs - 0.1 * period) // period) + 1)
@@ -0,0 +1,225 @@
+"""
+Columnar on-disk store of analysis results for many recordings
+
+One raw binary file per metric column, a concatenated beats column with
+per-recording end offsets, a paths file and a JSON manifest holding the
+row count and the committed length of the paths file. Columns are
+memory-mapped, so filters and aggregates over hundreds of thousands of
+recordings are plain numpy expressions.
+
+Appends write the column files first and the manifest last (atomically),
+so a crash mid-append leaves the extra bytes ignored and they are
+truncated on the next append.
+"""
+import json
+import os
+import numpy as np
+
+COLUMNS = {
+    'mean_hr_bpm': np.float64,
+    'min_voltage': np.float64,
+    'max_voltage': np.float64,
+    'duration': np.float64,
+    'num_beats': np.int64,
+    'beat_ends': np.int64,
+}
+BEATS_DTYPE = np.float64
+
+
+def encode_path(path):
+    """
+    :returns line: path as one utf-8 line of paths.txt
+    """
+    return((path + '\n').encode('utf-8'))
+
+
+class CohortStore:
+    """
+    Appendable, memory-mappable columnar store of HeartRateMonitor results
+
+    :param store_dir: directory holding the store (created if missing)
+    :attr paths: list of the .csv path of every recording
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        if(not os.path.isdir(store_dir)):
+            os.makedirs(store_dir)
+        self.num_recordings = 0
+        self.num_stored_beats = 0
+        self.paths_bytes = 0
+        manifest_path = self.file_path('manifest.json')
+        if(os.path.isfile(manifest_path)):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            self.num_recordings = manifest['num_recordings']
+            self.num_stored_beats = manifest['num_beats']
+            self.paths_bytes = manifest['paths_bytes']
+        self.paths = self.read_paths()
+        self.__columns = {}
+
+    def __len__(self):
+        return self.num_recordings
+
+    def file_path(self, filename):
+        """
+        :returns path: path of a file of the store
+        """
+        return(os.path.join(self.store_dir, filename))
+
+    def read_paths(self):
+        """
+        :returns paths: .csv paths of the committed recordings
+        """
+        paths_path = self.file_path('paths.txt')
+        if(not os.path.isfile(paths_path)):
+            return([])
+        with open(paths_path, 'rb') as paths_file:
+            paths = paths_file.read().decode('utf-8').split('\n')
+        return(paths[:self.num_recordings])
+
+    def column(self, name):
+        """
+        Memory-maps one column
+
+        :param name: key of COLUMNS, or 'beats' (all recordings' beats)
+        :returns column: read-only numpy array (memmap)
+        :raises KeyError: unknown column
+        """
+        if(name not in self.__columns):
+            dtype = BEATS_DTYPE if name == 'beats' else COLUMNS[name]
+            length = (self.num_stored_beats if name == 'beats' else
+                      self.num_recordings)
+            if(length == 0):
+                self.__columns[name] = np.zeros(0, dtype=dtype)
+            else:
+                self.__columns[name] = np.memmap(
+                    self.file_path(name + '.bin'), dtype=dtype, mode='r',
+                    shape=(length,))
+        return(self.__columns[name])
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def beat_starts(self):
+        """
+        :returns starts: index of each recording's first beat in 'beats'
+        """
+        ends = self.column('beat_ends')
+        return(np.concatenate(([0], ends[:-1])).astype(np.int64))
+
+    def beats_of(self, index):
+        """
+        :param index: recording index
+        :returns beats: numpy array of that recording's beat timestamps
+        """
+        ends = self.column('beat_ends')
+        start = ends[index - 1] if index > 0 else 0
+        return(self.column('beats')[start:ends[index]])
+
+    def where(self, mask):
+        """
+        :param mask: boolean numpy array, one entry per recording
+        :returns paths: .csv paths of the selected recordings
+        """
+        return([self.paths[index] for index in np.flatnonzero(mask)])
+
+    def append(self, result):
+        """
+        Appends one analysis result
+
+        :param result: HeartRateMonitor, OutOfCoreHeartRateMonitor or
+                       HeartRateSummary
+        """
+        self.extend([result])
+
+    def extend(self, results):
+        """
+        Appends many analysis results with a single manifest update
+
+        :param results: iterable of analyzed results (see append)
+        """
+        from results_writer import write_atomic
+        results = list(results)
+        if(len(results) == 0):
+            return
+        self.truncate_uncommitted()
+        beats = [np.asarray(result.beats, dtype=BEATS_DTYPE)
+                 for result in results]
+        counts = np.array([len(result_beats) for result_beats in beats],
+                          dtype=np.int64)
+        values = {
+            'mean_hr_bpm': [result.mean_hr_bpm for result in results],
+            'min_voltage': [result.voltage_extremes[0] for result in results],
+            'max_voltage': [result.voltage_extremes[1] for result in results],
+            'duration': [result.duration for result in results],
+            'num_beats': counts,
+            'beat_ends': self.num_stored_beats + np.cumsum(counts),
+        }
+        for name, dtype in COLUMNS.items():
+            with open(self.file_path(name + '.bin'), 'ab') as column_file:
+                np.asarray(values[name], dtype=dtype).tofile(column_file)
+        with open(self.file_path('beats.bin'), 'ab') as beats_file:
+            np.concatenate(beats).tofile(beats_file)
+        new_paths = [str(result.target_csv_path) for result in results]
+        encoded_paths = b''.join(encode_path(path) for path in new_paths)
+        with open(self.file_path('paths.txt'), 'ab') as paths_file:
+            paths_file.write(encoded_paths)
+        self.num_recordings += len(results)
+        self.num_stored_beats += int(counts.sum())
+        self.paths_bytes += len(encoded_paths)
+        # CRV the manifest commits the new rows
+        write_atomic(self.file_path('manifest.json'), json.dumps(
+            {'num_recordings': self.num_recordings,
+             'num_beats': self.num_stored_beats,
+             'paths_bytes': self.paths_bytes}).encode('utf-8'))
+        self.paths.extend(new_paths)
+        self.__columns = {}
+
+    def truncate_uncommitted(self):
+        """
+        Cuts off bytes left by an append that never reached the manifest
+        """
+        for name, dtype in COLUMNS.items():
+            self.truncate(name + '.bin',
+                          self.num_recordings * np.dtype(dtype).itemsize)
+        self.truncate('beats.bin', self.num_stored_beats *
+                      np.dtype(BEATS_DTYPE).itemsize)
+        self.truncate('paths.txt', self.paths_bytes)
+
+    def truncate(self, filename, size):
+        """
+        Truncates a file of the store to size bytes if it is longer
+        """
+        path = self.file_path(filename)
+        if(os.path.isfile(path) and os.path.getsize(path) > size):
+            os.truncate(path, size)
+
+    def max_windowed_hr_bpm(self, window_secs):
+        """
+        Highest heart rate of every recording over any window of a length
+
+        Vectorized over all recordings at once: each recording's beats are
+        offset onto one sorted axis, so a single np.searchsorted counts the
+        beats in the window starting at every beat.
+
+        :param window_secs: window length (seconds)
+        :returns hr_bpm: numpy array, one value per recording (0 if no beats)
+        """
+        beats = np.asarray(self.column('beats'))
+        num_beats = np.asarray(self.column('num_beats'))
+        hr_bpm = np.zeros(self.num_recordings)
+        if(len(beats) == 0):
+            return(hr_bpm)
+        recording = np.repeat(np.arange(self.num_recordings), num_beats)
+        starts = self.beat_starts()
+        first_beats = beats[starts[num_beats > 0]]
+        relative = beats - np.repeat(first_beats, num_beats[num_beats > 0])
+        # CRV gap between recordings on the shared axis exceeds any window
+        spacing = relative.max() + window_secs + 1
+        axis = recording * spacing + relative
+        counts = (np.searchsorted(axis, axis + window_secs, side='right') -
+                  np.arange(len(axis)))
+        has_beats = num_beats > 0
+        hr_bpm[has_beats] = (np.maximum.reduceat(counts, starts[has_beats]) /
+                             (window_secs / 60))
+        return(hr_bpm)
@@ -0,0 +1,189 @@
+"""
+Validation of parsed ECG columns, with a cheap pre-parse sniff
+
+sniff_csv reads only the first block of a file and rejects files that
+are obviously not (time, voltage) .csv data (binary content, too few
+columns, no numeric rows) before anything is parsed. validate_columns
+runs right after parsing: one vectorized pass counts NaN cells, finds
+timestamps that do not increase and estimates the sampling rate, then
+either rejects the recording or repairs it (drops bad timestamps,
+interpolates NaN voltages).
+
+Failures raise ImportError, like any other .csv that cannot be imported.
+"""
+import numpy as np
+
+ON_INVALID = ('reject', 'repair')
+# CRV bytes read by sniff_csv (a few hundred rows)
+SNIFF_BYTES = 2 ** 14
+# CRV repair gives up when more than this fraction of rows is bad
+DEFAULT_MAX_BAD_FRACTION = 0.05
+# CRV plausible ECG sampling rates (Hz); ms timestamps land far below
+DEFAULT_FS_RANGE = (10.0, 20000.0)
+# CRV sample spacings the sampling rate is estimated from
+FS_SAMPLE_SPACINGS = 2 ** 16
+
+
+def sniff_csv(target_csv_path, lead_columns=(1,), sniff_bytes=SNIFF_BYTES):
+    """
+    Rejects obviously malformed .csv files from their first block
+
+    :param target_csv_path: path for .csv data
+    :param lead_columns: tuple of voltage column indexes the parse will use
+    :param sniff_bytes: bytes read from the start of the file
+    :raises ImportError: binary data, too few columns or no numeric rows
+    """
+    with open(target_csv_path, 'rb') as csv_file:
+        block = csv_file.read(sniff_bytes)
+    if(b'\0' in block):
+        raise ImportError(target_csv_path + ' is binary, not a csv')
+    try:
+        text = block.decode('utf-8')
+    except UnicodeDecodeError:
+        raise ImportError(target_csv_path + ' is not utf-8 text')
+    lines = [line for line in text.split('\n') if line.strip()]
+    if(len(block) == sniff_bytes and len(lines) > 1):
+        # CRV last line may be cut off by the block boundary
+        lines = lines[:-1]
+    if(len(lines) == 0):
+        raise ImportError(target_csv_path + ' is empty')
+    num_columns = max(lead_columns) + 1
+    numeric = 0
+    for line in lines:
+        fields = line.split(',')
+        if(len(fields) < num_columns):
+            raise ImportError('%s has %d columns, expected %d' %
+                              (target_csv_path, len(fields), num_columns))
+        try:
+            float(fields[0])
+            numeric += 1
+        except ValueError:
+            pass
+    # CRV a header line is fine, mostly text is not
+    if(numeric * 2 < len(lines)):
+        raise ImportError(target_csv_path + ' has no numeric timestamps')
+
+
+def estimate_fs(timestamps):
+    """
+    :param timestamps: numpy array of increasing timestamps (seconds)
+    :returns fs: sampling rate (Hz) from the median of up to
+                 FS_SAMPLE_SPACINGS sample spacings spread over the
+                 recording, or nan with fewer than two samples
+    """
+    if(len(timestamps) < 2):
+        return(float('nan'))
+    starts = np.unique(np.linspace(0, len(timestamps) - 2,
+                                   FS_SAMPLE_SPACINGS).astype(np.int64))
+    spacing = float(np.median(timestamps[starts + 1] - timestamps[starts]))
+    return(1.0 / spacing if spacing > 0 else float('nan'))
+
+
+def validate_columns(timestamps, voltages, on_invalid='reject',
+                     max_bad_fraction=DEFAULT_MAX_BAD_FRACTION,
+                     fs_range=DEFAULT_FS_RANGE, source=''):
+    """
+    Checks (and optionally repairs) parsed columns in one pass
+
+    A row is bad when its timestamp is NaN or not above every earlier
+    timestamp; bad rows are dropped when repairing. NaN voltages on the
+    remaining rows are linearly interpolated from their neighbours (per
+    lead). Clean columns are returned as they are (no copy).
+
+    :param timestamps: numpy array of timestamps (seconds)
+    :param voltages: numpy array of voltages ((n, leads) for several)
+    :param on_invalid: 'reject' raises on any bad cell, 'repair' fixes
+                       up to max_bad_fraction of the rows
+    :param max_bad_fraction: largest fraction of bad rows plus rows with a
+                             NaN voltage that is repaired
+    :param fs_range: (low, high) plausible sampling rate (Hz), or None to
+                     skip the sampling rate check
+    :param source: name used in error messages (e.g. the .csv path)
+    :returns (timestamps, voltages, report): validated columns and a dict
+             with rows, nan_timestamps, nan_voltages, non_increasing, fs
+             and repaired
+    :raises ImportError: the columns are invalid and cannot be repaired
+    :raises ValueError: unknown on_invalid
+    """
+    if(on_invalid not in ON_INVALID):
+        raise ValueError('on_invalid must be one of ' + str(ON_INVALID))
+    # CRV asanyarray keeps cache memmaps zero-copy
+    timestamps = np.asanyarray(timestamps)
+    voltages = np.asanyarray(voltages)
+    nan_voltages = np.isnan(voltages)
+    if(voltages.ndim == 2):
+        nan_rows = nan_voltages.any(axis=1)
+    else:
+        nan_rows = nan_voltages
+    report = {'rows': len(timestamps),
+              'nan_timestamps': 0,
+              'nan_voltages': int(nan_voltages.sum()),
+              'non_increasing': 0,
+              'fs': float('nan'),
+              'repaired': False}
+    # CRV any comparison with NaN is False, so this also catches NaN
+    dirty = bool(report['nan_voltages'] > 0 or
+                 np.isnan(timestamps[:1]).any() or
+                 not np.all(timestamps[1:] > timestamps[:-1]))
+    if(dirty):
+        # CRV only dirty data pays for the running max
+        nan_timestamps = np.isnan(timestamps)
+        running_max = np.fmax.accumulate(timestamps)
+        increasing = np.empty(len(timestamps), dtype=bool)
+        increasing[:1] = ~nan_timestamps[:1]
+        increasing[1:] = timestamps[1:] > running_max[:-1]
+        bad_rows = ~increasing
+        report['nan_timestamps'] = int(nan_timestamps.sum())
+        report['non_increasing'] = int(bad_rows.sum() -
+                                       report['nan_timestamps'])
+    if(dirty and on_invalid == 'reject'):
+        raise ImportError('%s is invalid: %d NaN timestamps, %d NaN '
+                          'voltages, %d non-increasing timestamps' %
+                          (source, report['nan_timestamps'],
+                           report['nan_voltages'],
+                           report['non_increasing']))
+    if(dirty):
+        num_bad = int((bad_rows | nan_rows).sum())
+        if(num_bad > max_bad_fraction * len(timestamps)):
+            raise ImportError('%s is invalid: %d of %d rows are bad' %
+                              (source, num_bad, len(timestamps)))
+        timestamps = timestamps[increasing]
+        voltages = voltages[increasing]
+        voltages = interpolate_nan(timestamps, voltages)
+        report['repaired'] = True
+    report['fs'] = estimate_fs(timestamps)
+    if(fs_range is not None):
+        check_fs(report['fs'], fs_range, source)
+    return(timestamps, voltages, report)
+
+
+def check_fs(fs, fs_range=DEFAULT_FS_RANGE, source=''):
+    """
+    :param fs: estimated sampling rate (Hz)
+    :param fs_range: (low, high) plausible sampling rate (Hz)
+    :param source: name used in error messages (e.g. the .csv path)
+    :raises ImportError: fs is nan or outside fs_range
+    """
+    if(not fs_range[0] <= fs <= fs_range[1]):
+        raise ImportError('%s is invalid: sampling rate %s Hz is outside '
+                          '%s' % (source, fs, fs_range))
+
+
+def interpolate_nan(timestamps, voltages):
+    """
+    :param timestamps: numpy array of increasing timestamps
+    :param voltages: numpy array of voltages ((n, leads) for several)
+    :returns voltages: copy with NaN cells linearly interpolated (the
+                       nearest valid value past either end)
+    :raises ImportError: a lead has no valid voltage
+    """
+    voltages = np.array(voltages, dtype=np.float64)
+    leads = voltages.reshape(len(voltages), -1)
+    for lead in leads.T:
+        missing = np.isnan(lead)
+        if(missing.all()):
+            raise ImportError('a lead has no valid voltage')
+        if(missing.any()):
+            lead[missing] = np.interp(timestamps[missing],
+                                      timestamps[~missing], lead[~missing])
+    return(voltages)
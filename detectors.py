@@ -0,0 +1,266 @@
+"""
+Registry of interchangeable beat-detection engines
+
+Every engine has the interface detector(y, thres, fs) -> indexes: y is the
+(shifted) voltages, thres a threshold relative to [min(y), max(y)] like
+peak_detection.indexes, fs the sampling rate (Hz). HeartRateMonitor looks
+engines up by name (peak_detector=...), so a new algorithm only needs a
+register_detector call.
+
+benchmark_detectors times the available engines on a signal and scores
+them against a reference; select_detector picks the fastest one within an
+accuracy tolerance, and peak_detector='auto' does so once per signal
+length (rounded to a power of two) and reuses the choice.
+"""
+import timeit
+import numpy as np
+from optional_imports import is_available, optional_import
+from peak_detection import indexes, suppress_close_peaks
+
+# CRV name -> (detector, optional module it needs or None)
+DETECTORS = {}
+# CRV beats further apart than this do not match (seconds)
+DEFAULT_MATCH_SECS = 0.05
+# CRV largest 1 - F1 score auto-selection accepts
+DEFAULT_MAX_ERROR = 0.01
+# CRV Pan-Tompkins: QRS band (Hz), integration window and refractory (s)
+PAN_TOMPKINS_BAND = (5.0, 15.0)
+PAN_TOMPKINS_WINDOW_SECS = 0.15
+PAN_TOMPKINS_REFRACTORY_SECS = 0.2
+# CRV (log2 length, max_error, thres) -> detector chosen by auto_detector
+_auto_choices = {}
+
+
+def register_detector(name, detector, requires=None):
+    """
+    Adds (or replaces) a detection engine
+
+    :param name: key used as HeartRateMonitor(peak_detector=name)
+    :param detector: function (y, thres, fs) -> numpy array of indexes
+    :param requires: optional module the engine imports (e.g. 'scipy.signal')
+    """
+    DETECTORS[name] = (detector, requires)
+    _auto_choices.clear()
+
+
+def available_detectors():
+    """
+    :returns names: sorted names of the engines whose dependencies import
+    """
+    return(sorted(name for name, (detector, requires) in DETECTORS.items()
+                  if requires is None or is_available(requires)))
+
+
+def get_detector(name):
+    """
+    :param name: key of DETECTORS
+    :returns detector: function (y, thres, fs) -> numpy array of indexes
+    :raises ValueError: unknown name
+    :raises ImportError: the engine's optional dependency is missing
+    """
+    if(name not in DETECTORS):
+        raise ValueError('peak_detector must be one of ' +
+                         str(sorted(DETECTORS)) + " or 'auto'")
+    detector, requires = DETECTORS[name]
+    if(requires is not None):
+        optional_import(requires)
+    return(detector)
+
+
+def absolute_threshold(y, thres):
+    """
+    :returns thres: thres relative to [min(y), max(y)] as an absolute value
+    """
+    low = y.min()
+    return(thres * (y.max() - low) + low)
+
+
+def numpy_detector(y, thres, fs=None):
+    """
+    peak_detection.indexes (pure NumPy, same peaks as peakutils)
+    """
+    return(indexes(y, thres))
+
+
+def peakutils_detector(y, thres, fs=None):
+    """
+    peakutils.indexes (the original detector)
+    """
+    return(optional_import('peakutils').indexes(y, thres=thres))
+
+
+def scipy_detector(y, thres, fs=None):
+    """
+    scipy.signal.find_peaks above the threshold (same peaks as indexes:
+    flat tops resolve to their middle sample, rounded down)
+    """
+    signal = optional_import('scipy.signal', 'scipy')
+    y = np.asarray(y)
+    if(len(y) < 3):
+        return(np.array([], dtype=np.int64))
+    # CRV find_peaks height is inclusive, indexes needs y > thres
+    height = np.nextafter(absolute_threshold(y, thres), np.inf)
+    return(signal.find_peaks(y, height=height)[0])
+
+
+def pan_tompkins_detector(y, thres=None, fs=None):
+    """
+    Pan-Tompkins-style QRS detection
+
+    Bandpass (5-15 Hz moving-average filter), derivative, squaring and a
+    150 ms moving-window integration; integrated peaks a refractory period
+    apart that clear noise + 0.25 * (signal - noise) are QRS complexes,
+    each located at the highest sample of y in the integration window
+    before it. The threshold comes from the integrated signal, so thres
+    is ignored.
+
+    :param y: numpy array of voltages
+    :param thres: unused (kept for the common interface)
+    :param fs: sampling rate (Hz)
+    :returns indexes: numpy array of R peak indexes
+    :raises ValueError: fs is missing
+    """
+    from preprocessing import (bandpass_terms, filter_moving_averages,
+                               moving_average, odd_window)
+    if(fs is None):
+        raise ValueError('pan_tompkins needs the sampling rate fs')
+    y = np.asarray(y, dtype=np.float64)
+    window = odd_window(fs, PAN_TOMPKINS_WINDOW_SECS)
+    if(len(y) < max(3, window)):
+        return(np.array([], dtype=np.int64))
+    filtered = filter_moving_averages(y, bandpass_terms(
+        fs, *PAN_TOMPKINS_BAND))
+    integrated = moving_average(np.gradient(filtered) ** 2, window)
+    candidates = indexes(integrated, 0.0, thres_abs=True)
+    if(len(candidates) == 0):
+        return(candidates)
+    heights = integrated[candidates]
+    # CRV QRS peaks dominate the top, noise/T waves the middle
+    signal_level, noise_level = np.percentile(heights, [95, 50])
+    peaks = candidates[heights > noise_level +
+                       0.25 * (signal_level - noise_level)]
+    peaks = suppress_close_peaks(integrated, peaks, max(1, int(
+        PAN_TOMPKINS_REFRACTORY_SECS * fs)))
+    # CRV integration lags the QRS: search the raw window behind each peak
+    offsets = np.arange(-window + 1, window // 2 + 1)
+    searched = np.clip(peaks[:, np.newaxis] + offsets, 0, len(y) - 1)
+    best = np.argmax(y[searched], axis=1)
+    return(np.unique(searched[np.arange(len(peaks)), best]))
+
+
+register_detector('numpy', numpy_detector)
+register_detector('peakutils', peakutils_detector, 'peakutils')
+register_detector('scipy', scipy_detector, 'scipy.signal')
+register_detector('pan_tompkins', pan_tompkins_detector)
+
+
+def detect_beats(y, name, fs, thres=None):
+    """
+    HeartRateMonitor's detection rule with any engine
+
+    Without thres, the single-lead rule: +1 shift when negative, median
+    threshold, retry at 0.9, final threshold check. With thres (the
+    preprocess rule), y is searched as it is with thres, then 0.9.
+
+    :param y: numpy array of voltages (unshifted) or filtered signal
+    :param name: key of DETECTORS
+    :param fs: sampling rate (Hz)
+    :param thres: threshold relative to [min(y), max(y)], or None
+    :returns indexes: numpy array of beat indexes
+    """
+    detector = get_detector(name)
+    y = np.asarray(y)
+    threshold = thres
+    if(thres is None):
+        if(y.min() < 0):
+            y = y + 1
+        threshold = float(np.median(y))
+    found = detector(y, threshold, fs)
+    if(len(found) == 0):
+        found = detector(y, 0.9, fs)
+    if(thres is None):
+        found = found[y[found] > threshold]
+    return(found)
+
+
+def match_error(found, reference, tolerance):
+    """
+    :param found: sorted numpy array of detected beat indexes
+    :param reference: sorted numpy array of true beat indexes
+    :param tolerance: largest distance (samples) of a match
+    :returns error: 1 - F1 score (0: every beat found, nothing extra)
+    """
+    if(len(found) == 0 or len(reference) == 0):
+        return(0.0 if len(found) == len(reference) else 1.0)
+    # CRV each found beat matches the nearest reference beat at most once
+    after = np.clip(np.searchsorted(reference, found), 1, len(reference) - 1)
+    before = after - 1
+    nearest = np.where(np.abs(reference[after] - found) <
+                       np.abs(reference[before] - found), after, before)
+    close = np.abs(reference[nearest] - found) <= tolerance
+    matched = len(np.unique(nearest[close]))
+    return(1.0 - 2.0 * matched / (len(found) + len(reference)))
+
+
+def benchmark_detectors(y, fs, reference='numpy', names=None, repeat=3,
+                        match_secs=DEFAULT_MATCH_SECS, thres=None):
+    """
+    Times every engine on a signal and scores it against a reference
+
+    :param y: numpy array of voltages (a representative recording)
+    :param fs: sampling rate (Hz)
+    :param reference: name of the reference engine, or a numpy array of
+                      the true beat indexes
+    :param names: engines to run. Default: available_detectors()
+    :param repeat: timed runs per engine (the fastest counts)
+    :param match_secs: largest distance of a matching beat (seconds)
+    :param thres: detect_beats thres (None: the single-lead rule)
+    :returns results: list of dicts with name, secs, num_beats and error
+                      (1 - F1 against the reference), fastest first
+    """
+    if(isinstance(reference, str)):
+        reference = detect_beats(y, reference, fs, thres)
+    tolerance = max(1, int(match_secs * fs))
+    results = []
+    for name in names or available_detectors():
+        found = detect_beats(y, name, fs, thres)
+        secs = min(timeit.repeat(lambda: detect_beats(y, name, fs, thres),
+                                 number=1, repeat=repeat))
+        results.append({'name': name,
+                        'secs': secs,
+                        'num_beats': len(found),
+                        'error': match_error(found, reference, tolerance)})
+    return(sorted(results, key=lambda result: result['secs']))
+
+
+def select_detector(y, fs, max_error=DEFAULT_MAX_ERROR, **kwargs):
+    """
+    :param y: numpy array of voltages (a representative recording)
+    :param fs: sampling rate (Hz)
+    :param max_error: largest accepted 1 - F1 against the reference
+    :param kwargs: passed to benchmark_detectors
+    :returns name: fastest engine within max_error (the reference engine
+                   if none is, 'numpy' for an array reference)
+    """
+    for result in benchmark_detectors(y, fs, **kwargs):
+        if(result['error'] <= max_error):
+            return(result['name'])
+    reference = kwargs.get('reference', 'numpy')
+    return(reference if isinstance(reference, str) else 'numpy')
+
+
+def auto_detector(y, fs, max_error=DEFAULT_MAX_ERROR, thres=None):
+    """
+    select_detector, run once per signal length bucket and remembered
+
+    :param y: numpy array the detection rule starts from (see detect_beats)
+    :param fs: sampling rate (Hz)
+    :param max_error: largest accepted 1 - F1 against 'numpy'
+    :param thres: detect_beats thres (None: the single-lead rule)
+    :returns name: engine chosen for signals of about len(y) samples
+    """
+    bucket = (int(np.log2(max(len(y), 1))), max_error, thres)
+    if(bucket not in _auto_choices):
+        _auto_choices[bucket] = select_detector(y, fs, max_error, repeat=1,
+                                                thres=thres)
+    return(_auto_choices[bucket])
@@ -1,9 +1,13 @@
+import os
 import numpy as np
 import logging
-logging.basicConfig(filename="logs/heart_rate_monitor_logs.txt",
-                    format='%(asctime)s %(message)s',
-                    datefmt='%m/%d/%Y %I:%M:%S %p',
-                    level=logging.DEBUG)
+import instrumentation
+logger = logging.getLogger(__name__)
+instrumentation.configure_logging('logs/heart_rate_monitor_logs.txt',
+                                  __name__)
+
+# CRV peaks on different leads this close together are the same beat
+LEAD_FUSION_SECS = 0.05
 
 
 class HeartRateMonitor:
@@ -11,7 +15,41 @@ class HeartRateMonitor:
     Analyzes ECG data from input .csv file
 
     :param target_csv_path: location of .csv ECG data
+    :param use_cache: reuse parsed data from the csv_cache/ sidecar cache
+    :param peak_detector: name of a detectors.DETECTORS engine ('numpy',
+                          'peakutils', 'scipy', 'pan_tompkins', ...), or
+                          'auto' for the fastest one that agrees with
+                          'numpy' (detectors.auto_detector)
+    :param output_dir: directory the .json results are written to
+    :param output_format: 'json', 'msgpack' or 'npz' (see results_writer)
+    :param preprocess: preprocessing.Preprocessor run ahead of peak
+                       detection (None: detect on the raw voltages)
+    :param result_cache: result_cache.ResultCache to reuse the results of
+                         identical .csv contents and detection parameters
+    :param detect_workers: threads splitting peak detection of the
+                           recording (None: one per CPU). The numpy
+                           detector gives the same beats with any count.
+    :param leads: voltage column indexes of a multi-lead .csv, or 'all'
+                  for every column after the timestamps. Default: None,
+                  a single (time, voltage) lead
+    :param min_leads: leads that must agree on a beat for it to count.
+                      Default: a majority of the leads
+    :param hrv_window_secs: window of the windowed HRV metrics (seconds),
+                            or None for whole-recording metrics only
+    :param on_invalid: 'reject' or 'repair' malformed .csv data (see
+                       csv_validation). Default: 'reject'
+    :param detect_uniform: store uniformly sampled timestamps as a
+                           uniform_grid.UniformTimestamps grid instead of
+                           an array (exact, so results do not change; use
+                           np.asarray(timestamps) for array arithmetic).
+                           Default: False
+    :param lazy: if True, nothing is imported or computed (and no .json is
+                 written) until an attribute is first accessed; each
+                 attribute is computed once, together with the attributes
+                 it depends on. Call build_json() to write the .json.
     :attr timstamps: list of timestamps for every data point imported from .csv
+                     (a UniformTimestamps grid when detect_uniform and
+                     uniformly sampled)
     :attr voltages: list of voltages for every data point imported from .csv
     :attr mean_hr_bpm: mean heart rate (bpm). Default: mean over whole data set
     :attr voltage_extremes: tuple (min_voltage, max_voltage)
@@ -19,20 +57,78 @@ class HeartRateMonitor:
     :attr num_beats: number of beats detected in ECG data
     :attr beats: numpy array of the timestamps when beats occurred
     :attr heart_beat_voltage: array of voltages when beats occurred
+                              ((beats, leads) for a multi-lead .csv)
+    :attr lead_beats: list with the beats timestamps of every lead
+    :attr hrv: dict of heart rate variability metrics (see hrv.hrv_metrics)
+    :attr validation: dict reported by the .csv validation stage
     """
-    def __init__(self, target_csv_path):
+    def __init__(self, target_csv_path, use_cache=True,
+                 peak_detector='numpy', output_dir='output_json_files/',
+                 lazy=False, output_format='json', preprocess=None,
+                 result_cache=None, detect_workers=1, leads=None,
+                 min_leads=None, hrv_window_secs=60.0,
+                 on_invalid='reject', detect_uniform=False):
         self.target_csv_path = target_csv_path
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.use_cache = use_cache
+        self.peak_detector = peak_detector
+        self.preprocess = preprocess
+        self.result_cache = result_cache
+        self.detect_workers = detect_workers
+        self.leads = leads
+        self.min_leads = min_leads
+        self.hrv_window_secs = hrv_window_secs
+        self.on_invalid = on_invalid
+        self.detect_uniform = detect_uniform
+        self.validation = None
+        self.result_cache_hit = False
         self.timestamps = None
         self.voltages = None
-        self.import_data()
-        self.set_voltage_extremes()
-        self.set_duration()
-        self.find_beats()
-        self.calc_mean_hr_bpm()
-        self.build_json()
+        self.__voltage_extremes = None
+        self.__duration = None
+        self.__beats = None
+        self.__beat_index = None
+        self.__lead_beats = None
+        self.__mean_hr_bpm = None
+        self.__hrv = None
+        self.__lod_pyramid = None
+        self.__result_cache_checked = False
+        self.__result_cache_stored = False
+        if(not lazy):
+            if(not self.load_cached_results()):
+                self.import_data()
+                self.set_voltage_extremes()
+                self.set_duration()
+                self.find_beats()
+                self.calc_mean_hr_bpm()
+                self.store_cached_results()
+            self.build_json()
+
+    @property
+    def timestamps(self):
+        if(self.__timestamps is None):
+            self.import_data()
+        return self.__timestamps
+
+    @timestamps.setter
+    def timestamps(self, timestamps):
+        self.__timestamps = timestamps
+
+    @property
+    def voltages(self):
+        if(self.__voltages is None):
+            self.import_data()
+        return self.__voltages
+
+    @voltages.setter
+    def voltages(self, voltages):
+        self.__voltages = voltages
 
     @property
     def voltage_extremes(self):
+        if(self.__voltage_extremes is None and not self.load_cached_results()):
+            self.set_voltage_extremes()
         return self.__voltage_extremes
 
     @voltage_extremes.setter
@@ -41,6 +137,8 @@ class HeartRateMonitor:
 
     @property
     def mean_hr_bpm(self):
+        if(self.__mean_hr_bpm is None and not self.load_cached_results()):
+            self.calc_mean_hr_bpm()
         return self.__mean_hr_bpm
 
     @mean_hr_bpm.setter
@@ -49,6 +147,8 @@ class HeartRateMonitor:
 
     @property
     def duration(self):
+        if(self.__duration is None and not self.load_cached_results()):
+            self.set_duration()
         return self.__duration
 
     @duration.setter
@@ -57,6 +157,8 @@ class HeartRateMonitor:
 
     @property
     def num_beats(self):
+        if(self.__beats is None and not self.load_cached_results()):
+            self.find_beats()
         return self.__num_beats
 
     @num_beats.setter
@@ -65,6 +167,8 @@ class HeartRateMonitor:
 
     @property
     def beats(self):
+        if(self.__beats is None and not self.load_cached_results()):
+            self.find_beats()
         return self.__beats
 
     @beats.setter
@@ -73,24 +177,144 @@ class HeartRateMonitor:
 
     @property
     def heart_beat_voltages(self):
+        if(self.__beats is None and not self.load_cached_results()):
+            self.find_beats()
         return self.__heart_beat_voltages
 
     @heart_beat_voltages.setter
     def heart_beat_voltages(self, heart_beat_voltages):
         self.__heart_beat_voltages = find_beats()
 
+    @property
+    def lead_beats(self):
+        if(self.__lead_beats is None and not self.load_cached_results()):
+            self.find_beats()
+        return self.__lead_beats
+
+    @property
+    def hrv(self):
+        if(self.__hrv is None):
+            self.calc_hrv()
+        return self.__hrv
+
+    @property
+    def num_leads(self):
+        # CRV no leads selected is a single lead; skip importing the data
+        if(self.leads is None):
+            return 1
+        if(self.__lead_beats is not None or self.load_cached_results()):
+            return len(self.__lead_beats)
+        if(np.ndim(self.voltages) == 1):
+            return 1
+        return self.voltages.shape[1]
+
+    def detection_params(self):
+        """
+        :returns params: dict of the parameters that change the results
+        """
+        preprocess = None
+        if(self.preprocess is not None):
+            preprocess = dict(sorted(vars(self.preprocess).items()))
+        leads = self.leads
+        if(leads is not None and leads != 'all'):
+            leads = [int(column) for column in leads]
+        return({'peak_detector': self.peak_detector,
+                'preprocess': preprocess,
+                'leads': leads,
+                'min_leads': self.min_leads,
+                'on_invalid': self.on_invalid})
+
+    def result_cache_key(self):
+        """
+        :returns key: result_cache key of the .csv contents and parameters
+        """
+        return(self.result_cache.key(
+            self.result_cache.csv_digest(self.target_csv_path),
+            self.detection_params()))
+
+    def load_cached_results(self):
+        """
+        Fills every result from result_cache (tried once per instance)
+
+        :returns hit: True if the results were loaded from the cache
+        """
+        if(self.result_cache is None or self.__result_cache_checked):
+            return(False)
+        self.__result_cache_checked = True
+        results = self.result_cache.load(self.result_cache_key())
+        if(results is None):
+            return(False)
+        if(self.leads is not None and 'lead_num_beats' not in results):
+            # CRV entry written without the per-lead beats: recompute
+            return(False)
+        self.__beats = results['beats']
+        self.__heart_beat_voltages = results['heart_beat_voltages']
+        self.__num_beats = results['num_beats']
+        self.__mean_hr_bpm = results['mean_hr_bpm']
+        self.__voltage_extremes = results['voltage_extremes']
+        self.__duration = results['duration']
+        if('lead_num_beats' in results):
+            self.__lead_beats = np.split(
+                results['lead_beats'],
+                np.cumsum(results['lead_num_beats'])[:-1])
+        else:
+            self.__lead_beats = [self.__beats]
+        self.result_cache_hit = True
+        self.__result_cache_stored = True
+        logger.info('%s results loaded from result cache',
+                    self.target_csv_path)
+        return(True)
+
+    def store_cached_results(self):
+        """
+        Writes the results to result_cache (once per instance)
+        """
+        if(self.result_cache is None or self.__result_cache_stored):
+            return
+        self.__result_cache_stored = True
+        results = {'beats': self.beats,
+                   'heart_beat_voltages': self.heart_beat_voltages,
+                   'num_beats': self.num_beats,
+                   # CRV whole recording, even after a windowed
+                   # calc_mean_hr_bpm: the key only covers the contents
+                   'mean_hr_bpm': self.range_mean_hr_bpm(),
+                   'voltage_extremes': self.voltage_extremes,
+                   'duration': self.duration}
+        if(self.leads is not None):
+            results['lead_beats'] = np.concatenate(self.lead_beats)
+            results['lead_num_beats'] = np.array(
+                [len(beats) for beats in self.lead_beats])
+        try:
+            self.result_cache.store(self.result_cache_key(), results)
+        except OSError:
+            logger.exception('result cache store failed')
+
     def import_data(self):
         """
         Utilizes the import_csv module to import .csv data
 
-        :sets timestamps: list of all timestamps in .csv data
+        :sets timestamps: list of all timestamps in .csv data (a
+                          UniformTimestamps grid if uniformly sampled)
         :sets voltages: list of all voltages in .csv data
         """
-        from import_csv import ImportCSV
-        imported_data = ImportCSV(self.target_csv_path)
-        self.timestamps = imported_data.timestamps
-        self.voltages = imported_data.voltages
-        logging.info(self.target_csv_path + ' imported')
+        from import_csv import ImportCSV, SINGLE_LEAD
+        from uniform_grid import detect_uniform
+        with instrumentation.stage('import') as timer:
+            imported_data = ImportCSV(self.target_csv_path,
+                                      use_cache=self.use_cache,
+                                      lead_columns=self.leads or SINGLE_LEAD,
+                                      on_invalid=self.on_invalid)
+            self.timestamps = imported_data.timestamps
+            self.voltages = imported_data.voltages
+            self.validation = imported_data.validation
+            if(self.detect_uniform):
+                grid = detect_uniform(self.timestamps)
+                if(grid is not None):
+                    logger.info('uniform sampling: dt %s', grid.dt)
+                    self.timestamps = grid
+            timer.samples = len(self.voltages)
+            timer.nbytes = self.voltages.nbytes + self.timestamps.nbytes
+        logger.info('%s imported', self.target_csv_path)
 
     def set_voltage_extremes(self):
         """
@@ -98,11 +322,17 @@ class HeartRateMonitor:
 
         :sets voltage_extremes: tuple (min_voltage, max_voltage)
         """
-        # CRV init max and min voltage tuple
-        min_voltage = min(self.voltages)
-        max_voltage = max(self.voltages)
-        self.__voltage_extremes = (min_voltage, max_voltage)
-        logging.info('voltage_extremes set: ' + str(self.__voltage_extremes))
+        with instrumentation.stage('extremes', len(self.voltages)):
+            if(np.ndim(self.voltages) == 2):
+                # CRV extremes over every lead
+                min_voltage = float(np.min(self.voltages))
+                max_voltage = float(np.max(self.voltages))
+            else:
+                # CRV init max and min voltage tuple
+                min_voltage = min(self.voltages)
+                max_voltage = max(self.voltages)
+            self.__voltage_extremes = (min_voltage, max_voltage)
+        logger.info('voltage_extremes set: %s', self.__voltage_extremes)
 
     def set_duration(self):
         """
@@ -110,13 +340,16 @@ class HeartRateMonitor:
 
         :sets duration: length (time) of data read
         """
-        # CRV init the max and min timestamp
-        min_ts = min(self.timestamps)
-        max_ts = max(self.timestamps)
-        # CRV - calculating the diff here just incase there is an offset error
-        # (earliest ts in data set NOT 0)
-        self.__duration = max_ts - min_ts
-        logging.info('duration set: ' + str(self.__duration))
+        from uniform_grid import as_timestamps
+        with instrumentation.stage('duration', len(self.timestamps)):
+            # CRV init the max and min timestamp (O(1) on a uniform grid)
+            timestamps = as_timestamps(self.timestamps)
+            min_ts = timestamps.min()
+            max_ts = timestamps.max()
+            # CRV - calculating the diff here just incase there is an offset
+            # error (earliest ts in data set NOT 0)
+            self.__duration = max_ts - min_ts
+        logger.info('duration set: %s', self.__duration)
 
     def find_beats(self):
         """
@@ -124,56 +357,190 @@ class HeartRateMonitor:
 
         :sets num_beats: number of detected beats in ECG data
         :sets beats: numpy array of timestamps when beats occurred
+        :sets heart_beat_voltages: numpy array of voltages at those beats
         """
-        raw_voltages = np.array(self.voltages)
-        if(self.voltage_extremes[0] < 0):
-            logging.info('vertically shifting voltage data for peak analysis')
-            peak_detect_data = np.array([voltage + 1 for
-                                         voltage in raw_voltages])
+        with instrumentation.stage('find_beats', len(self.voltages)):
+            self.extract_beats()
+        logger.info('num_beats: %s', self.__num_beats)
+        if(self.__num_beats == 0):
+            logger.warning('NO BEATS DETECTED')
+
+    def extract_beats(self):
+        """
+        Worker function of find_beats (shift, detect_peaks, threshold check)
+        """
+        if(np.ndim(self.voltages) == 2):
+            self.extract_lead_beats()
+            return
+        from uniform_grid import as_timestamps
+        # CRV asarray/+1 keep this in numpy: one copy only when shifting
+        raw_voltages = np.asarray(self.voltages)
+        if(self.preprocess is not None):
+            indexes = self.detect_preprocessed_peaks()
         else:
-            peak_detect_data = raw_voltages
-        threshold = np.median(peak_detect_data)
-        try:
-            indexes = self.detect_peaks(peak_detect_data, threshold)
-        except TypeError:
-            print('data expects numpy array. threshold expects float')
-        self.__beats = []
-        self.__heart_beat_voltages = []
-        for index in indexes:
+            fs = self.sampling_rate()
+            # CRV 'auto' scores the whole rule, shift included, on raw data
+            peak_detector = self.select_peak_detector(raw_voltages, fs)
+            if(self.voltage_extremes[0] < 0):
+                logger.info('vertically shifting voltage data for peak '
+                            'analysis')
+                peak_detect_data = raw_voltages + 1
+            else:
+                peak_detect_data = raw_voltages
+            threshold = float(np.median(peak_detect_data))
+            try:
+                indexes = self.detect_peaks(peak_detect_data, threshold, fs,
+                                            peak_detector)
+            except TypeError:
+                print('data expects numpy array. threshold expects float')
+                raise
             # CRV do one one threshold check
-            if(peak_detect_data[index] > threshold):
-                self.__beats.append(self.timestamps[index])
-                self.__heart_beat_voltages.append(self.voltages[index])
-        self.__num_beats = len(self.beats)
-        logging.info('num_beats: ' + str(self.__num_beats))
-        if(self.__num_beats == 0):
-            logging.warning('NO BEATS DETECTED')
-        # CRV convert list to numpy array
-        self.__beats = np.array(self.__beats)
-        logging.info('beats numpy array created')
+            indexes = indexes[peak_detect_data[indexes] > threshold]
+        self.__beats = as_timestamps(self.timestamps)[indexes]
+        self.__heart_beat_voltages = raw_voltages[indexes]
+        self.__num_beats = len(self.__beats)
+        self.__lead_beats = [self.__beats]
+        self.build_beat_index()
+
+    def extract_lead_beats(self):
+        """
+        Worker function of find_beats for a multi-lead .csv
+
+        Every lead gets the single-lead rule (+1 shift when negative,
+        median threshold, 0.9 retry, threshold check), one lead at a time so
+        at most one shifted lead is held. The beats are the peaks that at
+        least min_leads leads agree on (peak_detection.fuse_column_peaks).
 
-    def detect_peaks(self, data, threshold):
+        :raises ValueError: preprocess or a peak_detector other than numpy
+        """
+        from peak_detection import indexes, fuse_column_peaks
+        from uniform_grid import as_timestamps
+        if(self.preprocess is not None or self.peak_detector != 'numpy'):
+            raise ValueError('multi-lead detection needs peak_detector='
+                             'numpy and no preprocess')
+        timestamps = as_timestamps(self.timestamps)
+        voltages = np.asarray(self.voltages)
+        num_leads = voltages.shape[1]
+        lead_peaks = []
+        with instrumentation.stage('detect_peaks', voltages.size):
+            for lead in range(num_leads):
+                # CRV like extract_beats: one lead copied only to shift it
+                lead_data = voltages[:, lead]
+                if(lead_data.min() < 0):
+                    lead_data = lead_data + 1
+                threshold = float(np.median(lead_data))
+                peaks = indexes(lead_data, threshold)
+                if(len(peaks) == 0):
+                    logger.info('0 peaks found on lead %s w/ thres=median. '
+                                'Retry thres=0.9', lead)
+                    peaks = indexes(lead_data, 0.9)
+                lead_peaks.append(peaks[lead_data[peaks] > threshold])
+        leads = np.repeat(np.arange(num_leads),
+                          [len(peaks) for peaks in lead_peaks])
+        peaks = np.concatenate(lead_peaks)
+        self.__lead_beats = [timestamps[peaks] for peaks in lead_peaks]
+        sample_secs = (timestamps[-1] - timestamps[0]) / (len(timestamps) - 1)
+        min_leads = self.min_leads or num_leads // 2 + 1
+        fused = fuse_column_peaks(leads, peaks, min_leads,
+                                  int(LEAD_FUSION_SECS / sample_secs))
+        self.__beats = timestamps[fused]
+        self.__heart_beat_voltages = voltages[fused]
+        self.__num_beats = len(self.__beats)
+        self.build_beat_index()
+
+    def detect_preprocessed_peaks(self):
+        """
+        Detects peaks on the output of the preprocess stage
+
+        Peaks are found on the (optionally downsampled) filtered signal
+        with preprocess.thres, refined to full-rate indexes and thinned to
+        one per refractory period.
+
+        :returns indexes: numpy array of peak indexes into the voltages
+        """
+        from peak_detection import suppress_close_peaks
+        from uniform_grid import as_timestamps
+        with instrumentation.stage('preprocess', len(self.voltages)):
+            filtered = self.preprocess.apply(as_timestamps(self.timestamps),
+                                             np.asarray(self.voltages))
+        logger.info('voltages preprocessed')
+        fs = (self.preprocess.sampling_rate(as_timestamps(self.timestamps)) /
+              self.preprocess.downsample_factor)
+        indexes = self.detect_peaks(self.preprocess.downsample(filtered),
+                                    float(self.preprocess.thres), fs)
+        indexes = self.preprocess.refine_peaks(filtered, indexes)
+        min_dist = self.preprocess.refractory_samples(
+            as_timestamps(self.timestamps))
+        return(suppress_close_peaks(filtered, indexes, min_dist))
+
+    def select_peak_detector(self, data, fs, thres=None):
+        """
+        :param data: numpy array the detection rule starts from
+        :param fs: sampling rate of data (Hz)
+        :param thres: detectors.detect_beats thres (None: the single-lead
+                      shift and median rule)
+        :returns name: peak_detector, or for 'auto' the engine
+                       detectors.auto_detector picks for this rule
+        """
+        if(self.peak_detector != 'auto'):
+            return(self.peak_detector)
+        import detectors
+        peak_detector = detectors.auto_detector(data, fs, thres=thres)
+        logger.info('auto peak_detector: %s', peak_detector)
+        return(peak_detector)
+
+    def detect_peaks(self, data, threshold, fs=None, peak_detector=None):
         """
         Identifies peaks in a data set
 
         :param data: numpy array to find peaks in
         :param threshold: threshold to attempt first peak detection with
+        :param fs: sampling rate of data (Hz). Default: sampling_rate()
+        :param peak_detector: engine to use. Default:
+                              select_peak_detector(data, fs, threshold)
         :raises TypeError: invalid param passed to detect_peaks
+        :raises ValueError: unknown peak_detector
         """
-        import peakutils
-        # CRV using peakutils lib for peak detection
-        # http://peakutils.readthedocs.io/en/latest/index.html
+        import detectors
+        if(self.peak_detector != 'auto' and
+           self.peak_detector not in detectors.DETECTORS):
+            logger.error('unknown peak_detector: %s', self.peak_detector)
+            raise ValueError('peak_detector must be one of ' +
+                             str(sorted(detectors.DETECTORS)) + " or 'auto'")
         if(type(data) is np.ndarray and isinstance(threshold, float)):
-            logging.info('setting threshold to: ' + str(threshold))
-            indexes = peakutils.indexes(data, thres=threshold)
-            if(len(indexes) == 0):
-                logging.info('0 peaks found w/ thres=median. Retry thres=0.9')
-                indexes = peakutils.indexes(data, thres=0.9)
+            fs = fs or self.sampling_rate()
+            if(peak_detector is None):
+                peak_detector = self.select_peak_detector(data, fs,
+                                                          threshold)
+            if(peak_detector == 'numpy' and self.detect_workers != 1):
+                from peak_detection import parallel_indexes
+
+                def find_peaks(y, thres, fs):
+                    return(parallel_indexes(y, thres,
+                                            workers=self.detect_workers))
+            else:
+                # CRV peakutils: http://peakutils.readthedocs.io
+                find_peaks = detectors.get_detector(peak_detector)
+            logger.info('setting threshold to: %s', threshold)
+            with instrumentation.stage('detect_peaks', len(data)):
+                indexes = find_peaks(data, threshold, fs)
+                if(len(indexes) == 0):
+                    logger.info('0 peaks found w/ thres=median. '
+                                'Retry thres=0.9')
+                    indexes = find_peaks(data, 0.9, fs)
             return(indexes)
         else:
-            logging.error('invalid param passed to detect_peaks')
+            logger.error('invalid param passed to detect_peaks')
             raise TypeError('data needs numpy array. threshold needs float.')
 
+    def sampling_rate(self):
+        """
+        :returns fs: mean sampling rate (Hz) of the timestamps
+        """
+        from preprocessing import estimate_fs
+        from uniform_grid import as_timestamps
+        return(estimate_fs(as_timestamps(self.timestamps)))
+
     def calc_mean_hr_bpm(self, start_ts=None, end_ts=None):
         """
         Calculates the mean heart rate (BPM) over a specified time range
@@ -182,28 +549,107 @@ class HeartRateMonitor:
         :param end_ts: end range (seconds)
         :sets mean_hr_bpm: mean heart rate (BPM) over specified time range
         """
-        if(start_ts is None or not self.is_valid_ts(start_ts)):
+        with instrumentation.stage('mean_hr', len(self.beats)):
+            self.set_mean_hr_bpm(start_ts, end_ts)
+        logger.info('__mean_hr_bpm: %s', self.__mean_hr_bpm)
+
+    def set_mean_hr_bpm(self, start_ts, end_ts):
+        """
+        Worker function of calc_mean_hr_bpm
+        """
+        self.__mean_hr_bpm = self.range_mean_hr_bpm(start_ts, end_ts)
+
+    def range_mean_hr_bpm(self, start_ts=None, end_ts=None):
+        """
+        :param start_ts: start range (seconds). Default: first sample
+        :param end_ts: end range (seconds). Default: last sample
+        :returns mean_hr_bpm: mean heart rate (BPM) over the time range
+        """
+        # CRV None means the whole data set; only warn about bad values
+        if(start_ts is not None and not self.is_valid_ts(start_ts)):
+            logger.warning('invalid start_ts passed in calc_mean_hr_bpm')
+            start_ts = None
+        if(end_ts is not None and not self.is_valid_ts(end_ts)):
+            logger.warning('invalid end_ts passed in calc_mean_hr_bpm')
+            end_ts = None
+        if(start_ts is None):
             start_ts = self.timestamps[0]
-            logging.warning('invalid start_ts passed in calc_mean_hr_bpm')
-        if(end_ts is None or not self.is_valid_ts(end_ts)):
+        if(end_ts is None):
             end_ts = self.timestamps[-1]
-            logging.warning('invalid end_ts passed in calc_mean_hr_bpm')
-        num_beats_in_range = 0
-        for beat_ts in self.beats:
-            if(start_ts <= beat_ts <= end_ts):
-                num_beats_in_range += 1
+        num_beats_in_range = int(self.count_beats_in_range(start_ts, end_ts))
         try:
             percentage_of_min = self.calc_percentage_of_min(start_ts, end_ts)
         except TypeError:
-            logging.error('start_ts and end_ts must be float or int')
+            logger.error('start_ts and end_ts must be float or int')
             print('start_ts and end_ts must be float or int')
+            raise
         try:
-            self.__mean_hr_bpm = self.calc_bpm(num_beats_in_range,
-                                               percentage_of_min)
+            return(self.calc_bpm(num_beats_in_range, percentage_of_min))
         except TypeError:
-            logging.error('beats and percentage_of_min must be float or int')
+            logger.error('beats and percentage_of_min must be float or int')
             print('beats and percentage_of_min must be float or int')
-        logging.info('__mean_hr_bpm: ' + str(self.__mean_hr_bpm))
+            raise
+
+    def calc_hrv(self):
+        """
+        Calculates the heart rate variability metrics from the beats
+
+        :sets hrv: dict of RR intervals, instantaneous heart rate, SDNN,
+                   RMSSD and pNN50, whole-recording and per window
+        """
+        from hrv import hrv_metrics
+        beats = self.beats
+        with instrumentation.stage('hrv', len(beats)):
+            self.__hrv = hrv_metrics(beats, self.hrv_window_secs)
+        logger.info('hrv: sdnn_ms %s, rmssd_ms %s', self.__hrv['sdnn_ms'],
+                    self.__hrv['rmssd_ms'])
+
+    def build_beat_index(self):
+        """
+        Builds the sorted beat timestamps used for windowed queries
+
+        :sets beat_index: sorted numpy array of beat timestamps
+        """
+        # CRV beats are already sorted unless the timestamps are not
+        if(np.all(np.diff(self.__beats) >= 0)):
+            self.__beat_index = self.__beats
+        else:
+            self.__beat_index = np.sort(self.__beats)
+
+    def count_beats_in_range(self, start_ts, end_ts):
+        """
+        Counts beats in [start_ts, end_ts] with a binary search (O(log n))
+
+        :param start_ts: start range (seconds), float or numpy array
+        :param end_ts: end range (seconds), float or numpy array
+        :returns num_beats: number of beats in each range
+        """
+        if(self.__beat_index is None):
+            self.find_beats()
+        first = np.searchsorted(self.__beat_index, start_ts, side='left')
+        last = np.searchsorted(self.__beat_index, end_ts, side='right')
+        return(last - first)
+
+    def calc_hr_series(self, start_ts, end_ts):
+        """
+        Calculates the mean heart rate (BPM) of many time ranges in one call
+
+        Ranges are not clipped to the ECG data. Empty ranges give nan.
+
+        :param start_ts: numpy array of range starts (seconds)
+        :param end_ts: numpy array of range ends (seconds)
+        :returns hr_bpm: numpy array of mean heart rates (BPM), one per range
+        :raises ValueError: start_ts and end_ts differ in shape
+        """
+        start_ts = np.asarray(start_ts, dtype=np.float64)
+        end_ts = np.asarray(end_ts, dtype=np.float64)
+        if(start_ts.shape != end_ts.shape):
+            logger.error('start_ts and end_ts differ in calc_hr_series')
+            raise ValueError('start_ts and end_ts must have the same shape')
+        num_beats = self.count_beats_in_range(start_ts, end_ts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hr_bpm = num_beats / ((end_ts - start_ts) / 60)
+        return(np.where(end_ts > start_ts, hr_bpm, np.nan))
 
     def is_valid_ts(self, timestamp):
         """
@@ -219,6 +665,25 @@ class HeartRateMonitor:
         else:
             return(False)
 
+    def sample_range(self, start_ts=None, end_ts=None):
+        """
+        Maps a time range to sample indexes (O(1) on a uniform grid, a
+        binary search otherwise)
+
+        :param start_ts: start range (seconds). Default: first sample
+        :param end_ts: end range (seconds). Default: last sample
+        :returns (start, stop): slice of the samples in [start_ts, end_ts]
+        """
+        from uniform_grid import as_timestamps
+        timestamps = as_timestamps(self.timestamps)
+        start = 0
+        stop = len(timestamps)
+        if(start_ts is not None):
+            start = int(np.searchsorted(timestamps, start_ts, side='left'))
+        if(end_ts is not None):
+            stop = int(np.searchsorted(timestamps, end_ts, side='right'))
+        return(start, max(start, stop))
+
     def calc_percentage_of_min(self, start_ts, end_ts):
         """
         Determines percentage of minute for given time range
@@ -232,7 +697,7 @@ class HeartRateMonitor:
            (isinstance(end_ts, int) or isinstance(end_ts, float))):
             return((end_ts - start_ts)/60)
         else:
-            logging.warning('invalid ts passed in calc_percentage_of_min')
+            logger.warning('invalid ts passed in calc_percentage_of_min')
             raise TypeError('start_ts and end_ts must be float or int')
 
     def calc_bpm(self, beats, percentage_of_min):
@@ -249,51 +714,72 @@ class HeartRateMonitor:
            isinstance(percentage_of_min, float))):
             return(beats/percentage_of_min)
         else:
-            logging.warning('invalid beats or perc. of min passed in calc_bpm')
+            logger.warning('invalid beats or perc. of min passed in calc_bpm')
             raise TypeError('beats and percentage_of_min must be float or int')
 
-    def build_json(self):
+    def build_results(self):
         """
-        Creates and outputs .json file with ECG analysis
-        """
-        import json
-        import os
-        data = {}
-        data['mean_hr_bpm'] = self.mean_hr_bpm
-        data['voltage_extremes'] = self.voltage_extremes
-        data['duration'] = self.duration
-        data['num_beats'] = self.num_beats
-        data['beats'] = self.beats.tolist()
-        json_data = json.dumps(data)
-        csv_filename = os.path.basename(self.target_csv_path)
-        json_filename = self.swap_csv_for_json_file_extension(csv_filename)
-        self.create_and_write_json_file(json_filename, json_data)
+        Collects the ECG analysis in a dict
 
-    def create_and_write_json_file(self, filename, contents):
+        :returns results: dict with mean_hr_bpm, voltage_extremes, duration,
+                          num_beats and beats (numpy array), the hrv
+                          metrics, plus lead_num_beats for a multi-lead
+                          .csv
+        """
+        results = {}
+        results['mean_hr_bpm'] = self.mean_hr_bpm
+        results['voltage_extremes'] = self.voltage_extremes
+        results['duration'] = self.duration
+        results['num_beats'] = self.num_beats
+        results['beats'] = self.beats
+        results.update(self.hrv)
+        if(self.num_leads > 1):
+            results['lead_num_beats'] = np.array(
+                [len(beats) for beats in self.lead_beats])
+        self.store_cached_results()
+        return(results)
+
+    def summary(self, storage='float64', keep_raw=False):
         """
-        Creates json file
+        Creates a slim __slots__ summary of the analysis
 
-        :param filename: target filename
-        :contents: file contents to be written
+        :param storage: 'float64' or 'compact' (float32 voltages, integer
+                        tick or uniform grid timestamps)
+        :param keep_raw: also keep the timestamps/voltages arrays
+        :returns summary: hrm_summary.HeartRateSummary
         """
-        import json
-        path_for_json_output = 'output_json_files/'
-        new_file_dest = path_for_json_output + filename
-        self.remove_file_from_dir_before_creating(new_file_dest)
-        with open(new_file_dest, 'w') as new_json_file:
-            json.dump(contents, new_json_file)
-        logging.info('json file written to: ' + path_for_json_output)
+        from hrm_summary import HeartRateSummary
+        return(HeartRateSummary.from_monitor(self, storage, keep_raw))
 
-    def remove_file_from_dir_before_creating(self, filename):
+    def build_json(self):
+        """
+        Creates and outputs the results file (.json unless output_format
+        says otherwise) with ECG analysis
         """
-        Removes file if it exists
+        from results_writer import encode_results, FORMATS
+        contents = encode_results(self.build_results(), self.output_format)
+        csv_filename = os.path.basename(self.target_csv_path)
+        json_filename = self.swap_csv_for_json_file_extension(csv_filename)
+        extension = FORMATS[self.output_format][0]
+        filename = os.path.splitext(json_filename)[0] + extension
+        with instrumentation.stage('json_write', self.num_beats,
+                                   len(contents)):
+            self.create_and_write_json_file(filename, contents)
+
+    def create_and_write_json_file(self, filename, contents):
+        """
+        Creates json file (atomically: temp file + rename)
 
         :param filename: target filename
+        :contents: encoded file contents to be written (bytes or str)
         """
-        import os
-        if(os.path.isfile(filename)):
-            os.remove(filename)
-            logging.info('removing ' + filename)
+        from results_writer import write_atomic
+        path_for_json_output = self.output_dir
+        new_file_dest = os.path.join(path_for_json_output, filename)
+        if(isinstance(contents, str)):
+            contents = contents.encode('utf-8')
+        write_atomic(new_file_dest, contents)
+        logger.info('json file written to: %s', path_for_json_output)
 
     def swap_csv_for_json_file_extension(self, filename):
         """
@@ -310,8 +796,9 @@ class HeartRateMonitor:
 
         :returns plot: plot with ECG data and detected peaks
         """
-        import matplotlib.pyplot as plt
-        plt.plot(self.timestamps, self.voltages, label="ECG raw")
+        from optional_imports import optional_import
+        plt = optional_import('matplotlib.pyplot', 'matplotlib')
+        plt.plot(np.asarray(self.timestamps), self.voltages, label="ECG raw")
         plt.plot(self.beats, self.heart_beat_voltages, 'rs', label="Beats")
         plt.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
                    ncol=2, mode="expand", borderaxespad=0.)
@@ -319,4 +806,39 @@ class HeartRateMonitor:
         plt.xlabel('time (secs)')
         plt.ylabel('voltage')
         plt.show()
-        logging.info('plot displayed')
+        logger.info('plot displayed')
+
+    def plot_ecg_lod(self, filename=None, start_ts=None, end_ts=None,
+                     width_px=1600, height_px=400):
+        """
+        Plots ECG data and detected peaks with level-of-detail decimation
+
+        Draws about two points per pixel column from a min/max pyramid
+        (lod_plot.MinMaxPyramid, built once per instance) instead of every
+        sample, so long recordings render in bounded time.
+
+        :param filename: .png to write without a display. Default: open an
+                         interactive window that re-fetches detail on zoom
+        :param start_ts: first time shown (seconds). Default: first sample
+        :param end_ts: last time shown (seconds). Default: last sample
+        :param width_px: plot width (pixels)
+        :param height_px: plot height (pixels)
+        """
+        import lod_plot
+        if(self.__lod_pyramid is None):
+            self.__lod_pyramid = lod_plot.MinMaxPyramid(self.timestamps,
+                                                        self.voltages)
+        if(filename is not None):
+            lod_plot.render_png(filename, self.__lod_pyramid, self.beats,
+                                self.heart_beat_voltages,
+                                self.target_csv_path, start_ts, end_ts,
+                                width_px, height_px)
+            logger.info('plot written to: %s', filename)
+            return
+        view = lod_plot.ZoomView(self.__lod_pyramid, self.beats,
+                                 self.heart_beat_voltages,
+                                 self.target_csv_path, width_px, height_px)
+        if(start_ts is not None or end_ts is not None):
+            view.axes.set_xlim(start_ts, end_ts)
+        view.show()
+        logger.info('plot displayed')
@@ -0,0 +1,324 @@
+"""
+Asyncio HTTP service running HeartRateMonitor on a bounded process pool
+
+Endpoints:
+
+* POST /analyze?path=<.csv path>  analyze a file under --data-root
+* POST /analyze  (body: 'time,voltage' .csv text)  analyze an upload
+* GET /metrics  queue depth, counters and latency percentiles
+
+Results are returned as the JSON of HeartRateMonitor.build_results; no
+file is written to output_json_files/. When max_pending requests are
+already uploading, queued or running, new ones get 503 (with
+Retry-After) before their body is read, so uploads cannot pile up in
+memory either. A client that stalls while sending its request for more
+than read_timeout seconds is disconnected, which frees its slot.
+path= requests are refused (403) unless a data root is configured, and
+then only name files inside it.
+
+Usage: python hrm_server.py --port 8590 --workers 4 --max-pending 64 \\
+           --data-root /srv/ecg
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlsplit
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 64
+# CRV largest accepted upload (bytes)
+DEFAULT_MAX_BODY = 256 * 2 ** 20
+# CRV seconds allowed for the request line and headers, then for the body
+DEFAULT_READ_TIMEOUT = 60.0
+# CRV latencies kept for the percentiles reported by /metrics
+LATENCY_WINDOW = 1000
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+def analyze_path(target_csv_path):
+    """
+    Worker function: analyzes a .csv on disk without writing any file
+
+    :param target_csv_path: location of .csv ECG data
+    :returns contents: JSON bytes of HeartRateMonitor.build_results()
+    """
+    from heart_rate_monitor import HeartRateMonitor
+    from results_writer import encode_json
+    hrm = HeartRateMonitor(target_csv_path, use_cache=False, lazy=True)
+    return(encode_json(hrm.build_results()))
+
+
+def analyze_upload(csv_bytes):
+    """
+    Worker function: analyzes uploaded .csv text
+
+    :param csv_bytes: contents of a 'time,voltage' .csv
+    :returns contents: JSON bytes of HeartRateMonitor.build_results()
+    """
+    handle, csv_path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(handle, 'wb') as csv_file:
+            csv_file.write(csv_bytes)
+        from heart_rate_monitor import HeartRateMonitor
+        from results_writer import encode_json
+        hrm = HeartRateMonitor(csv_path, use_cache=False, lazy=True)
+        return(encode_json(hrm.build_results()))
+    finally:
+        os.remove(csv_path)
+
+
+class HRMServer:
+    """
+    HTTP front-end for concurrent heart rate analysis requests
+
+    :param host: interface to listen on
+    :param port: port to listen on (0 picks a free port)
+    :param workers: analysis processes. Default: os.cpu_count()
+    :param max_pending: requests uploading, queued or running before 503
+                        is returned
+    :param max_body: largest accepted upload (bytes)
+    :param read_timeout: seconds allowed to send the request line and
+                         headers, and again to send the body, before the
+                         connection is closed
+    :param data_root: directory path= requests may read from (None:
+                      path= requests are refused)
+    """
+    def __init__(self, host='127.0.0.1', port=8590, workers=None,
+                 max_pending=DEFAULT_MAX_PENDING, max_body=DEFAULT_MAX_BODY,
+                 read_timeout=DEFAULT_READ_TIMEOUT, data_root=None):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.read_timeout = read_timeout
+        self.data_root = None
+        if(data_root is not None):
+            self.data_root = os.path.realpath(data_root)
+        self.pool = None
+        self.server = None
+        self.pending = 0
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self):
+        """
+        Starts the process pool and the listening socket
+
+        :sets port: the port actually bound
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # CRV forked workers would inherit (and hold open) client sockets
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'))
+        self.server = await asyncio.start_server(self.handle, self.host,
+                                                 self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info('listening on %s:%s', self.host, self.port)
+
+    async def close(self):
+        """
+        Stops listening and shuts the process pool down
+        """
+        self.server.close()
+        await self.server.wait_closed()
+        self.pool.shutdown()
+
+    async def handle(self, reader, writer):
+        """
+        Serves one HTTP request per connection
+        """
+        start = time.perf_counter()
+        try:
+            status, payload = await self.respond(reader)
+        except asyncio.TimeoutError:
+            # CRV the client stalled: drop it without a response
+            writer.close()
+            self.counters['timeout'] += 1
+            return
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {'error': 'malformed request'}
+        except Exception:
+            logger.exception('request failed')
+            status, payload = 500, {'error': 'internal error'}
+        if(isinstance(payload, dict)):
+            payload = json.dumps(payload).encode('utf-8')
+        headers = ['HTTP/1.1 %d %s' % (status, REASONS[status]),
+                   'Content-Type: application/json',
+                   'Content-Length: %d' % len(payload),
+                   'Connection: close']
+        if(status == 503):
+            headers.append('Retry-After: 1')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('ascii') +
+                     payload)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+        self.counters[status] += 1
+        self.latencies.append(time.perf_counter() - start)
+
+    async def respond(self, reader):
+        """
+        Parses a request and routes it
+
+        :returns (status, payload): HTTP status and dict or JSON bytes
+        :raises asyncio.TimeoutError: the head or the body took longer than
+                                      read_timeout
+        """
+        method, target, content_length = await asyncio.wait_for(
+            self.read_head(reader), self.read_timeout)
+        if(content_length > self.max_body):
+            return(413, {'error': 'upload larger than %d bytes' %
+                         self.max_body})
+        url = urlsplit(target)
+        if(url.path == '/metrics'):
+            return(200, self.metrics())
+        if(url.path != '/analyze'):
+            return(404, {'error': 'unknown endpoint ' + url.path})
+        if(method != 'POST'):
+            return(405, {'error': 'use POST /analyze'})
+        # CRV backpressure before the body: a rejected upload is never read
+        if(self.pending >= self.max_pending):
+            self.counters['rejected'] += 1
+            return(503, {'error': 'server busy, retry later'})
+        self.pending += 1
+        try:
+            body = await asyncio.wait_for(reader.readexactly(content_length),
+                                          self.read_timeout)
+            paths = parse_qs(url.query).get('path')
+            if(paths):
+                target_csv_path = self.resolve_path(paths[0])
+                if(target_csv_path is None):
+                    return(403, {'error': 'path is outside the data root'
+                                 if self.data_root else
+                                 'path= requests are disabled'})
+                return(await self.analyze(analyze_path, target_csv_path))
+            if(len(body) == 0):
+                return(400, {'error': 'send a path= query or a .csv body'})
+            return(await self.analyze(analyze_upload, body))
+        finally:
+            self.pending -= 1
+
+    async def read_head(self, reader):
+        """
+        Reads the request line and headers
+
+        :returns (method, target, content_length): request method, target
+                                                   and body length
+        """
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if(len(request_line) != 3):
+            raise ValueError('bad request line')
+        content_length = 0
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if(line == ''):
+                break
+            name, _, value = line.partition(':')
+            if(name.strip().lower() == 'content-length'):
+                content_length = int(value)
+        return(request_line[0], request_line[1], content_length)
+
+    def resolve_path(self, path):
+        """
+        :param path: path= query, relative to data_root
+        :returns target_csv_path: the real path if it is inside data_root,
+                                  else None
+        """
+        if(self.data_root is None):
+            return(None)
+        # CRV realpath also resolves '..' and symlinks out of the root
+        target_csv_path = os.path.realpath(os.path.join(self.data_root,
+                                                        path))
+        if(os.path.commonpath([self.data_root, target_csv_path]) !=
+           self.data_root):
+            return(None)
+        return(target_csv_path)
+
+    async def analyze(self, worker, argument):
+        """
+        Runs a worker function in the process pool
+
+        :param worker: analyze_path or analyze_upload
+        :param argument: its argument
+        :returns (status, payload): HTTP status and dict or JSON bytes
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return(200, await loop.run_in_executor(self.pool, worker,
+                                                   argument))
+        except (ImportError, ValueError, TypeError, IndexError) as error:
+            return(422, {'error': type(error).__name__ + ': ' + str(error)})
+
+    def metrics(self):
+        """
+        :returns metrics: dict with queue depth, status counters and
+                          p50/p90/p99/max latency (seconds)
+        """
+        latencies = sorted(self.latencies)
+        percentiles = {}
+        for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]:
+            if(latencies):
+                index = min(len(latencies) - 1,
+                            int(fraction * len(latencies)))
+                percentiles[name] = latencies[index]
+        if(latencies):
+            percentiles['max'] = latencies[-1]
+        running = min(self.pending, self.workers)
+        return({'pending': self.pending,
+                'running': running,
+                'queued': self.pending - running,
+                'max_pending': self.max_pending,
+                'workers': self.workers,
+                'responses': {str(key): value
+                              for key, value in self.counters.items()},
+                'latency_secs': percentiles})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve heart rate analysis over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8590)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='analysis processes (default: cpu count)')
+    parser.add_argument('--max-pending', type=int,
+                        default=DEFAULT_MAX_PENDING,
+                        help='requests in flight before 503 is returned')
+    parser.add_argument('--read-timeout', type=float,
+                        default=DEFAULT_READ_TIMEOUT,
+                        help='seconds to send the headers, then the body')
+    parser.add_argument('--data-root', default=None,
+                        help='directory path= requests may read from '
+                             '(default: path= requests are refused)')
+    args = parser.parse_args(argv)
+    server = HRMServer(args.host, args.port, args.workers, args.max_pending,
+                       read_timeout=args.read_timeout,
+                       data_root=args.data_root)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(server.start())
+    print('serving on http://%s:%d' % (server.host, server.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    loop.run_until_complete(server.close())
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
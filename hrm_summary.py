@@ -0,0 +1,175 @@
+import numpy as np
+
+# CRV 'compact': float32 voltages, integer tick timestamps
+STORAGE_MODES = ('float64', 'compact')
+# CRV int32 ticks (seconds), finest first: 1 us covers ~35.8 minutes,
+# 10 us ~6 hours, 100 us ~2.5 days, 1 ms ~24.8 days
+TIMESTAMP_TICKS = (1e-6, 1e-5, 1e-4, 1e-3)
+
+
+def encode_timestamps(timestamps, storage):
+    """
+    Encodes timestamps for storage
+
+    'compact' keeps uniformly sampled timestamps as an exact
+    uniform_grid.UniformTimestamps grid (t0/dt and a count, nothing per
+    sample). Other timestamps are int32 ticks since the first timestamp,
+    with the finest of TIMESTAMP_TICKS that fits the span, or int64
+    microseconds beyond that.
+
+    :param timestamps: numpy array of timestamps (seconds), or a grid
+    :param storage: one of STORAGE_MODES
+    :returns (t0, tick, encoded): offset and tick (seconds) and the
+                                  encoded numpy array or grid
+    """
+    from uniform_grid import detect_uniform
+    if(storage == 'compact'):
+        grid = detect_uniform(timestamps)
+        if(grid is not None):
+            return(0.0, 0.0, grid)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if(storage == 'float64' or len(timestamps) == 0):
+        return(0.0, 0.0, timestamps)
+    t0 = float(timestamps[0])
+    offsets = timestamps - t0
+    span = np.abs(offsets).max()
+    for tick in TIMESTAMP_TICKS:
+        if(np.rint(span / tick) < 2 ** 31):
+            return(t0, tick, np.rint(offsets / tick).astype(np.int32))
+    return(t0, 1e-6, np.rint(offsets / 1e-6).astype(np.int64))
+
+
+def decode_timestamps(t0, tick, encoded):
+    """
+    :param t0: offset returned by encode_timestamps
+    :param tick: tick returned by encode_timestamps
+    :param encoded: array or grid returned by encode_timestamps
+    :returns timestamps: float64 numpy array (seconds)
+    """
+    if(encoded.dtype == np.float64):
+        return(np.asarray(encoded))
+    return(t0 + encoded * tick)
+
+
+def encode_voltages(voltages, storage):
+    """
+    :param voltages: numpy array of voltages
+    :param storage: one of STORAGE_MODES
+    :returns encoded: float64 array, or float32 for 'compact'
+    """
+    dtype = np.float32 if storage == 'compact' else np.float64
+    return(np.asarray(voltages, dtype=dtype))
+
+
+class HeartRateSummary:
+    """
+    Slim result of an ECG analysis (metrics plus optional arrays)
+
+    Uses __slots__ and plain python numbers so hundreds of thousands of
+    summaries can stay resident. With storage='compact' the arrays are
+    float32 voltages and integer tick timestamps (a uniform grid for
+    uniformly sampled raw timestamps).
+
+    :param target_csv_path: location of the analyzed .csv ECG data
+    :param mean_hr_bpm: mean heart rate (bpm)
+    :param voltage_extremes: tuple (min_voltage, max_voltage)
+    :param duration: length (time) of .csv ECG data
+    :param beats: numpy array of the timestamps when beats occurred
+    :param heart_beat_voltages: numpy array of voltages when beats occurred
+    :param timestamps: raw timestamps (None to keep metrics only)
+    :param voltages: raw voltages (None to keep metrics only)
+    :param storage: one of STORAGE_MODES. Default: 'float64'
+    :raises ValueError: unknown storage
+    """
+    __slots__ = ('target_csv_path', 'mean_hr_bpm', 'voltage_extremes',
+                 'duration', 'num_beats', 'storage', '_beats_t0',
+                 '_beats_tick', '_beats', '_heart_beat_voltages', '_raw_t0',
+                 '_raw_tick', '_timestamps', '_voltages')
+
+    def __init__(self, target_csv_path, mean_hr_bpm, voltage_extremes,
+                 duration, beats, heart_beat_voltages, timestamps=None,
+                 voltages=None, storage='float64'):
+        if(storage not in STORAGE_MODES):
+            raise ValueError('storage must be one of ' + str(STORAGE_MODES))
+        self.target_csv_path = target_csv_path
+        self.mean_hr_bpm = float(mean_hr_bpm)
+        self.voltage_extremes = (float(voltage_extremes[0]),
+                                 float(voltage_extremes[1]))
+        self.duration = float(duration)
+        self.num_beats = int(len(beats))
+        self.storage = storage
+        self._beats_t0, self._beats_tick, self._beats = encode_timestamps(
+            beats, storage)
+        self._heart_beat_voltages = encode_voltages(heart_beat_voltages,
+                                                    storage)
+        self._raw_t0 = 0.0
+        self._raw_tick = 0.0
+        self._timestamps = None
+        self._voltages = None
+        if(timestamps is not None and voltages is not None):
+            self._raw_t0, self._raw_tick, self._timestamps = (
+                encode_timestamps(timestamps, storage))
+            self._voltages = encode_voltages(voltages, storage)
+
+    @classmethod
+    def from_monitor(cls, hrm, storage='float64', keep_raw=False):
+        """
+        Builds a summary from an analyzed HeartRateMonitor
+
+        :param hrm: HeartRateMonitor (or OutOfCoreHeartRateMonitor)
+        :param storage: one of STORAGE_MODES
+        :param keep_raw: also keep the timestamps/voltages arrays
+        :returns summary: HeartRateSummary
+        """
+        timestamps = hrm.timestamps if keep_raw else None
+        voltages = hrm.voltages if keep_raw else None
+        return(cls(hrm.target_csv_path, hrm.mean_hr_bpm,
+                   hrm.voltage_extremes, hrm.duration, hrm.beats,
+                   hrm.heart_beat_voltages, timestamps, voltages, storage))
+
+    @property
+    def beats(self):
+        return decode_timestamps(self._beats_t0, self._beats_tick,
+                                 self._beats)
+
+    @property
+    def heart_beat_voltages(self):
+        return self._heart_beat_voltages
+
+    @property
+    def timestamps(self):
+        if(self._timestamps is None):
+            return None
+        return decode_timestamps(self._raw_t0, self._raw_tick,
+                                 self._timestamps)
+
+    @property
+    def voltages(self):
+        return self._voltages
+
+    @property
+    def nbytes(self):
+        """
+        :returns nbytes: bytes held by the summary's arrays
+        """
+        arrays = [self._beats, self._heart_beat_voltages, self._timestamps,
+                  self._voltages]
+        return(sum(array.nbytes for array in arrays if array is not None))
+
+    def drop_raw(self):
+        """
+        Releases the raw timestamps/voltages arrays (metrics are kept)
+        """
+        self._timestamps = None
+        self._voltages = None
+
+    def build_results(self):
+        """
+        :returns results: dict with mean_hr_bpm, voltage_extremes, duration,
+                          num_beats and beats (numpy array)
+        """
+        return({'mean_hr_bpm': self.mean_hr_bpm,
+                'voltage_extremes': self.voltage_extremes,
+                'duration': self.duration,
+                'num_beats': self.num_beats,
+                'beats': self.beats})
@@ -0,0 +1,136 @@
+"""
+Heart rate variability metrics derived from beat timestamps
+
+Everything comes from the RR intervals (np.diff(beats)) in one pass of
+running sums: of the intervals, of their squares, of the squared
+successive differences and of the NN50 indicator. Any window's SDNN,
+RMSSD and pNN50 are then a difference of two running-sum entries, so the
+whole-recording metrics and every fixed-length window cost one
+np.searchsorted over the beats, however many windows there are.
+"""
+import numpy as np
+
+# CRV window of the windowed metrics (seconds)
+DEFAULT_HRV_WINDOW_SECS = 60.0
+# CRV successive RR difference counted by pNN50 (seconds)
+NN50_SECS = 0.05
+
+
+def rr_intervals(beats):
+    """
+    :param beats: numpy array of sorted beat timestamps (seconds)
+    :returns rr: numpy array of the intervals between beats (seconds)
+    """
+    return(np.diff(np.asarray(beats, dtype=np.float64)))
+
+
+def instantaneous_hr_bpm(rr):
+    """
+    :param rr: numpy array of RR intervals (seconds)
+    :returns hr_bpm: heart rate (BPM) implied by every interval
+    """
+    with np.errstate(divide='ignore'):
+        return(60.0 / np.asarray(rr, dtype=np.float64))
+
+
+def running_sums(rr):
+    """
+    :param rr: numpy array of RR intervals (seconds)
+    :returns sums: dict of running sums with a leading 0 ('rr', 'rr2' over
+                   the intervals; 'sd2', 'nn50' over successive differences)
+                   and 'center', the mean interval subtracted from 'rr'
+    """
+    center = float(rr.mean()) if len(rr) else 0.0
+    # CRV centered so the variance does not cancel catastrophically
+    centered = rr - center
+    successive = np.diff(rr)
+    sums = {'center': center}
+    for name, values in (('rr', centered), ('rr2', centered ** 2),
+                         ('sd2', successive ** 2),
+                         ('nn50', np.abs(successive) > NN50_SECS)):
+        sums[name] = np.zeros(len(values) + 1)
+        np.cumsum(values, out=sums[name][1:])
+    return(sums)
+
+
+def interval_stats(sums, first, last):
+    """
+    Metrics of the RR intervals first .. last - 1 (vectorized over ranges)
+
+    Successive differences count only when both intervals are in range.
+
+    :param sums: output of running_sums
+    :param first: numpy array of first interval indexes
+    :param last: numpy array of one-past-last interval indexes
+    :returns stats: dict of mean_rr_ms, mean_hr_bpm, sdnn_ms, rmssd_ms and
+                    pnn50 (percent) arrays; nan where too few intervals
+    """
+    count = last - first
+    pairs = np.maximum(count - 1, 0)
+    pairs_last = first + pairs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = sums['rr'][last] - sums['rr'][first]
+        mean = total / count
+        variance = ((sums['rr2'][last] - sums['rr2'][first] - total * mean) /
+                    (count - 1))
+        mean_rr = np.where(count > 0, sums['center'] + mean, np.nan)
+        rmssd = np.sqrt((sums['sd2'][pairs_last] - sums['sd2'][first]) /
+                        pairs)
+        pnn50 = 100.0 * (sums['nn50'][pairs_last] -
+                         sums['nn50'][first]) / pairs
+        return({'mean_rr_ms': 1000.0 * mean_rr,
+                'mean_hr_bpm': 60.0 / mean_rr,
+                'sdnn_ms': np.where(count > 1, 1000.0 * np.sqrt(
+                    np.maximum(variance, 0.0)), np.nan),
+                'rmssd_ms': np.where(pairs > 0, 1000.0 * rmssd, np.nan),
+                'pnn50': np.where(pairs > 0, pnn50, np.nan)})
+
+
+def window_edges(beats, window_secs):
+    """
+    :param beats: numpy array of sorted beat timestamps (seconds)
+    :param window_secs: window length (seconds)
+    :returns edges: window boundaries from the first beat past the last one
+    :raises ValueError: window_secs <= 0
+    """
+    if(window_secs <= 0):
+        raise ValueError('window_secs must be positive')
+    if(len(beats) == 0):
+        return(np.zeros(1))
+    num_windows = int((beats[-1] - beats[0]) // window_secs) + 1
+    return(beats[0] + window_secs * np.arange(num_windows + 1))
+
+
+def hrv_metrics(beats, window_secs=DEFAULT_HRV_WINDOW_SECS):
+    """
+    Computes every HRV metric of a recording in one pass
+
+    An interval belongs to the window its closing beat falls in. Windows
+    are window_secs long and start at the first beat.
+
+    :param beats: numpy array of sorted beat timestamps (seconds)
+    :param window_secs: window length of the windowed metrics (seconds),
+                        or None for the whole-recording metrics only
+    :returns metrics: dict of rr_intervals (seconds), instantaneous_hr_bpm,
+                      mean_rr_ms, sdnn_ms, rmssd_ms, pnn50 (percent) and,
+                      with window_secs, window_start plus window_mean_hr_bpm,
+                      window_sdnn_ms, window_rmssd_ms and window_pnn50 arrays
+    :raises ValueError: window_secs <= 0
+    """
+    beats = np.asarray(beats, dtype=np.float64)
+    rr = rr_intervals(beats)
+    sums = running_sums(rr)
+    whole = interval_stats(sums, np.array([0]), np.array([len(rr)]))
+    metrics = {'rr_intervals': rr,
+               'instantaneous_hr_bpm': instantaneous_hr_bpm(rr)}
+    for name in ('mean_rr_ms', 'sdnn_ms', 'rmssd_ms', 'pnn50'):
+        metrics[name] = float(whole[name][0])
+    if(window_secs is None):
+        return(metrics)
+    edges = window_edges(beats, window_secs)
+    bounds = np.searchsorted(beats[1:], edges, side='left')
+    windows = interval_stats(sums, bounds[:-1], bounds[1:])
+    metrics['window_start'] = edges[:-1]
+    for name in ('mean_hr_bpm', 'sdnn_ms', 'rmssd_ms', 'pnn50'):
+        metrics['window_' + name] = windows[name]
+    return(metrics)
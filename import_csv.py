@@ -1,16 +1,386 @@
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+import numpy as np
+import instrumentation
+logger = logging.getLogger(__name__)
+instrumentation.configure_logging('logs/import_logs.txt', __name__)
+
+# CRV rows parsed per np.loadtxt call by the chunked loader
+DEFAULT_CHUNK_ROWS = 2 ** 16
+DEFAULT_LOADER = 'chunked'
+DEFAULT_CACHE_DIR = 'csv_cache/'
+# CRV evict least recently used entries once the cache exceeds 1 GiB
+DEFAULT_CACHE_MAX_BYTES = 2 ** 30
+# CRV voltage column(s) of a single-lead (time, voltage) .csv
+SINGLE_LEAD = (1,)
+
+
+def count_csv_rows(target_csv_path, block_size=2 ** 20):
+    """
+    Counts the lines in a .csv file without holding its text in memory
+
+    :param target_csv_path: path for .csv data
+    :param block_size: bytes read from disk at a time
+    :returns rows: number of lines (upper bound on the number of data rows)
+    """
+    rows = 0
+    last_byte = b'\n'
+    with open(target_csv_path, 'rb') as csv_file:
+        block = csv_file.read(block_size)
+        while block:
+            rows += block.count(b'\n')
+            last_byte = block[-1:]
+            block = csv_file.read(block_size)
+    # CRV last line may not be newline terminated
+    if(last_byte != b'\n'):
+        rows += 1
+    return(rows)
+
+
+def count_csv_columns(target_csv_path):
+    """
+    :param target_csv_path: path for .csv data
+    :returns columns: number of comma separated fields on the first line
+    """
+    with open(target_csv_path, 'r') as csv_file:
+        for line in csv_file:
+            if(line.strip()):
+                return(len(line.split(',')))
+    return(0)
+
+
+def resolve_lead_columns(target_csv_path, lead_columns):
+    """
+    :param target_csv_path: path for .csv data
+    :param lead_columns: tuple of voltage column indexes, or 'all' for
+                         every column after the timestamps
+    :returns lead_columns: tuple of column indexes
+    :raises ValueError: no voltage column selected
+    """
+    if(lead_columns == 'all'):
+        lead_columns = range(1, count_csv_columns(target_csv_path))
+    lead_columns = tuple(int(column) for column in lead_columns)
+    if(len(lead_columns) == 0 or min(lead_columns) < 1):
+        raise ValueError('lead_columns must select columns after the time')
+    return(lead_columns)
+
+
+def split_leads(data, lead_columns):
+    """
+    :param data: (n, 1 + leads) array of parsed rows
+    :param lead_columns: tuple of voltage column indexes
+    :returns (timestamps, voltages): 1-D voltages for a single lead,
+                                     (n, leads) array for several
+    """
+    if(len(lead_columns) == 1):
+        return(data[:, 0], data[:, 1])
+    return(data[:, 0], data[:, 1:])
+
+
+def load_with_genfromtxt(target_csv_path, lead_columns=SINGLE_LEAD):
+    """
+    Loads (time, voltage) columns with np.genfromtxt (legacy parser)
+
+    :param target_csv_path: path for .csv data
+    :param lead_columns: tuple of voltage column indexes
+    :returns (timestamps, voltages): numpy arrays of the time and voltage
+                                     column(s), leads as columns
+    """
+    if(tuple(lead_columns) == SINGLE_LEAD):
+        data = np.genfromtxt(target_csv_path,
+                             delimiter=',',
+                             names=['time', 'voltage'])
+        return(data['time'], data['voltage'])
+    data = np.genfromtxt(target_csv_path, delimiter=',',
+                         usecols=(0,) + tuple(lead_columns))
+    return(split_leads(np.atleast_2d(data), lead_columns))
+
+
+def load_with_loadtxt(target_csv_path, lead_columns=SINGLE_LEAD):
+    """
+    Loads (time, voltage) columns in a single np.loadtxt call
+
+    :param target_csv_path: path for .csv data
+    :param lead_columns: tuple of voltage column indexes
+    :returns (timestamps, voltages): numpy arrays of the time and voltage
+                                     column(s), leads as columns
+    """
+    data = np.loadtxt(target_csv_path, delimiter=',', dtype=np.float64,
+                      usecols=(0,) + tuple(lead_columns), ndmin=2)
+    if(len(lead_columns) > 1):
+        return(np.ascontiguousarray(data[:, 0]), data[:, 1:].copy())
+    # CRV one transposed copy so each column is contiguous
+    columns = np.ascontiguousarray(data.T)
+    return(columns[0], columns[1])
+
+
+def iter_csv_chunks(target_csv_path, chunk_rows=DEFAULT_CHUNK_ROWS,
+                    lead_columns=SINGLE_LEAD):
+    """
+    Parses a .csv file chunk_rows lines at a time
+
+    :param target_csv_path: path for .csv data
+    :param chunk_rows: number of lines parsed per np.loadtxt call
+    :param lead_columns: tuple of voltage column indexes
+    :returns generator: (timestamps, voltages) numpy array pairs
+    """
+    usecols = (0,) + tuple(lead_columns)
+    with open(target_csv_path, 'r') as csv_file:
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_rows))
+            if(len(lines) == 0):
+                break
+            chunk = np.loadtxt(lines, delimiter=',', dtype=np.float64,
+                               usecols=usecols, ndmin=2)
+            if(len(chunk) > 0):
+                yield split_leads(chunk, lead_columns)
+
+
+def load_chunked(target_csv_path, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 lead_columns=SINGLE_LEAD):
+    """
+    Loads (time, voltage) columns chunk by chunk into preallocated arrays
+
+    Only chunk_rows lines of text are held in memory at any time. Several
+    leads are parsed in the same pass into one (n, leads) array.
+
+    :param target_csv_path: path for .csv data
+    :param chunk_rows: number of lines parsed per np.loadtxt call
+    :param lead_columns: tuple of voltage column indexes
+    :returns (timestamps, voltages): numpy arrays of the time and voltage
+                                     column(s), leads as columns
+    """
+    max_rows = count_csv_rows(target_csv_path)
+    timestamps = np.empty(max_rows, dtype=np.float64)
+    if(len(lead_columns) == 1):
+        voltages = np.empty(max_rows, dtype=np.float64)
+    else:
+        voltages = np.empty((max_rows, len(lead_columns)), dtype=np.float64)
+    filled = 0
+    for chunk_timestamps, chunk_voltages in iter_csv_chunks(
+            target_csv_path, chunk_rows, lead_columns):
+        timestamps[filled:filled + len(chunk_timestamps)] = chunk_timestamps
+        voltages[filled:filled + len(chunk_voltages)] = chunk_voltages
+        filled += len(chunk_timestamps)
+    # CRV blank lines are counted but not parsed
+    return(timestamps[:filled], voltages[:filled])
+
+
+LOADERS = {
+    'genfromtxt': load_with_genfromtxt,
+    'loadtxt': load_with_loadtxt,
+    'chunked': load_chunked,
+}
+
+
+class CSVCache:
+    """
+    Binary sidecar cache of parsed .csv columns
+
+    Each entry is a (1 + leads, n) float64 .npy file named after the source
+    path, mtime, size and voltage columns, so editing the source .csv
+    invalidates its entry. Hits
+    are memory-mapped (read-only, zero-copy). Once the cache grows past
+    max_bytes the least recently used entries are evicted. Several
+    processes may share a cache directory: each writer fills its own
+    temporary file before renaming it into place, and entries removed by
+    another process count as misses.
+
+    :param cache_dir: directory holding the .npy entries
+    :param max_bytes: size bound for all entries together
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def entry_prefix(self, target_csv_path):
+        """
+        :param target_csv_path: path for .csv data
+        :returns prefix: filename prefix shared by all entries of the path
+        """
+        abs_path = os.path.abspath(target_csv_path).encode('utf-8')
+        return(hashlib.sha1(abs_path).hexdigest()[:16])
+
+    def entry_path(self, target_csv_path, lead_columns=SINGLE_LEAD):
+        """
+        :param target_csv_path: path for .csv data
+        :param lead_columns: tuple of voltage column indexes
+        :returns entry_path: cache file for the current version of the .csv
+        """
+        stat = os.stat(target_csv_path)
+        filename = '%s-%x-%x' % (self.entry_prefix(target_csv_path),
+                                 stat.st_mtime_ns, stat.st_size)
+        if(tuple(lead_columns) != SINGLE_LEAD):
+            filename += '-c' + '-'.join(str(column)
+                                        for column in lead_columns)
+        return(os.path.join(self.cache_dir, filename + '.npy'))
+
+    def entries(self):
+        """
+        :returns entries: list of (path, size, last_used) for every entry
+        """
+        if(not os.path.isdir(self.cache_dir)):
+            return([])
+        found = []
+        for filename in os.listdir(self.cache_dir):
+            if(filename.endswith('.npy')):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # CRV removed by another process since listdir
+                    continue
+                found.append((path, stat.st_size, stat.st_mtime))
+        return(found)
+
+    def remove(self, path):
+        """
+        Removes one entry (already removed by another process is fine)
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def load(self, target_csv_path, lead_columns=SINGLE_LEAD):
+        """
+        Memory-maps the cached columns of a .csv
+
+        :param target_csv_path: path for .csv data
+        :param lead_columns: tuple of voltage column indexes
+        :returns (timestamps, voltages): read-only arrays (voltages is
+                 (n, leads) for several leads), or None on a miss
+        """
+        path = self.entry_path(target_csv_path, lead_columns)
+        try:
+            # CRV touch the entry so eviction is least recently used
+            os.utime(path)
+            columns = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return(None)
+        logger.info('csv cache hit: %s', path)
+        if(len(columns) == 2):
+            return(columns[0], columns[1])
+        return(columns[0], columns[1:].T)
+
+    def store(self, target_csv_path, timestamps, voltages,
+              lead_columns=SINGLE_LEAD):
+        """
+        Writes the parsed columns of a .csv to the cache
+
+        :param target_csv_path: path for .csv data
+        :param timestamps: numpy array of timestamps
+        :param voltages: numpy array of voltages ((n, leads) for several)
+        :param lead_columns: tuple of voltage column indexes
+        """
+        if(not os.path.isdir(self.cache_dir)):
+            os.makedirs(self.cache_dir)
+        path = self.entry_path(target_csv_path, lead_columns)
+        self.invalidate_stale(target_csv_path)
+        # CRV one temporary file per writer: concurrent stores never mix
+        handle, tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(path) + '.', suffix='.tmp',
+            dir=self.cache_dir)
+        os.close(handle)
+        try:
+            voltages = np.asarray(voltages)
+            rows = 2 if voltages.ndim == 1 else 1 + voltages.shape[1]
+            columns = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=np.float64,
+                shape=(rows, len(timestamps)))
+            columns[0] = timestamps
+            columns[1:] = voltages.T
+            columns.flush()
+            del columns
+            # CRV rename so readers never see a partially written entry
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        logger.info('csv cache stored: %s', path)
+        self.evict()
+
+    def invalidate(self, target_csv_path):
+        """
+        Removes every cache entry of a .csv
+
+        :param target_csv_path: path for .csv data
+        """
+        prefix = self.entry_prefix(target_csv_path)
+        for path, size, last_used in self.entries():
+            if(os.path.basename(path).startswith(prefix)):
+                self.remove(path)
+
+    def invalidate_stale(self, target_csv_path):
+        """
+        Removes the entries of older versions of a .csv (other lead
+        selections of the current version are kept)
+
+        :param target_csv_path: path for .csv data
+        """
+        current = os.path.basename(self.entry_path(target_csv_path))[:-4]
+        for path, size, last_used in self.entries():
+            filename = os.path.basename(path)
+            if(filename.startswith(self.entry_prefix(target_csv_path)) and
+               not filename.startswith(current)):
+                self.remove(path)
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits max_bytes
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for path, size, last_used in entries)
+        for path, size, last_used in entries:
+            if(total <= self.max_bytes):
+                break
+            self.remove(path)
+            total -= size
+            logger.info('csv cache evicted: %s', path)
+
+    def clear(self):
+        """
+        Removes every cache entry
+        """
+        for path, size, last_used in self.entries():
+            self.remove(path)
+
+
 class ImportCSV:
     """
     Imports .csv data
 
     :param target_csv_path: path for .csv data
+    :param loader: name of the parser in LOADERS. Default: 'chunked'
+    :param use_cache: reuse/store parsed columns in a CSVCache. Default: True
+    :param cache: CSVCache to use. Default: CSVCache() in csv_cache/
+    :param lead_columns: voltage column indexes, or 'all' for every column
+                         after the timestamps. Default: (1,), a single lead
+    :param on_invalid: 'reject' (raise ImportError) or 'repair' (drop bad
+                       timestamps, interpolate NaN voltages) malformed data
+                       (see csv_validation). Default: 'reject'
     :attr target_csv_path: path imported .csv data came from
     :attr timestamps: list of timestamps pulled from .csv data
-    :attr voltages: list of voltages pulled from .csv data
+    :attr voltages: list of voltages pulled from .csv data ((n, leads)
+                    array when several lead_columns are imported)
+    :attr validation: dict reported by csv_validation.validate_columns
     """
-    def __init__(self, target_csv_path):
+    def __init__(self, target_csv_path, loader=DEFAULT_LOADER,
+                 use_cache=True, cache=None, lead_columns=SINGLE_LEAD,
+                 on_invalid='reject'):
         self.target_csv_path = target_csv_path
+        self.loader = loader
+        self.use_cache = use_cache
+        self.cache = cache if cache is not None else CSVCache()
+        self.lead_columns = lead_columns
+        self.on_invalid = on_invalid
         self.timestamps = None
         self.voltages = None
+        self.validation = None
         self.import_data()
 
     def import_data(self):
@@ -19,24 +389,76 @@ class ImportCSV:
 
         :sets timestamps: list of timestamps pulled from .csv data
         :sets voltages: list of voltages pulled from .csv data
+        :sets validation: dict reported by the validation stage
         :raises ImportError: [.csv] is not a valid csv
+        :raises ValueError: loader is not a key of LOADERS
         """
-        import os.path
-        import numpy as np
-        import logging
-        logging.basicConfig(filename="logs/import_logs.txt",
-                            format='%(asctime)s %(message)s',
-                            datefmt='%m/%d/%Y %I:%M:%S %p',
-                            level=logging.DEBUG)
+        from csv_validation import validate_columns
+        if(self.loader not in LOADERS):
+            logger.error('unknown csv loader: %s', self.loader)
+            raise ValueError('loader must be one of ' + str(sorted(LOADERS)))
         if(os.path.isfile(self.target_csv_path) and
            self.target_csv_path.endswith('.csv')):
-            # CRV - method used here found at:
-            data = np.genfromtxt(self.target_csv_path,
-                                 delimiter=',',
-                                 names=['time', 'voltage'])
-            self.timestamps = data['time']
-            self.voltages = data['voltage']
-            logging.info(self.target_csv_path + ' successfully imported')
+            self.lead_columns = resolve_lead_columns(self.target_csv_path,
+                                                     self.lead_columns)
+            cached = None
+            if(self.use_cache):
+                cached = self.cache.load(self.target_csv_path,
+                                         self.lead_columns)
+            if(cached is not None):
+                self.timestamps, self.voltages = cached
+            else:
+                self.parse()
+            with instrumentation.stage('validate', len(self.timestamps)):
+                self.timestamps, self.voltages, self.validation = (
+                    validate_columns(self.timestamps, self.voltages,
+                                     self.on_invalid,
+                                     source=self.target_csv_path))
+            if(self.validation['repaired']):
+                logger.warning('%s repaired: %s', self.target_csv_path,
+                               self.validation)
+            logger.info('%s successfully imported', self.target_csv_path)
         else:
-            logging.warning('csv import error. File: ' + self.target_csv_path)
+            logger.warning('csv import error. File: %s', self.target_csv_path)
             raise ImportError(self.target_csv_path + ' is not a valid csv')
+
+    def parse(self):
+        """
+        Sniffs then parses the .csv with the loader (cache miss path)
+
+        Loaders other than genfromtxt stop at the first malformed cell;
+        when repairing, the file is parsed again with genfromtxt, which
+        turns bad cells into NaN for the validation stage to fix.
+
+        :sets timestamps: numpy array of parsed timestamps
+        :sets voltages: numpy array of parsed voltages
+        :raises ImportError: the .csv is malformed
+        """
+        from csv_validation import sniff_csv
+        sniff_csv(self.target_csv_path, self.lead_columns)
+        try:
+            self.timestamps, self.voltages = LOADERS[self.loader](
+                self.target_csv_path, lead_columns=self.lead_columns)
+        except ValueError as error:
+            if(self.on_invalid != 'repair' or self.loader == 'genfromtxt'):
+                logger.warning('csv parse error. File: %s',
+                               self.target_csv_path)
+                raise ImportError('%s is not a valid csv: %s' %
+                                  (self.target_csv_path, error))
+            logger.warning('%s: %s. Parsing with genfromtxt to repair',
+                           self.target_csv_path, error)
+            self.timestamps, self.voltages = load_with_genfromtxt(
+                self.target_csv_path, lead_columns=self.lead_columns)
+        if(self.use_cache):
+            self.store_in_cache()
+
+    def store_in_cache(self):
+        """
+        Stores the imported columns in the cache (failures are only logged)
+        """
+        try:
+            self.cache.store(self.target_csv_path, self.timestamps,
+                             self.voltages, self.lead_columns)
+        except OSError as error:
+            logger.warning('csv cache write failed: %s: %s',
+                           self.target_csv_path, error)
@@ -0,0 +1,233 @@
+"""
+Low-overhead instrumentation: per-stage timers and non-blocking logging
+
+Stage timers are off by default. While they are off, stage() returns a
+shared no-op context manager, so instrumented code pays one function call.
+Set HRM_INSTRUMENT=1 in the environment or call enable_timers() to turn
+them on.
+
+configure_logging only attaches a placeholder handler: the log directory,
+the queue and the listener thread are created by the first record, so
+importing an instrumented module stays cheap.
+"""
+import logging
+import os
+import time
+
+LOG_FORMAT = '%(asctime)s %(name)s %(levelname)s %(message)s'
+LOG_DATEFMT = '%m/%d/%Y %I:%M:%S %p'
+
+_timers_enabled = os.environ.get('HRM_INSTRUMENT') == '1'
+_timings = {}
+_listeners = {}
+
+
+class NullStage:
+    """
+    No-op stand-in for Stage while timers are disabled
+    """
+    samples = 0
+    nbytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    """
+    Times one run of a pipeline stage
+
+    :param name: stage name, e.g. 'find_beats'
+    :param samples: number of samples the stage processed
+    :param nbytes: number of bytes the stage processed
+    """
+    def __init__(self, name, samples=0, nbytes=0):
+        self.name = name
+        self.samples = samples
+        self.nbytes = nbytes
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start, self.samples,
+               self.nbytes)
+        return False
+
+
+def stage(name, samples=0, nbytes=0):
+    """
+    Context manager timing a pipeline stage (no-op while timers are off)
+
+    samples/nbytes can also be set on the returned object inside the block.
+
+    :param name: stage name, e.g. 'find_beats'
+    :param samples: number of samples the stage processed
+    :param nbytes: number of bytes the stage processed
+    :returns stage: Stage, or NULL_STAGE while timers are disabled
+    """
+    if(not _timers_enabled):
+        return NULL_STAGE
+    return Stage(name, samples, nbytes)
+
+
+def record(name, secs, samples=0, nbytes=0):
+    """
+    Adds one timed run to the totals of a stage
+
+    :param name: stage name
+    :param secs: wall-clock seconds of the run
+    :param samples: number of samples processed
+    :param nbytes: number of bytes processed
+    """
+    totals = _timings.setdefault(name, {'calls': 0, 'secs': 0.0,
+                                        'samples': 0, 'nbytes': 0})
+    totals['calls'] += 1
+    totals['secs'] += secs
+    totals['samples'] += samples
+    totals['nbytes'] += nbytes
+
+
+def enable_timers():
+    """
+    Turns stage timers on
+    """
+    global _timers_enabled
+    _timers_enabled = True
+
+
+def disable_timers():
+    """
+    Turns stage timers off
+    """
+    global _timers_enabled
+    _timers_enabled = False
+
+
+def timings():
+    """
+    :returns timings: dict stage -> {'calls', 'secs', 'samples', 'nbytes'}
+    """
+    return({name: dict(totals) for name, totals in _timings.items()})
+
+
+def reset_timings():
+    """
+    Clears all recorded stage timings
+    """
+    _timings.clear()
+
+
+def report():
+    """
+    :returns report: one line per stage with calls, time and throughput
+    """
+    header = ('stage', 'calls', 'secs', 'samples', 'samples/sec')
+    lines = ['%-16s %7s %10s %12s %14s' % header]
+    for name, totals in sorted(_timings.items()):
+        rate = totals['samples'] / totals['secs'] if totals['secs'] else 0
+        lines.append('%-16s %7d %10.4f %12d %14.0f' % (
+            name, totals['calls'], totals['secs'], totals['samples'], rate))
+    return('\n'.join(lines))
+
+
+class DeferredQueueHandler(logging.Handler):
+    """
+    Hands records to a QueueListener thread that is started on first use
+
+    :param filename: log file the listener writes to
+    """
+    def __init__(self, filename):
+        logging.Handler.__init__(self)
+        self.filename = filename
+        self.listener = None
+        self.queue_handler = None
+        self.forked = False
+
+    def start(self):
+        """
+        Creates the log directory, the queue and the listener thread
+        """
+        import atexit
+        import logging.handlers
+        import queue
+        log_dir = os.path.dirname(self.filename)
+        if(log_dir and not os.path.isdir(log_dir)):
+            os.makedirs(log_dir)
+        records = queue.Queue(-1)
+        file_handler = logging.FileHandler(self.filename, delay=True)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+        self.listener = logging.handlers.QueueListener(records, file_handler)
+        self.listener.start()
+        self.queue_handler = logging.handlers.QueueHandler(records)
+        # CRV flush queued records to disk when the interpreter exits
+        atexit.register(self.stop)
+        if(self.forked):
+            import multiprocessing.util
+            # CRV multiprocessing workers exit without running atexit hooks
+            multiprocessing.util.Finalize(None, self.stop, exitpriority=0)
+
+    def stop(self):
+        """
+        Writes out the queued records and stops the listener thread
+
+        A later record starts a new listener.
+        """
+        self.acquire()
+        try:
+            if(self.listener is not None):
+                self.listener.stop()
+            self.listener = None
+            self.queue_handler = None
+        finally:
+            self.release()
+
+    def emit(self, record):
+        if(self.queue_handler is None):
+            self.start()
+        self.queue_handler.emit(record)
+
+
+def configure_logging(filename, logger_name=None, level=logging.INFO):
+    """
+    Sends a logger's records to a file from a background thread
+
+    The logger only puts records on a queue; a QueueListener thread does
+    the file I/O. Nothing but the logger level is set up until the first
+    record is logged. Calling it again with the same arguments only updates
+    the level.
+
+    :param filename: log file (opened on the first record)
+    :param logger_name: logger to configure. Default: root logger
+    :param level: logger level
+    """
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    if((logger_name, filename) in _listeners):
+        return
+    handler = DeferredQueueHandler(filename)
+    logger.addHandler(handler)
+    _listeners[(logger_name, filename)] = handler
+
+
+def _restart_listeners_in_child():
+    """
+    Forked workers inherit the handlers but not the listener threads
+    """
+    for handler in _listeners.values():
+        handler.forked = True
+        if(handler.queue_handler is not None):
+            handler.listener = None
+            handler.start()
+
+
+if(hasattr(os, 'register_at_fork')):
+    os.register_at_fork(after_in_child=_restart_listeners_in_child)
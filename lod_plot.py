@@ -0,0 +1,226 @@
+"""
+Level-of-detail plotting of long ECG recordings
+
+A MinMaxPyramid keeps the min and max voltage of bins of 2, 4, 8, ...
+samples. Drawing a time range picks the finest level with no more bins
+than the plot has pixels, so a plot of any length draws a few thousand
+points instead of every sample, and zooming in re-fetches finer levels
+down to the raw samples.
+
+render_png draws with matplotlib's Agg canvas only (no pyplot, no GUI), so
+review images can be produced headless in worker processes.
+"""
+import numpy as np
+
+DEFAULT_WIDTH_PX = 1600
+DEFAULT_HEIGHT_PX = 400
+DEFAULT_DPI = 100
+# CRV coarsest level kept in the pyramid (bins)
+MIN_LEVEL_BINS = 256
+
+
+def reduce_pairs(mins, maxs):
+    """
+    :param mins: numpy array of bin minimums ((bins, leads) for several)
+    :param maxs: numpy array of bin maximums
+    :returns (mins, maxs): minimums/maximums of bins twice as long (per
+                           lead)
+    """
+    pairs = np.arange(0, len(mins), 2)
+    return(np.minimum.reduceat(mins, pairs, axis=0),
+           np.maximum.reduceat(maxs, pairs, axis=0))
+
+
+class MinMaxPyramid:
+    """
+    Min/max decimation pyramid over a recording's voltages
+
+    Holds about two extra copies of the voltages (one min and one max array
+    per level, halving each level).
+
+    :param timestamps: numpy array of increasing timestamps (seconds), or a
+                       uniform_grid.UniformTimestamps grid (kept as is)
+    :param voltages: numpy array of voltages ((n, leads) for a multi-lead
+                     recording: every lead is reduced separately)
+    :attr levels: list of (bin_samples, mins, maxs), finest first
+    """
+    def __init__(self, timestamps, voltages):
+        from uniform_grid import as_timestamps
+        self.timestamps = as_timestamps(timestamps)
+        self.voltages = np.asarray(voltages)
+        self.levels = []
+        bin_samples = 2
+        mins, maxs = reduce_pairs(self.voltages, self.voltages)
+        while True:
+            self.levels.append((bin_samples, mins, maxs))
+            if(len(mins) <= MIN_LEVEL_BINS):
+                break
+            mins, maxs = reduce_pairs(mins, maxs)
+            bin_samples *= 2
+
+    @property
+    def nbytes(self):
+        """
+        :returns nbytes: bytes held by the pyramid levels
+        """
+        return(sum(mins.nbytes + maxs.nbytes
+                   for bin_samples, mins, maxs in self.levels))
+
+    def sample_range(self, start_ts=None, end_ts=None):
+        """
+        :param start_ts: first time shown (seconds). Default: first sample
+        :param end_ts: last time shown (seconds). Default: last sample
+        :returns (start, stop): sample indexes covering the time range
+        """
+        start = 0
+        stop = len(self.timestamps)
+        if(start_ts is not None):
+            start = int(np.searchsorted(self.timestamps, start_ts, 'left'))
+        if(end_ts is not None):
+            stop = int(np.searchsorted(self.timestamps, end_ts, 'right'))
+        return(start, max(start, stop))
+
+    def envelope(self, start_ts=None, end_ts=None,
+                 max_points=2 * DEFAULT_WIDTH_PX):
+        """
+        Points to draw for a time range
+
+        Raw samples when the range holds at most max_points of them;
+        otherwise each bin of the chosen level contributes its min and its
+        max at the bin's first timestamp (a vertical stroke per bin).
+
+        :param start_ts: first time shown (seconds). Default: first sample
+        :param end_ts: last time shown (seconds). Default: last sample
+        :param max_points: most points returned (about 2 per pixel column)
+        :returns (timestamps, voltages): numpy arrays to plot (voltages
+                                         (points, leads) for several leads)
+        """
+        start, stop = self.sample_range(start_ts, end_ts)
+        if(stop - start <= max_points):
+            return(self.timestamps[start:stop], self.voltages[start:stop])
+        for bin_samples, mins, maxs in self.levels:
+            first = start // bin_samples
+            last = -(-stop // bin_samples)
+            if(2 * (last - first) <= max_points):
+                break
+        bin_ts = self.timestamps[first * bin_samples:last * bin_samples:
+                                 bin_samples]
+        voltages = np.empty((2 * (last - first),) + mins.shape[1:])
+        voltages[0::2] = mins[first:last]
+        voltages[1::2] = maxs[first:last]
+        return(np.repeat(bin_ts, 2), voltages)
+
+
+def visible_beats(beats, heart_beat_voltages, start_ts, end_ts,
+                  max_points):
+    """
+    :returns (beats, heart_beat_voltages): beats in the time range,
+                                           thinned to at most max_points
+    """
+    beats = np.asarray(beats)
+    heart_beat_voltages = np.asarray(heart_beat_voltages)
+    start = 0 if start_ts is None else np.searchsorted(beats, start_ts)
+    stop = (len(beats) if end_ts is None else
+            np.searchsorted(beats, end_ts, 'right'))
+    step = max(1, -(-(stop - start) // max_points))
+    return(beats[start:stop:step], heart_beat_voltages[start:stop:step])
+
+
+def draw(axes, pyramid, beats, heart_beat_voltages, title=None,
+         start_ts=None, end_ts=None, max_points=2 * DEFAULT_WIDTH_PX):
+    """
+    Draws the ECG envelope and the detected beats on matplotlib axes
+
+    A multi-lead recording gets one envelope line per lead, with its beats
+    marked on every lead.
+
+    :returns lines: list of the matplotlib Line2D of each lead's envelope
+    """
+    lines = axes.plot(*pyramid.envelope(start_ts, end_ts, max_points),
+                      linewidth=0.5)
+    if(len(lines) == 1):
+        lines[0].set_label("ECG raw")
+    else:
+        for lead, line in enumerate(lines):
+            line.set_label("ECG lead %d" % (lead + 1))
+    beat_markers = axes.plot(*visible_beats(beats, heart_beat_voltages,
+                                            start_ts, end_ts, max_points),
+                             'rs')
+    beat_markers[0].set_label("Beats")
+    axes.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
+                ncol=2, mode="expand", borderaxespad=0.)
+    if(title):
+        axes.figure.suptitle(title)
+    axes.set_xlabel('time (secs)')
+    axes.set_ylabel('voltage')
+    return(lines)
+
+
+def render_png(filename, pyramid, beats, heart_beat_voltages, title=None,
+               start_ts=None, end_ts=None, width_px=DEFAULT_WIDTH_PX,
+               height_px=DEFAULT_HEIGHT_PX, dpi=DEFAULT_DPI):
+    """
+    Writes a PNG of a time range without a display (Agg canvas)
+
+    :param filename: .png path
+    :param pyramid: MinMaxPyramid of the recording
+    :param beats: numpy array of beat timestamps
+    :param heart_beat_voltages: numpy array of voltages at those beats
+    :param title: figure title
+    :param start_ts: first time shown (seconds). Default: first sample
+    :param end_ts: last time shown (seconds). Default: last sample
+    :param width_px: image width (pixels)
+    :param height_px: image height (pixels)
+    :param dpi: image resolution
+    """
+    from optional_imports import optional_import
+    figure_module = optional_import('matplotlib.figure', 'matplotlib')
+    backend_agg = optional_import('matplotlib.backends.backend_agg',
+                                  'matplotlib')
+    figure = figure_module.Figure(figsize=(width_px / dpi, height_px / dpi),
+                                  dpi=dpi)
+    backend_agg.FigureCanvasAgg(figure)
+    draw(figure.add_subplot(1, 1, 1), pyramid, beats, heart_beat_voltages,
+         title, start_ts, end_ts, 2 * width_px)
+    figure.savefig(filename)
+
+
+class ZoomView:
+    """
+    Interactive plot that re-fetches pyramid detail when the x range changes
+
+    :param pyramid: MinMaxPyramid of the recording
+    :param beats: numpy array of beat timestamps
+    :param heart_beat_voltages: numpy array of voltages at those beats
+    :param title: figure title
+    :param width_px: window width (pixels)
+    """
+    def __init__(self, pyramid, beats, heart_beat_voltages, title=None,
+                 width_px=DEFAULT_WIDTH_PX, height_px=DEFAULT_HEIGHT_PX,
+                 dpi=DEFAULT_DPI):
+        from optional_imports import optional_import
+        plt = optional_import('matplotlib.pyplot', 'matplotlib')
+        self.pyramid = pyramid
+        self.max_points = 2 * width_px
+        self.figure = plt.figure(figsize=(width_px / dpi, height_px / dpi),
+                                 dpi=dpi)
+        self.axes = self.figure.add_subplot(1, 1, 1)
+        self.lines = draw(self.axes, pyramid, beats, heart_beat_voltages,
+                          title, max_points=self.max_points)
+        self.axes.callbacks.connect('xlim_changed', self.refresh)
+
+    def refresh(self, axes):
+        """
+        Redraws the ECG envelope for the axes' current x range
+        """
+        start_ts, end_ts = axes.get_xlim()
+        timestamps, voltages = self.pyramid.envelope(start_ts, end_ts,
+                                                     self.max_points)
+        voltages = voltages.reshape(len(voltages), -1)
+        for lead, line in enumerate(self.lines):
+            line.set_data(timestamps, voltages[:, lead])
+        self.figure.canvas.draw_idle()
+
+    def show(self):
+        from optional_imports import optional_import
+        optional_import('matplotlib.pyplot', 'matplotlib').show()
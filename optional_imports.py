@@ -0,0 +1,43 @@
+"""
+Cached imports of optional dependencies
+
+Missing packages are remembered as well, so a failed import is not retried
+on every call. Nothing is imported until it is first asked for, which keeps
+peakutils, scipy and matplotlib out of headless analysis runs.
+"""
+import importlib
+
+_modules = {}
+
+
+def optional_import(module_name, install_hint=None):
+    """
+    Imports an optional dependency (once per process)
+
+    :param module_name: e.g. 'peakutils' or 'matplotlib.pyplot'
+    :param install_hint: package to name in the error. Default: module_name
+    :returns module: the imported module
+    :raises ImportError: the module is not installed
+    """
+    if(module_name not in _modules):
+        try:
+            _modules[module_name] = importlib.import_module(module_name)
+        except ImportError:
+            _modules[module_name] = None
+    module = _modules[module_name]
+    if(module is None):
+        raise ImportError(module_name + ' is not installed (pip install ' +
+                          (install_hint or module_name.split('.')[0]) + ')')
+    return(module)
+
+
+def is_available(module_name):
+    """
+    :param module_name: e.g. 'scipy.signal'
+    :returns available: True if optional_import(module_name) succeeds
+    """
+    try:
+        optional_import(module_name)
+    except ImportError:
+        return(False)
+    return(True)
@@ -0,0 +1,370 @@
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+import instrumentation
+logger = logging.getLogger(__name__)
+
+# CRV samples analyzed at a time (8 MiB per float64 column)
+DEFAULT_WINDOW_SAMPLES = 2 ** 20
+# CRV extra samples on each side of a window so no peak is cut in half
+DEFAULT_OVERLAP_SAMPLES = 1024
+# CRV histogram bins each median pass narrows the search range to
+MEDIAN_BINS = 2 ** 16
+
+
+def read_window(column_path, start, stop):
+    """
+    Reads samples start .. stop of a raw float64 column file
+
+    :param column_path: file written with ndarray.tofile
+    :param start: first sample
+    :param stop: one past the last sample
+    :returns window: numpy array
+    """
+    return(np.fromfile(column_path, dtype=np.float64, count=stop - start,
+                       offset=start * 8))
+
+
+def bin_voltages(voltages, low, high):
+    """
+    :param voltages: numpy array
+    :param low: lowest binned value
+    :param high: highest binned value (> low)
+    :returns (inside, bins): the voltages within [low, high] and their
+                             MEDIAN_BINS histogram bin
+    """
+    inside = voltages[(voltages >= low) & (voltages <= high)]
+    bins = ((inside - low) * (MEDIAN_BINS / (high - low))).astype(np.int64)
+    return(inside, np.minimum(bins, MEDIAN_BINS - 1))
+
+
+class OutOfCoreHeartRateMonitor:
+    """
+    Analyzes ECG recordings larger than RAM, one window at a time
+
+    The .csv is parsed once, in chunks, into two raw binary column files
+    in a temporary directory. Every chunk goes through
+    csv_validation.validate_columns as it is parsed; rows and repairs are
+    judged per chunk, so 'repair' may reject a file with its bad rows
+    bunched in one chunk, and NaN voltages at a chunk end take the nearest
+    valid value. Extremes and duration are streaming reductions of that
+    parse. The median used for the peak threshold is exact: histogram
+    passes narrow the range holding the median until it fits in a window,
+    then np.partition picks it. Peaks are detected in windows
+    that overlap their neighbours by overlap_samples and are merged, so
+    the results equal HeartRateMonitor's while peak memory is bounded by
+    the window size.
+
+    :param target_csv_path: location of .csv ECG data
+    :param window_samples: samples analyzed at a time
+    :param overlap_samples: samples shared with each neighbouring window
+                            (must exceed the longest flat peak top)
+    :param output_dir: directory the results file is written to
+    :param output_format: 'json', 'msgpack' or 'npz' (see results_writer)
+    :param work_dir: parent directory of the temporary column files
+    :param on_invalid: 'reject' or 'repair' malformed .csv data (see
+                       csv_validation). Default: 'reject'
+    :attr mean_hr_bpm: mean heart rate (bpm). Default: mean over whole data set
+    :attr voltage_extremes: tuple (min_voltage, max_voltage)
+    :attr duration: length (time) of .csv ECG data
+    :attr num_beats: number of beats detected in ECG data
+    :attr beats: numpy array of the timestamps when beats occurred
+    :attr heart_beat_voltages: numpy array of voltages when beats occurred
+    :attr num_samples: number of samples in the .csv
+    :attr validation: dict reported by the .csv validation stage
+    """
+    def __init__(self, target_csv_path,
+                 window_samples=DEFAULT_WINDOW_SAMPLES,
+                 overlap_samples=DEFAULT_OVERLAP_SAMPLES,
+                 output_dir='output_json_files/', output_format='json',
+                 work_dir=None, on_invalid='reject'):
+        self.target_csv_path = target_csv_path
+        self.window_samples = window_samples
+        self.overlap_samples = overlap_samples
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.work_dir = work_dir
+        self.on_invalid = on_invalid
+        self.validation = None
+        self.num_samples = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.voltage_extremes = None
+        self.duration = None
+        self.beats = None
+        self.heart_beat_voltages = None
+        self.num_beats = None
+        self.mean_hr_bpm = None
+        self.analyze()
+
+    def analyze(self):
+        """
+        Runs every pass over the recording, then removes the column files
+
+        :raises ImportError: [.csv] is not a valid csv
+        """
+        if(not (os.path.isfile(self.target_csv_path) and
+                self.target_csv_path.endswith('.csv'))):
+            logger.warning('csv import error. File: %s', self.target_csv_path)
+            raise ImportError(self.target_csv_path + ' is not a valid csv')
+        column_dir = tempfile.mkdtemp(dir=self.work_dir)
+        self.ts_path = os.path.join(column_dir, 'timestamps.f64')
+        self.voltage_path = os.path.join(column_dir, 'voltages.f64')
+        try:
+            with instrumentation.stage('import') as timer:
+                self.split_columns()
+                timer.samples = self.num_samples
+            with instrumentation.stage('find_beats', self.num_samples):
+                self.find_beats()
+            self.calc_mean_hr_bpm()
+        finally:
+            shutil.rmtree(column_dir)
+        logger.info('%s analyzed out of core: %s beats',
+                    self.target_csv_path, self.num_beats)
+
+    def windows(self, overlap=0):
+        """
+        :param overlap: samples added on each side of every window
+        :returns generator: (start, stop, read_start, read_stop) per window
+        """
+        for start in range(0, self.num_samples, self.window_samples):
+            stop = min(start + self.window_samples, self.num_samples)
+            yield (start, stop, max(0, start - overlap),
+                   min(self.num_samples, stop + overlap))
+
+    def split_columns(self):
+        """
+        Parses the .csv in chunks into raw column files (streaming reductions)
+
+        :sets voltage_extremes: tuple (min_voltage, max_voltage)
+        :sets duration: length (time) of data read
+        :sets validation: dict reported by the validation stage (counts
+                          summed over the chunks)
+        :raises ImportError: the .csv is malformed
+        """
+        from import_csv import iter_csv_chunks
+        from csv_validation import (sniff_csv, validate_columns, check_fs,
+                                    estimate_fs)
+        sniff_csv(self.target_csv_path)
+        self.validation = {'rows': 0, 'nan_timestamps': 0,
+                           'nan_voltages': 0, 'non_increasing': 0,
+                           'fs': float('nan'), 'repaired': False}
+        previous = None
+        min_voltage = np.inf
+        max_voltage = -np.inf
+        min_ts = np.inf
+        max_ts = -np.inf
+        with open(self.ts_path, 'wb') as ts_file, \
+                open(self.voltage_path, 'wb') as voltage_file:
+            chunks = iter_csv_chunks(self.target_csv_path,
+                                     self.window_samples)
+            while True:
+                try:
+                    timestamps, voltages = next(chunks)
+                except StopIteration:
+                    break
+                except ValueError as error:
+                    raise ImportError('%s is not a valid csv: %s' %
+                                      (self.target_csv_path, error))
+                if(previous is not None):
+                    # CRV last kept row: timestamps must rise across chunks
+                    timestamps = np.concatenate((previous[:1], timestamps))
+                    voltages = np.concatenate((previous[1:], voltages))
+                timestamps, voltages, report = validate_columns(
+                    timestamps, voltages, self.on_invalid, fs_range=None,
+                    source=self.target_csv_path)
+                if(previous is not None):
+                    timestamps = timestamps[1:]
+                    voltages = voltages[1:]
+                    report['rows'] -= 1
+                for key in ('rows', 'nan_timestamps', 'nan_voltages',
+                            'non_increasing'):
+                    self.validation[key] += report[key]
+                self.validation['repaired'] |= report['repaired']
+                if(len(timestamps) == 0):
+                    continue
+                previous = np.array([timestamps[-1], voltages[-1]])
+                if(self.first_ts is None):
+                    self.first_ts = timestamps[0]
+                self.last_ts = timestamps[-1]
+                min_voltage = min(min_voltage, voltages.min())
+                max_voltage = max(max_voltage, voltages.max())
+                min_ts = min(min_ts, timestamps.min())
+                max_ts = max(max_ts, timestamps.max())
+                timestamps.tofile(ts_file)
+                voltages.tofile(voltage_file)
+                self.num_samples += len(voltages)
+        if(self.num_samples == 0):
+            raise ImportError(self.target_csv_path + ' has no data')
+        # CRV estimate_fs reads only a sample of spacings from the memmap
+        self.validation['fs'] = estimate_fs(np.memmap(
+            self.ts_path, dtype=np.float64, mode='r'))
+        check_fs(self.validation['fs'], source=self.target_csv_path)
+        if(self.validation['repaired']):
+            logger.warning('%s repaired: %s', self.target_csv_path,
+                           self.validation)
+        self.voltage_extremes = (min_voltage, max_voltage)
+        self.duration = max_ts - min_ts
+
+    def select_voltage(self, rank):
+        """
+        Value at a rank of the sorted voltages, in bounded memory
+
+        Each pass histograms the voltages inside [low, high] and narrows
+        the range to the bin holding rank. When that bin holds at most
+        window_samples values, they are read and np.partition picks the
+        value; otherwise one more pass shrinks [low, high] to the bin's
+        smallest and largest value.
+
+        :param rank: index into the sorted voltages
+        :returns (value, num_at_most): the value and how many voltages
+                                       are <= it
+        """
+        low, high = self.voltage_extremes
+        below = 0
+        num_inside = self.num_samples
+        while low < high:
+            counts = np.zeros(MEDIAN_BINS, dtype=np.int64)
+            for start, stop, read_start, read_stop in self.windows():
+                voltages = read_window(self.voltage_path, start, stop)
+                inside, bins = bin_voltages(voltages, low, high)
+                counts += np.bincount(bins, minlength=MEDIAN_BINS)
+            cumulative = np.cumsum(counts)
+            rank_bin = np.searchsorted(cumulative, rank - below,
+                                       side='right')
+            below += int(cumulative[rank_bin] - counts[rank_bin])
+            num_inside = int(counts[rank_bin])
+            values = []
+            bin_low = np.inf
+            bin_high = -np.inf
+            for start, stop, read_start, read_stop in self.windows():
+                voltages = read_window(self.voltage_path, start, stop)
+                inside, bins = bin_voltages(voltages, low, high)
+                inside = inside[bins == rank_bin]
+                if(len(inside) == 0):
+                    continue
+                if(num_inside <= self.window_samples):
+                    values.append(inside)
+                else:
+                    bin_low = min(bin_low, inside.min())
+                    bin_high = max(bin_high, inside.max())
+            if(num_inside <= self.window_samples):
+                values = np.concatenate(values)
+                value = np.partition(values, rank - below)[rank - below]
+                return(value, below + int(np.count_nonzero(values <= value)))
+            low, high = bin_low, bin_high
+        # CRV every remaining value is the same
+        return(low, below + num_inside)
+
+    def exact_median(self, shift):
+        """
+        Median of the (shifted) voltages without loading them all
+
+        :param shift: value added to every voltage (as find_beats does)
+        :returns median: same value as np.median(voltages + shift)
+        """
+        # CRV lower middle value; np.median averages it with the next one
+        lower, num_at_most = self.select_voltage((self.num_samples - 1) // 2)
+        upper = lower
+        if(num_at_most <= self.num_samples // 2):
+            # CRV even count and the next rank holds a larger value
+            upper = np.inf
+            for start, stop, read_start, read_stop in self.windows():
+                voltages = read_window(self.voltage_path, start, stop)
+                above = voltages[voltages > lower]
+                if(len(above) > 0):
+                    upper = min(upper, above.min())
+        return(float(np.mean(np.array([lower, upper]) + shift)))
+
+    def find_beats(self):
+        """
+        Detects beats window by window with the find_beats threshold rule
+
+        :sets num_beats: number of detected beats in ECG data
+        :sets beats: numpy array of timestamps when beats occurred
+        :sets heart_beat_voltages: numpy array of voltages at those beats
+        """
+        shift = 1.0 if self.voltage_extremes[0] < 0 else 0.0
+        median = self.exact_median(shift)
+        found = self.detect_peaks(shift, median, median)
+        if(len(found[0]) == 0):
+            logger.info('0 peaks found w/ thres=median. Retry thres=0.9')
+            found = self.detect_peaks(shift, 0.9, median)
+        self.beats, self.heart_beat_voltages = found
+        self.num_beats = len(self.beats)
+        if(self.num_beats == 0):
+            logger.warning('NO BEATS DETECTED')
+
+    def detect_peaks(self, shift, thres, median):
+        """
+        Runs peak_detection.indexes on overlapping windows and merges them
+
+        :param shift: value added to every voltage
+        :param thres: threshold normalized to the shifted extremes
+        :param median: median of the shifted voltages (final check)
+        :returns (beats, heart_beat_voltages): numpy arrays
+        """
+        from peak_detection import indexes
+        low = self.voltage_extremes[0] + shift
+        high = self.voltage_extremes[1] + shift
+        absolute_thres = thres * (high - low) + low
+        beats = []
+        beat_voltages = []
+        for start, stop, read_start, read_stop in self.windows(
+                self.overlap_samples):
+            voltages = read_window(self.voltage_path, read_start, read_stop)
+            shifted = voltages + shift if shift else voltages
+            peaks = indexes(shifted, absolute_thres, thres_abs=True)
+            # CRV keep peaks owned by this window that pass find_beats' check
+            owned = (peaks >= start - read_start) & (peaks < stop - read_start)
+            peaks = peaks[owned & (shifted[peaks] > median)]
+            if(len(peaks) > 0):
+                timestamps = read_window(self.ts_path, read_start, read_stop)
+                beats.append(timestamps[peaks])
+                beat_voltages.append(voltages[peaks])
+        if(len(beats) == 0):
+            return(np.array([]), np.array([]))
+        return(np.concatenate(beats), np.concatenate(beat_voltages))
+
+    def calc_mean_hr_bpm(self, start_ts=None, end_ts=None):
+        """
+        Calculates the mean heart rate (BPM) over a specified time range
+
+        :param start_ts: start range (seconds). Default: first timestamp
+        :param end_ts: end range (seconds). Default: last timestamp
+        :sets mean_hr_bpm: mean heart rate (BPM) over specified time range
+        """
+        start_ts = self.first_ts if start_ts is None else start_ts
+        end_ts = self.last_ts if end_ts is None else end_ts
+        sorted_beats = np.sort(self.beats)
+        num_beats = (np.searchsorted(sorted_beats, end_ts, side='right') -
+                     np.searchsorted(sorted_beats, start_ts, side='left'))
+        self.mean_hr_bpm = int(num_beats) / ((end_ts - start_ts) / 60)
+        logger.info('__mean_hr_bpm: %s', self.mean_hr_bpm)
+
+    def build_results(self):
+        """
+        :returns results: dict with mean_hr_bpm, voltage_extremes, duration,
+                          num_beats, beats (numpy array) and the hrv metrics
+        """
+        from hrv import hrv_metrics
+        results = {'mean_hr_bpm': self.mean_hr_bpm,
+                   'voltage_extremes': self.voltage_extremes,
+                   'duration': self.duration,
+                   'num_beats': self.num_beats,
+                   'beats': self.beats}
+        results.update(hrv_metrics(self.beats))
+        return(results)
+
+    def build_json(self):
+        """
+        Creates and outputs the results file with ECG analysis
+        """
+        from results_writer import encode_results, write_atomic, FORMATS
+        contents = encode_results(self.build_results(), self.output_format)
+        csv_filename = os.path.basename(self.target_csv_path)
+        filename = (os.path.splitext(csv_filename)[0] +
+                    FORMATS[self.output_format][0])
+        write_atomic(os.path.join(self.output_dir, filename), contents)
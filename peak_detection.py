@@ -0,0 +1,195 @@
+import numpy as np
+
+
+def indexes(y, thres=0.3, min_dist=1, thres_abs=False):
+    """
+    Finds peaks in a data set (pure NumPy, same results as peakutils.indexes)
+
+    Peaks are found from sign changes of the first order difference. Flat
+    tops (plateaus) are resolved to their middle sample the way peakutils
+    does, without a Python loop over plateaus.
+
+    :param y: numpy array to find peaks in
+    :param thres: threshold, normalized to [min(y), max(y)] unless thres_abs
+    :param min_dist: minimum distance (samples) between peaks, i.e. the
+                     refractory period. The highest peak is kept.
+    :param thres_abs: if True, thres is an absolute value
+    :returns indexes: numpy array of the indexes of the detected peaks
+    """
+    y = np.asarray(y)
+    if(len(y) < 3):
+        return(np.array([], dtype=np.int64))
+    if(not thres_abs):
+        low = y.min()
+        thres = thres * (y.max() - low) + low
+    dy = np.diff(y)
+    # CRV every change of level: first index of the new level + direction
+    changes = np.flatnonzero(dy)
+    rising = dy[changes] > 0
+    tops = np.flatnonzero(rising[:-1] & ~rising[1:])
+    # CRV plateau y[a:b + 1] peaks at its middle sample (a + b) // 2
+    peaks = (changes[tops] + changes[tops + 1] + 1) // 2
+    peaks = peaks[y[peaks] > thres]
+    if(len(peaks) > 1 and min_dist > 1):
+        peaks = suppress_close_peaks(y, peaks, int(min_dist))
+    return(peaks)
+
+
+def suppress_close_peaks(y, peaks, min_dist):
+    """
+    Drops peaks within min_dist samples of a higher peak
+
+    :param y: numpy array the peaks were found in
+    :param peaks: sorted numpy array of peak indexes
+    :param min_dist: minimum distance (samples) between peaks
+    :returns peaks: numpy array of the remaining peak indexes
+    """
+    # CRV neighbours of each peak: peaks[starts[k]:stops[k]]
+    starts = np.searchsorted(peaks, peaks - min_dist, side='left')
+    stops = np.searchsorted(peaks, peaks + min_dist, side='right')
+    isolated = stops - starts == 1
+    if(isolated.all()):
+        return(peaks)
+    removed = np.zeros(len(peaks), dtype=bool)
+    # CRV only peaks with close neighbours need the greedy pass
+    for k in np.argsort(y[peaks])[::-1]:
+        if(not removed[k] and not isolated[k]):
+            removed[starts[k]:stops[k]] = True
+            removed[k] = False
+    return(peaks[~removed])
+
+
+# CRV shortest segment worth a thread of its own
+MIN_SEGMENT_SAMPLES = 2 ** 16
+
+
+def segment_extremes(y, start, stop):
+    """
+    :returns (min, max): extremes of y[start:stop]
+    """
+    segment = y[start:stop]
+    return(segment.min(), segment.max())
+
+
+def segment_peaks(y, start, stop, thres):
+    """
+    Runs the indexes level-change pass over dy[start:stop]
+
+    :param y: numpy array to find peaks in
+    :param start: first index of the first order difference
+    :param stop: one past the last index of the difference
+    :param thres: absolute threshold
+    :returns (peaks, first, last): peaks with both level changes inside
+             the segment, and the (index, rising) of the first and last
+             level change (None if the segment is flat)
+    """
+    dy = y[start + 1:stop + 1] - y[start:stop]
+    changes = np.flatnonzero(dy)
+    if(len(changes) == 0):
+        return(np.array([], dtype=np.int64), None, None)
+    rising = dy[changes] > 0
+    changes += start
+    tops = np.flatnonzero(rising[:-1] & ~rising[1:])
+    peaks = (changes[tops] + changes[tops + 1] + 1) // 2
+    peaks = peaks[y[peaks] > thres]
+    return(peaks, (changes[0], rising[0]), (changes[-1], rising[-1]))
+
+
+def parallel_indexes(y, thres=0.3, min_dist=1, thres_abs=False, workers=None,
+                     segment_samples=None):
+    """
+    Same results as indexes, with the work split across threads
+
+    The signal is cut into contiguous segments. Every thread finds the
+    level changes and peaks inside its segment (NumPy releases the GIL);
+    a peak whose rising and falling change lie in different segments is
+    stitched from the last change of one segment and the first change of
+    the next, so flat tops of any length across a seam are found exactly
+    once. min_dist is applied to the merged peaks.
+
+    :param y: numpy array to find peaks in
+    :param thres: threshold, normalized to [min(y), max(y)] unless thres_abs
+    :param min_dist: minimum distance (samples) between peaks
+    :param thres_abs: if True, thres is an absolute value
+    :param workers: number of threads. Default: os.cpu_count()
+    :param segment_samples: samples per segment. Default: len(y) / workers
+                            (at least MIN_SEGMENT_SAMPLES)
+    :returns indexes: numpy array of the indexes of the detected peaks
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    y = np.asarray(y)
+    workers = workers or os.cpu_count()
+    if(segment_samples is None):
+        segment_samples = max(MIN_SEGMENT_SAMPLES, -(-len(y) // workers))
+    if(len(y) < 3 or workers == 1 or segment_samples >= len(y) - 1):
+        return(indexes(y, thres, min_dist, thres_abs))
+    bounds = [(start, min(start + segment_samples, len(y) - 1))
+              for start in range(0, len(y) - 1, segment_samples)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if(not thres_abs):
+            extremes = list(executor.map(
+                lambda bound: segment_extremes(y, *bound),
+                [(start, stop) for start, stop in bounds[:-1]] +
+                [(bounds[-1][0], len(y))]))
+            low = min(extreme[0] for extreme in extremes)
+            high = max(extreme[1] for extreme in extremes)
+            thres = thres * (high - low) + low
+        segments = list(executor.map(
+            lambda bound: segment_peaks(y, bound[0], bound[1], thres),
+            bounds))
+    merged = []
+    previous = None
+    for peaks, first, last in segments:
+        if(first is None):
+            continue
+        # CRV rising change ends one segment, falling change starts this one
+        if(previous is not None and previous[1] and not first[1]):
+            seam_peak = (previous[0] + first[0] + 1) // 2
+            if(y[seam_peak] > thres):
+                merged.append(np.array([seam_peak], dtype=np.int64))
+        merged.append(peaks)
+        previous = last
+    peaks = (np.concatenate(merged) if merged else
+             np.array([], dtype=np.int64))
+    if(len(peaks) > 1 and min_dist > 1):
+        peaks = suppress_close_peaks(y, peaks, int(min_dist))
+    return(peaks)
+
+
+def fuse_column_peaks(columns, peaks, min_columns, tolerance):
+    """
+    Fuses per-column peaks that line up in time (e.g. one beat on leads)
+
+    Every peak is a candidate; it gets one vote from each column with a
+    peak within tolerance of it. Candidates with at least min_columns
+    votes are grouped (a gap above tolerance starts a new group) and each
+    group becomes one fused peak at the median accepted candidate, so a
+    noisy column can neither outvote nor drag the agreeing ones.
+
+    :param columns: numpy array of the column of every peak
+    :param peaks: numpy array of the row of every peak
+    :param min_columns: columns that must agree on a peak
+    :param tolerance: largest distance (rows) between agreeing peaks
+    :returns peaks: sorted numpy array of fused peak rows
+    """
+    if(len(peaks) == 0):
+        return(np.array([], dtype=np.int64))
+    order = np.lexsort((peaks, columns))
+    columns = columns[order]
+    peaks = peaks[order]
+    votes = np.zeros(len(peaks), dtype=np.int64)
+    for column in np.unique(columns):
+        column_peaks = peaks[columns == column]
+        low = np.searchsorted(column_peaks, peaks - tolerance, side='left')
+        high = np.searchsorted(column_peaks, peaks + tolerance, side='right')
+        votes += high > low
+    accepted = np.sort(peaks[votes >= min_columns])
+    if(len(accepted) == 0):
+        return(accepted)
+    starts = np.empty(len(accepted), dtype=bool)
+    starts[0] = True
+    starts[1:] = np.diff(accepted) > tolerance
+    counts = np.bincount(np.cumsum(starts) - 1)
+    # CRV lower median of each group
+    return(accepted[np.flatnonzero(starts) + (counts - 1) // 2])
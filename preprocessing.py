@@ -0,0 +1,213 @@
+"""
+Vectorized ECG preprocessing ahead of peak detection
+
+Every filter here is a weighted sum of centered moving averages, computed
+from one running sum (np.cumsum) of the signal: a moving-average baseline
+removal is x - MA_long(x), a bandpass is MA_short(x) - MA_long(x). The
+output is written block by block into one array, so the only full-length
+buffers are the running sum and the result. Windows shrink at the edges
+of the signal instead of padding it.
+"""
+import numpy as np
+
+# CRV samples filtered per block (bounds the temporary index arrays)
+BLOCK_SAMPLES = 2 ** 16
+
+
+def odd_window(fs, secs):
+    """
+    :param fs: sampling rate (Hz)
+    :param secs: window length (seconds)
+    :returns window: window length in samples, rounded to an odd number >= 1
+    """
+    return(max(1, int(round(fs * secs))) | 1)
+
+
+def estimate_fs(timestamps):
+    """
+    :param timestamps: numpy array of increasing timestamps (seconds)
+    :returns fs: mean sampling rate (Hz)
+    :raises ValueError: fewer than two samples or zero duration
+    """
+    if(len(timestamps) < 2 or timestamps[-1] == timestamps[0]):
+        raise ValueError('need two distinct timestamps to estimate fs')
+    return((len(timestamps) - 1) / float(timestamps[-1] - timestamps[0]))
+
+
+def filter_moving_averages(x, terms, out=None):
+    """
+    Computes sum(weight * moving_average(x, window)) in one pass
+
+    :param x: 1-D numpy array
+    :param terms: list of (window, weight); window 1 is x itself
+    :param out: float64 array of len(x) to write into. Default: new array
+    :returns out: filtered signal
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if(out is None):
+        out = np.empty(n)
+    running = np.empty(n + 1)
+    running[0] = 0.0
+    np.cumsum(x, out=running[1:])
+    for start in range(0, n, BLOCK_SAMPLES):
+        stop = min(start + BLOCK_SAMPLES, n)
+        index = np.arange(start, stop)
+        block = out[start:stop]
+        block[:] = 0.0
+        for window, weight in terms:
+            if(window == 1):
+                block += weight * x[start:stop]
+                continue
+            half = window // 2
+            low = np.maximum(index - half, 0)
+            high = np.minimum(index + half + 1, n)
+            block += weight * (running[high] - running[low]) / (high - low)
+    return(out)
+
+
+def moving_average(x, window, out=None):
+    """
+    :param x: 1-D numpy array
+    :param window: odd window length (samples)
+    :param out: optional output array
+    :returns average: centered moving average of x
+    """
+    return(filter_moving_averages(x, [(window, 1.0)], out))
+
+
+def remove_baseline(x, window, out=None):
+    """
+    :param x: 1-D numpy array
+    :param window: odd window length (samples), longer than a beat
+    :param out: optional output array
+    :returns detrended: x minus its centered moving average
+    """
+    return(filter_moving_averages(x, [(1, 1.0), (window, -1.0)], out))
+
+
+def bandpass_terms(fs, low_hz, high_hz):
+    """
+    :param fs: sampling rate (Hz)
+    :param low_hz: lower corner (Hz)
+    :param high_hz: upper corner (Hz)
+    :returns terms: (window, weight) list for filter_moving_averages
+    :raises ValueError: low_hz >= high_hz
+    """
+    if(low_hz >= high_hz):
+        raise ValueError('low_hz must be below high_hz')
+    return([(odd_window(fs, 1.0 / high_hz), 1.0),
+            (odd_window(fs, 1.0 / low_hz), -1.0)])
+
+
+def bandpass(x, fs, low_hz=0.5, high_hz=40.0, out=None):
+    """
+    Moving-average bandpass: MA over 1/high_hz minus MA over 1/low_hz
+
+    :param x: 1-D numpy array
+    :param fs: sampling rate (Hz)
+    :param low_hz: lower corner (Hz), removes baseline wander
+    :param high_hz: upper corner (Hz), removes high frequency noise
+    :param out: optional output array
+    :returns filtered: bandpassed signal
+    :raises ValueError: low_hz >= high_hz
+    """
+    return(filter_moving_averages(x, bandpass_terms(fs, low_hz, high_hz),
+                                  out))
+
+
+def downsample(x, factor):
+    """
+    :param x: numpy array (already low-passed to avoid aliasing)
+    :param factor: keep every factor-th sample
+    :returns downsampled: strided view of x (no copy)
+    """
+    return(x[::factor])
+
+
+class Preprocessor:
+    """
+    Composable preprocessing stage run by HeartRateMonitor.find_beats
+
+    The enabled steps are fused into one filter_moving_averages pass:
+    a bandpass already removes the baseline, so baseline_secs only
+    applies when band is None.
+
+    :param band: (low_hz, high_hz) bandpass corners, or None
+    :param baseline_secs: moving-average baseline window (seconds), or None
+    :param downsample_factor: detect peaks on every n-th filtered sample
+                              (peaks are then refined at the full rate)
+    :param thres: peak threshold, relative to the filtered signal's range
+    :param refractory_secs: shortest time between two beats (seconds)
+    :param fs: sampling rate (Hz). Default: estimated from the timestamps
+    """
+    def __init__(self, band=(0.5, 40.0), baseline_secs=None,
+                 downsample_factor=1, thres=0.6, refractory_secs=0.25,
+                 fs=None):
+        if(int(downsample_factor) < 1):
+            raise ValueError('downsample_factor must be >= 1')
+        self.band = band
+        self.baseline_secs = baseline_secs
+        self.downsample_factor = int(downsample_factor)
+        self.thres = thres
+        self.refractory_secs = refractory_secs
+        self.fs = fs
+
+    def sampling_rate(self, timestamps):
+        """
+        :param timestamps: numpy array of timestamps (seconds)
+        :returns fs: the fs parameter, or the rate estimated from timestamps
+        """
+        return(self.fs or estimate_fs(timestamps))
+
+    def refractory_samples(self, timestamps):
+        """
+        :param timestamps: numpy array of timestamps (seconds)
+        :returns min_dist: refractory period in samples (>= 1)
+        """
+        return(max(1, int(self.refractory_secs *
+                          self.sampling_rate(timestamps))))
+
+    def terms(self, fs):
+        """
+        :param fs: sampling rate (Hz)
+        :returns terms: (window, weight) list for filter_moving_averages
+        """
+        if(self.band is not None):
+            return(bandpass_terms(fs, *self.band))
+        if(self.baseline_secs is not None):
+            return([(1, 1.0), (odd_window(fs, self.baseline_secs), -1.0)])
+        return([(1, 1.0)])
+
+    def apply(self, timestamps, voltages):
+        """
+        :param timestamps: numpy array of timestamps (seconds)
+        :param voltages: numpy array of voltages
+        :returns filtered: full-rate filtered voltages (new array)
+        """
+        return(filter_moving_averages(
+            voltages, self.terms(self.sampling_rate(timestamps))))
+
+    def downsample(self, filtered):
+        """
+        :param filtered: full-rate output of apply
+        :returns downsampled: strided view used for peak detection
+        """
+        return(downsample(filtered, self.downsample_factor))
+
+    def refine_peaks(self, filtered, peaks):
+        """
+        Maps peaks found on downsample(filtered) back to full-rate indexes
+
+        :param filtered: full-rate output of apply
+        :param peaks: indexes into the downsampled signal
+        :returns peaks: indexes of the local maxima of filtered
+        """
+        factor = self.downsample_factor
+        if(factor == 1 or len(peaks) == 0):
+            return(peaks)
+        offsets = np.arange(-factor + 1, factor)
+        candidates = np.clip(peaks[:, np.newaxis] * factor + offsets, 0,
+                             len(filtered) - 1)
+        best = np.argmax(filtered[candidates], axis=1)
+        return(np.unique(candidates[np.arange(len(peaks)), best]))
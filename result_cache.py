@@ -0,0 +1,193 @@
+"""
+Memoization of HeartRateMonitor results keyed by content hash
+
+The key is a SHA-256 of the .csv bytes plus the detection parameters, so
+a re-exported or duplicated recording hits the same entry whatever its
+path or mtime, and changing peak_detector/preprocess misses. Entries are
+small .npz files in a local directory, evicted least recently used once
+the directory grows past max_bytes.
+"""
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULT_CACHE_DIR = 'result_cache/'
+# CRV results are tiny next to the csv cache; 256 MiB is ~10^5 recordings
+DEFAULT_RESULT_CACHE_MAX_BYTES = 2 ** 28
+# CRV bump when detection changes so stale entries stop matching
+RESULT_CACHE_VERSION = 1
+RESULT_KEYS = ('beats', 'heart_beat_voltages', 'num_beats', 'mean_hr_bpm',
+               'voltage_extremes', 'duration')
+# CRV multi-lead results only: every lead's beats, concatenated
+LEAD_RESULT_KEYS = ('lead_beats', 'lead_num_beats')
+
+
+def file_digest(target_path, block_size=2 ** 20):
+    """
+    :param target_path: file to hash
+    :param block_size: bytes read from disk at a time
+    :returns digest: SHA-256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(target_path, 'rb') as target_file:
+        block = target_file.read(block_size)
+        while block:
+            digest.update(block)
+            block = target_file.read(block_size)
+    return(digest.hexdigest())
+
+
+def arrays_digest(*arrays):
+    """
+    :param arrays: numpy arrays (e.g. parsed timestamps and voltages)
+    :returns digest: SHA-256 hex digest of their float64 contents
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode('ascii'))
+        digest.update(array.data)
+    return(digest.hexdigest())
+
+
+class ResultCache:
+    """
+    Disk-backed LRU store of analysis results
+
+    :param cache_dir: directory holding the .npz entries
+    :param max_bytes: size bound for all entries together
+    :attr hits: lookups answered from the cache
+    :attr misses: lookups that found no entry
+    """
+    def __init__(self, cache_dir=DEFAULT_RESULT_CACHE_DIR,
+                 max_bytes=DEFAULT_RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # CRV (abspath, mtime_ns, size) -> digest, so unchanged files are
+        # only hashed once per process
+        self.digests = {}
+
+    def csv_digest(self, target_csv_path):
+        """
+        :param target_csv_path: path for .csv data
+        :returns digest: SHA-256 hex digest of the .csv contents
+        """
+        stat = os.stat(target_csv_path)
+        version = (os.path.abspath(target_csv_path), stat.st_mtime_ns,
+                   stat.st_size)
+        if(version not in self.digests):
+            self.digests[version] = file_digest(target_csv_path)
+        return(self.digests[version])
+
+    def key(self, content_digest, params):
+        """
+        :param content_digest: digest of the .csv (or of the parsed arrays)
+        :param params: dict of detection parameters (JSON serializable)
+        :returns key: hex key of the cache entry
+        """
+        described = json.dumps({'content': content_digest,
+                                'params': params,
+                                'version': RESULT_CACHE_VERSION},
+                               sort_keys=True)
+        return(hashlib.sha256(described.encode('utf-8')).hexdigest())
+
+    def entry_path(self, key):
+        """
+        :param key: hex key returned by key()
+        :returns entry_path: .npz file of the entry
+        """
+        return(os.path.join(self.cache_dir, key + '.npz'))
+
+    def entries(self):
+        """
+        :returns entries: list of (path, size, last_used) for every entry
+        """
+        if(not os.path.isdir(self.cache_dir)):
+            return([])
+        found = []
+        for filename in os.listdir(self.cache_dir):
+            if(filename.endswith('.npz')):
+                path = os.path.join(self.cache_dir, filename)
+                stat = os.stat(path)
+                found.append((path, stat.st_size, stat.st_mtime))
+        return(found)
+
+    def load(self, key):
+        """
+        :param key: hex key returned by key()
+        :returns results: dict of RESULT_KEYS (plus LEAD_RESULT_KEYS when
+                          stored), or None on a miss
+        """
+        path = self.entry_path(key)
+        try:
+            with np.load(path) as entry:
+                results = {name: entry[name] for name in RESULT_KEYS +
+                           LEAD_RESULT_KEYS if name in entry}
+                missing = set(RESULT_KEYS) - set(results)
+            if(missing):
+                raise KeyError(missing)
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return(None)
+        # CRV touch the entry so eviction is least recently used
+        os.utime(path)
+        self.hits += 1
+        logger.info('result cache hit: %s', path)
+        results['num_beats'] = int(results['num_beats'])
+        results['mean_hr_bpm'] = float(results['mean_hr_bpm'])
+        results['duration'] = float(results['duration'])
+        results['voltage_extremes'] = tuple(
+            float(value) for value in results['voltage_extremes'])
+        return(results)
+
+    def store(self, key, results):
+        """
+        Writes the results of one analysis (atomically)
+
+        :param key: hex key returned by key()
+        :param results: dict holding at least RESULT_KEYS (and optionally
+                        LEAD_RESULT_KEYS)
+        """
+        from results_writer import encode_npz, write_atomic
+        if(not os.path.isdir(self.cache_dir)):
+            os.makedirs(self.cache_dir)
+        write_atomic(self.entry_path(key), encode_npz(
+            {name: results[name] for name in RESULT_KEYS + LEAD_RESULT_KEYS
+             if name in results}))
+        logger.info('result cache stored: %s', key)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits max_bytes
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for path, size, last_used in entries)
+        for path, size, last_used in entries:
+            if(total <= self.max_bytes):
+                break
+            os.remove(path)
+            total -= size
+            logger.info('result cache evicted: %s', path)
+
+    def clear(self):
+        """
+        Removes every cache entry
+        """
+        for path, size, last_used in self.entries():
+            os.remove(path)
+
+    def stats(self):
+        """
+        :returns stats: dict with hits, misses, entries and bytes
+        """
+        entries = self.entries()
+        return({'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(entries),
+                'bytes': sum(size for path, size, last_used in entries)})
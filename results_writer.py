@@ -0,0 +1,142 @@
+"""
+Encodes HeartRateMonitor results once and writes them atomically
+
+Formats: 'json' (default), 'msgpack' (needs the optional msgpack package)
+and 'npz' (binary numpy arrays, cheapest for long beats arrays).
+"""
+import io
+import json
+import os
+import tempfile
+import numpy as np
+
+# CRV permissions of new files, see file_mode
+_FILE_MODE = None
+
+
+def array_to_builtin(values):
+    """
+    :param values: numpy array
+    :returns values: nested lists, with None for NaN and +/-inf
+    """
+    if(values.dtype.kind in 'fc'):
+        finite = np.isfinite(values)
+        if(not finite.all()):
+            values = values.astype(object)
+            values[~finite] = None
+    return(values.tolist())
+
+
+def results_to_builtin(results):
+    """
+    Converts numpy values in a results dict to plain python types
+
+    Non-finite floats (e.g. the HRV metrics of a recording with too few
+    beats) become None, which JSON writes as null.
+
+    :param results: dict of metrics (numpy arrays, numpy scalars, tuples)
+    :returns results: dict of lists, floats, ints and None
+    """
+    builtin = {}
+    for key, value in results.items():
+        if(isinstance(value, tuple)):
+            builtin[key] = [array_to_builtin(np.asarray(item))
+                            for item in value]
+        else:
+            builtin[key] = array_to_builtin(np.asarray(value))
+    return(builtin)
+
+
+def encode_json(results):
+    """
+    :param results: dict of metrics
+    :returns contents: compact utf-8 JSON bytes (strict: no NaN/Infinity)
+    """
+    return(json.dumps(results_to_builtin(results), separators=(',', ':'),
+                      allow_nan=False).encode('utf-8'))
+
+
+def encode_msgpack(results):
+    """
+    :param results: dict of metrics
+    :returns contents: MessagePack bytes
+    :raises ImportError: msgpack is not installed
+    """
+    from optional_imports import optional_import
+    msgpack = optional_import('msgpack')
+    return(msgpack.packb(results_to_builtin(results)))
+
+
+def encode_npz(results):
+    """
+    :param results: dict of metrics
+    :returns contents: .npz bytes, one array per metric (np.load to read)
+    """
+    contents = io.BytesIO()
+    np.savez(contents, **{key: np.asarray(value)
+                          for key, value in results.items()})
+    return(contents.getvalue())
+
+
+FORMATS = {
+    'json': ('.json', encode_json),
+    'msgpack': ('.msgpack', encode_msgpack),
+    'npz': ('.npz', encode_npz),
+}
+
+
+def encode_results(results, output_format='json'):
+    """
+    Encodes a results dict in one of the FORMATS
+
+    :param results: dict of metrics
+    :param output_format: key of FORMATS
+    :returns contents: encoded bytes
+    :raises ValueError: unknown output_format
+    """
+    if(output_format not in FORMATS):
+        raise ValueError('output_format must be one of ' +
+                         str(sorted(FORMATS)))
+    return(FORMATS[output_format][1](results))
+
+
+def file_mode():
+    """
+    :returns mode: permissions open() gives a new file (0o666 minus the
+                   process umask, read once)
+    """
+    global _FILE_MODE
+    if(_FILE_MODE is None):
+        umask = os.umask(0)
+        os.umask(umask)
+        _FILE_MODE = 0o666 & ~umask
+    return(_FILE_MODE)
+
+
+def write_atomic(path, contents):
+    """
+    Writes bytes to a temporary file next to path, then renames it
+
+    Readers see either the old file or the complete new one, never a
+    partial write, and no existence check/remove is needed beforehand.
+    The data is synced to disk before the rename, so a crash cannot leave
+    an empty or truncated file under the new name, and the file gets the
+    usual umask permissions (mkstemp alone creates it 0600).
+
+    :param path: destination file
+    :param contents: bytes to write
+    """
+    directory = os.path.dirname(path) or '.'
+    handle, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as tmp_file:
+            if(hasattr(os, 'fchmod')):
+                os.fchmod(tmp_file.fileno(), file_mode())
+            tmp_file.write(contents)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
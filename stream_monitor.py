@@ -0,0 +1,231 @@
+import logging
+import numpy as np
+logger = logging.getLogger(__name__)
+
+# CRV samples kept for the rolling threshold (~6 s at 333 Hz)
+DEFAULT_WINDOW_SAMPLES = 2048
+# CRV beats closer than this (seconds) are treated as the same beat
+DEFAULT_REFRACTORY_SECS = 0.2
+DEFAULT_CHUNK_ROWS = 1024
+
+
+def iter_csv_chunks(csv_stream, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Reads (timestamps, voltages) chunks from a file-like .csv stream
+
+    Works with open files and sockets (socket.makefile('r')).
+
+    :param csv_stream: file-like object yielding 'time,voltage' lines
+    :param chunk_rows: lines parsed per chunk
+    :returns generator: (timestamps, voltages) numpy array pairs
+    """
+    lines = []
+    for line in csv_stream:
+        if(line.strip()):
+            lines.append(line)
+        if(len(lines) == chunk_rows):
+            chunk = np.loadtxt(lines, delimiter=',', ndmin=2)
+            yield chunk[:, 0], chunk[:, 1]
+            lines = []
+    if(len(lines) > 0):
+        chunk = np.loadtxt(lines, delimiter=',', ndmin=2)
+        yield chunk[:, 0], chunk[:, 1]
+
+
+class StreamingHeartRateMonitor:
+    """
+    Detects beats incrementally in a live ECG feed
+
+    Samples are fed in chunks. State is bounded by window_samples no matter
+    how long the stream runs: the threshold is recomputed for every chunk
+    from the last window_samples voltages, using the same rule as
+    HeartRateMonitor.find_beats on the whole signal. Peaks found before
+    the first window_samples / 4 samples are held back until then, so the
+    first threshold is not computed from a handful of samples.
+
+    :param window_samples: number of recent samples kept for the threshold
+    :param refractory_secs: minimum time (seconds) between two beats
+    :attr num_beats: number of beats confirmed so far
+    :attr mean_hr_bpm: mean heart rate (bpm) over the stream so far
+    :attr last_beat: timestamp of the most recent beat (None if no beats)
+    :attr duration: time between the first and the latest sample
+    """
+    def __init__(self, window_samples=DEFAULT_WINDOW_SAMPLES,
+                 refractory_secs=DEFAULT_REFRACTORY_SECS):
+        self.window_samples = window_samples
+        self.refractory_secs = refractory_secs
+        self.num_beats = 0
+        self.last_beat = None
+        self.first_ts = None
+        self.last_ts = None
+        self.__window_ts = np.empty(window_samples)
+        self.__window_voltages = np.empty(window_samples)
+        self.__samples_seen = 0
+        self.__warmup_samples = window_samples // 4
+        self.__pending = (np.array([], dtype=np.int64), np.array([]))
+        # CRV top of an unfinished rise: (global index, voltage) or None
+        self.__rise = None
+
+    @property
+    def duration(self):
+        if(self.first_ts is None):
+            return(0.0)
+        return(self.last_ts - self.first_ts)
+
+    @property
+    def mean_hr_bpm(self):
+        if(self.duration == 0):
+            return(0.0)
+        return(self.num_beats / (self.duration / 60))
+
+    def consume(self, source):
+        """
+        Feeds every chunk of a source and yields beats as they are confirmed
+
+        :param source: iterable of (timestamps, voltages) chunks
+        :returns generator: beat timestamps (float)
+        """
+        for timestamps, voltages in source:
+            for beat in self.feed(timestamps, voltages):
+                yield beat
+
+    def feed(self, timestamps, voltages):
+        """
+        Adds a chunk of samples to the stream
+
+        :param timestamps: numpy array of sample timestamps
+        :param voltages: numpy array of sample voltages
+        :returns beats: numpy array of beat timestamps confirmed by the chunk
+        :raises ValueError: timestamps and voltages differ in length
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        voltages = np.asarray(voltages, dtype=np.float64)
+        if(len(timestamps) != len(voltages)):
+            logger.error('stream chunk with mismatched columns')
+            raise ValueError('timestamps and voltages must be equal length')
+        if(len(voltages) == 0):
+            return(np.array([]))
+        if(len(voltages) > self.window_samples):
+            # CRV keep every threshold local to at most one window
+            size = self.window_samples
+            return(np.concatenate([self.feed(timestamps[i:i + size],
+                                             voltages[i:i + size])
+                                   for i in range(0, len(voltages), size)]))
+        if(self.first_ts is None):
+            self.first_ts = timestamps[0]
+        self.last_ts = timestamps[-1]
+        start = self.__samples_seen
+        prev_voltage = None
+        if(start > 0):
+            prev_voltage = self.__window_voltages[(start - 1) %
+                                                  self.window_samples]
+        self.append_to_window(timestamps, voltages)
+        peaks, peak_voltages = self.confirm_peaks(start, prev_voltage,
+                                                  voltages)
+        if(self.__pending is not None):
+            peaks = np.concatenate((self.__pending[0], peaks))
+            peak_voltages = np.concatenate((self.__pending[1], peak_voltages))
+            if(self.__samples_seen < self.__warmup_samples):
+                self.__pending = (peaks, peak_voltages)
+                return(np.array([]))
+            self.__pending = None
+        keep = peak_voltages > self.rolling_threshold()
+        beats = self.apply_refractory(self.lookup_ts(peaks[keep]))
+        self.num_beats += len(beats)
+        if(len(beats) > 0):
+            self.last_beat = beats[-1]
+        return(beats)
+
+    def append_to_window(self, timestamps, voltages):
+        """
+        Writes a chunk into the fixed-size ring buffers
+
+        :param timestamps: numpy array of sample timestamps
+        :param voltages: numpy array of sample voltages
+        """
+        size = self.window_samples
+        first = max(0, len(voltages) - size)
+        positions = (self.__samples_seen + np.arange(first, len(voltages)))
+        self.__window_ts[positions % size] = timestamps[first:]
+        self.__window_voltages[positions % size] = voltages[first:]
+        self.__samples_seen += len(voltages)
+
+    def confirm_peaks(self, start, prev_voltage, voltages):
+        """
+        Finds local maxima whose falling edge arrived in this chunk
+
+        A plateau peak is placed at its middle sample (as peakutils does).
+
+        :param start: global index of the first sample of the chunk
+        :param prev_voltage: voltage of the sample before the chunk or None
+        :param voltages: numpy array of chunk voltages
+        :returns (peaks, peak_voltages): global indexes and their voltages
+        """
+        if(prev_voltage is None):
+            data = voltages
+            offset = start
+        else:
+            data = np.concatenate(([prev_voltage], voltages))
+            offset = start - 1
+        dy = np.diff(data)
+        changes = np.flatnonzero(dy)
+        # CRV level changes: first global index of the new level + direction
+        levels = offset + changes + 1
+        rising = dy[changes] > 0
+        level_voltages = data[changes + 1]
+        if(self.__rise is not None):
+            levels = np.concatenate(([self.__rise[0]], levels))
+            rising = np.concatenate(([True], rising))
+            level_voltages = np.concatenate(([self.__rise[1]],
+                                             level_voltages))
+        tops = np.flatnonzero(rising[:-1] & ~rising[1:])
+        peaks = (levels[tops] + levels[tops + 1] - 1) // 2
+        if(len(rising) > 0 and rising[-1]):
+            self.__rise = (levels[-1], level_voltages[-1])
+        elif(len(rising) > 0):
+            self.__rise = None
+        return(peaks, level_voltages[tops])
+
+    def rolling_threshold(self):
+        """
+        Threshold over the ring buffer, same rule as find_beats
+
+        :returns threshold: absolute voltage a peak must exceed
+        """
+        window = self.__window_voltages[:min(self.__samples_seen,
+                                             self.window_samples)]
+        low = window.min()
+        high = window.max()
+        shift = 1 if low < 0 else 0
+        relative = np.median(window) + shift
+        if(relative >= 1):
+            # CRV find_beats retries peakutils with thres=0.9
+            relative = 0.9
+        return(low + relative * (high - low))
+
+    def lookup_ts(self, peaks):
+        """
+        Maps global sample indexes to timestamps held in the ring buffer
+
+        :param peaks: numpy array of global sample indexes
+        :returns timestamps: numpy array of peak timestamps
+        """
+        oldest = max(0, self.__samples_seen - self.window_samples)
+        # CRV peaks on plateaus longer than the window use the oldest sample
+        peaks = np.maximum(peaks, oldest)
+        return(self.__window_ts[peaks % self.window_samples])
+
+    def apply_refractory(self, beats):
+        """
+        Drops beats within refractory_secs of the previous beat
+
+        :param beats: numpy array of candidate beat timestamps
+        :returns beats: numpy array of accepted beat timestamps
+        """
+        accepted = []
+        last_beat = self.last_beat
+        for beat in beats:
+            if(last_beat is None or beat - last_beat >= self.refractory_secs):
+                accepted.append(beat)
+                last_beat = beat
+        return(np.array(accepted))
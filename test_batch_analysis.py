@@ -0,0 +1,19 @@
+def test_find_csv_files():
+    from batch_analysis import find_csv_files
+    a = find_csv_files(['test_data/', 'test_data/*.csv'])
+    assert a == ['test_data/test_data1.csv']
+    assert find_csv_files(['fake_dir/*.csv']) == []
+
+
+def test_run_batch(tmpdir):
+    import os
+    from batch_analysis import run_batch, summarize
+    output_dir = str(tmpdir.join('json'))
+    results, elapsed = run_batch(['test_data/test_data1.csv',
+                                  'fake_dir/not_real.csv'], output_dir,
+                                 workers=2)
+    assert results[0]['num_beats'] == 35
+    assert results[0]['samples'] == 10000
+    assert results[1]['error'].startswith('ImportError')
+    assert os.path.isfile(os.path.join(output_dir, 'test_data1.json'))
+    assert '2 files (1 errors, 0 cached)' in summarize(results, elapsed)
@@ -0,0 +1,63 @@
+def test_cohort_store(tmpdir):
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from hrm_summary import HeartRateSummary
+    from cohort_store import CohortStore
+    a = HeartRateMonitor('test_data/test_data1.csv')
+    fast = HeartRateSummary('fast.csv', 150.0, (-1.0, 2.0), 10.0,
+                            np.arange(0, 10, 0.4), np.ones(25))
+    empty = HeartRateSummary('empty.csv', 0.0, (0.0, 0.0), 10.0,
+                             np.array([]), np.array([]))
+    store_dir = str(tmpdir.join('cohort'))
+    b = CohortStore(store_dir)
+    b.append(a)
+    b.extend([fast, empty])
+
+    c = CohortStore(store_dir)
+    assert len(c) == 3
+    assert c.paths == ['test_data/test_data1.csv', 'fast.csv', 'empty.csv']
+    assert np.array_equal(c['num_beats'], [35, 25, 0])
+    assert np.array_equal(c.beats_of(0), a.beats)
+    assert len(c.beats_of(2)) == 0
+    assert c.where(c['mean_hr_bpm'] > 100) == ['fast.csv']
+
+    d = c.max_windowed_hr_bpm(6.0)
+    for index in range(len(c)):
+        beats = c.beats_of(index)
+        counts = [np.sum((beats >= beat) & (beats <= beat + 6.0))
+                  for beat in beats]
+        assert d[index] == max(counts + [0]) * 10
+
+
+def test_cohort_store_uncommitted_append(tmpdir):
+    import numpy as np
+    from hrm_summary import HeartRateSummary
+    from cohort_store import CohortStore
+    store_dir = str(tmpdir.join('cohort'))
+    a = HeartRateSummary('a.csv', 60.0, (0.0, 1.0), 2.0, np.array([0.5]),
+                         np.array([1.0]))
+    b = CohortStore(store_dir)
+    b.append(a)
+    # CRV bytes written without a manifest update are not visible
+    with open(b.file_path('beats.bin'), 'ab') as beats_file:
+        np.array([9.0, 9.5]).tofile(beats_file)
+    c = CohortStore(store_dir)
+    assert np.array_equal(c['beats'], [0.5])
+    c.append(a)
+    assert np.array_equal(CohortStore(store_dir)['beats'], [0.5, 0.5])
+
+
+def test_cohort_store_uncommitted_paths(tmpdir):
+    import numpy as np
+    from hrm_summary import HeartRateSummary
+    from cohort_store import CohortStore
+    store_dir = str(tmpdir.join('cohort'))
+    a = HeartRateSummary(u'résumé.csv', 60.0, (0.0, 1.0), 2.0,
+                         np.array([0.5]), np.array([1.0]))
+    b = CohortStore(store_dir)
+    b.extend([a, a])
+    with open(b.file_path('paths.txt'), 'ab') as paths_file:
+        paths_file.write(b'partial/pa')
+    c = CohortStore(store_dir)
+    c.append(a)
+    assert CohortStore(store_dir).paths == [a.target_csv_path] * 3
@@ -0,0 +1,100 @@
+def test_validate_clean_columns():
+    import numpy as np
+    from csv_validation import validate_columns
+    timestamps = np.arange(1000) / 250.0
+    voltages = np.sin(timestamps)
+    a, b, report = validate_columns(timestamps, voltages)
+    assert a is timestamps
+    assert b is voltages
+    assert np.isclose(report['fs'], 250.0)
+    assert not report['repaired']
+
+
+def test_validate_reject_and_repair():
+    import numpy as np
+    import pytest
+    from csv_validation import validate_columns
+    timestamps = np.arange(1000) / 250.0
+    voltages = np.sin(timestamps)
+    timestamps[[10, 20]] = [np.nan, timestamps[5]]
+    voltages[[30, 999]] = np.nan
+    with pytest.raises(ImportError):
+        validate_columns(timestamps, voltages)
+    a, b, report = validate_columns(timestamps, voltages, 'repair')
+    assert (report['nan_timestamps'], report['nan_voltages'],
+            report['non_increasing']) == (1, 2, 1)
+    assert report['repaired']
+    assert len(a) == 998
+    assert np.all(np.diff(a) > 0)
+    assert not np.isnan(b).any()
+    # CRV interpolated between neighbours, held past the end
+    assert np.isclose(b[a == 30 / 250.0][0], np.sin(30 / 250.0), atol=1e-4)
+    assert b[-1] == b[-2]
+
+    with pytest.raises(ImportError):
+        validate_columns(timestamps, voltages, 'repair',
+                         max_bad_fraction=0.001)
+    with pytest.raises(ValueError):
+        validate_columns(timestamps, voltages, 'ignore')
+
+
+def test_validate_leads_and_fs():
+    import numpy as np
+    import pytest
+    from csv_validation import validate_columns
+    timestamps = np.arange(500) / 500.0
+    voltages = np.column_stack((np.cos(timestamps), np.sin(timestamps)))
+    voltages[100, 1] = np.nan
+    a, b, report = validate_columns(timestamps, voltages, 'repair')
+    assert len(a) == 500
+    assert np.allclose(b, np.column_stack((np.cos(a), np.sin(a))))
+    # CRV millisecond timestamps give an implausible sampling rate
+    with pytest.raises(ImportError):
+        validate_columns(timestamps * 1000, voltages[:, 0])
+
+
+def test_sniff_csv(tmpdir):
+    import pytest
+    from csv_validation import sniff_csv
+    sniff_csv('test_data/test_data1.csv')
+    header = tmpdir.join('header.csv')
+    header.write('time,voltage\n0,0.1\n0.003,0.2\n')
+    sniff_csv(str(header))
+    for name, contents in [('binary.csv', b'\x00\x01\x02,\x00\n'),
+                           ('empty.csv', b'\n\n'),
+                           ('text.csv', b'a,b\nc,d\ne,f\n'),
+                           ('semicolon.csv', b'0;0.1\n0.003;0.2\n')]:
+        bad = tmpdir.join(name)
+        bad.write_binary(contents)
+        with pytest.raises(ImportError):
+            sniff_csv(str(bad))
+    with pytest.raises(ImportError):
+        sniff_csv('test_data/test_data1.csv', lead_columns=(1, 2))
+
+
+def test_import_malformed_csv(tmpdir):
+    import numpy as np
+    import pytest
+    from import_csv import ImportCSV, LOADERS
+    from heart_rate_monitor import HeartRateMonitor
+    with open('test_data/test_data1.csv') as csv_file:
+        lines = csv_file.read().split('\n')
+    lines[100] = lines[100].split(',')[0] + ','
+    lines[200] = 'oops,' + lines[200].split(',')[1]
+    bad = tmpdir.join('bad.csv')
+    bad.write('\n'.join(lines))
+    for loader in LOADERS:
+        with pytest.raises(ImportError):
+            ImportCSV(str(bad), loader=loader, use_cache=False)
+        a = ImportCSV(str(bad), loader=loader, use_cache=False,
+                      on_invalid='repair')
+        assert a.validation['repaired']
+        assert len(a.timestamps) == 9999
+        assert not np.isnan(a.voltages).any()
+
+    with pytest.raises(ImportError):
+        HeartRateMonitor(str(bad), use_cache=False, lazy=True).num_beats
+    b = HeartRateMonitor(str(bad), use_cache=False, lazy=True,
+                         on_invalid='repair')
+    assert b.num_beats == 35
+    assert b.validation['nan_voltages'] == 1
@@ -0,0 +1,120 @@
+def test_registry():
+    import pytest
+    import detectors
+    assert {'numpy', 'pan_tompkins'} <= set(detectors.available_detectors())
+    assert detectors.get_detector('numpy') is detectors.numpy_detector
+    with pytest.raises(ValueError):
+        detectors.get_detector('fake')
+
+
+def test_detectors_match_numpy():
+    import numpy as np
+    import pytest
+    import detectors
+    rng = np.random.RandomState(25)
+    # CRV rounding makes plateaus, which every engine must resolve alike
+    y = np.round(rng.normal(0, 1, 5000), 1)
+    expected = detectors.numpy_detector(y, 0.5)
+    for name in ('scipy', 'peakutils'):
+        pytest.importorskip(detectors.DETECTORS[name][1])
+        found = detectors.get_detector(name)(y, 0.5)
+        assert np.array_equal(found, expected)
+
+
+def test_pan_tompkins():
+    import numpy as np
+    import pytest
+    import detectors
+    from import_csv import load_chunked
+    from preprocessing import estimate_fs
+    timestamps, voltages = load_chunked('test_data/test_data1.csv')
+    fs = estimate_fs(timestamps)
+    expected = detectors.detect_beats(voltages, 'numpy', fs)
+    found = detectors.detect_beats(voltages, 'pan_tompkins', fs)
+    assert len(found) == len(expected) == 35
+    assert np.all(np.abs(found - expected) <= 0.05 * fs)
+    with pytest.raises(ValueError):
+        detectors.pan_tompkins_detector(voltages, 0.5)
+
+
+def test_match_error():
+    import numpy as np
+    from detectors import match_error
+    reference = np.array([10, 50, 90])
+    assert match_error(reference, reference, 2) == 0.0
+    assert match_error(np.array([11, 52, 200]), reference, 2) == 1 - 4 / 6.
+    assert match_error(np.array([], dtype=int), reference, 2) == 1.0
+    assert match_error(np.array([], dtype=int), np.array([]), 2) == 0.0
+
+
+def test_select_detector():
+    import detectors
+    from import_csv import load_chunked
+    timestamps, voltages = load_chunked('test_data/test_data1.csv')
+    results = detectors.benchmark_detectors(voltages, 360.0, repeat=1)
+    assert [result['secs'] for result in results] == sorted(
+        result['secs'] for result in results)
+    accepted = [result['name'] for result in results
+                if result['error'] <= 0.01]
+    assert 'numpy' in accepted
+    assert detectors.select_detector(voltages, 360.0, repeat=1) in accepted
+    assert detectors.auto_detector(voltages, 360.0) in accepted
+
+
+def test_register_detector(monkeypatch):
+    import numpy as np
+    import detectors
+    from heart_rate_monitor import HeartRateMonitor
+    monkeypatch.setattr(detectors, 'DETECTORS', dict(detectors.DETECTORS))
+    calls = []
+
+    def counting_detector(y, thres, fs):
+        calls.append(fs)
+        return(detectors.numpy_detector(y, thres))
+    detectors.register_detector('counting', counting_detector)
+    a = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         peak_detector='numpy')
+    b = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         peak_detector='counting')
+    assert np.array_equal(a.beats, b.beats)
+    assert np.isclose(calls[0], 360.0)
+    c = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         peak_detector='auto')
+    assert c.num_beats == 35
+
+
+def test_auto_detector_rule(tmpdir, monkeypatch):
+    import numpy as np
+    import detectors
+    from heart_rate_monitor import HeartRateMonitor
+    from preprocessing import Preprocessor
+    from import_csv import load_chunked
+    timestamps, voltages = load_chunked('test_data/test_data1.csv')
+    csv_path = str(tmpdir.join('deep.csv'))
+    # CRV min -3.04: still below -1 after HeartRateMonitor's +1 shift
+    np.savetxt(csv_path, np.column_stack((timestamps, 3 * voltages - 1)),
+               delimiter=',', fmt='%.6f')
+    monkeypatch.setattr(detectors, '_auto_choices', {})
+    calls = []
+    select_detector = detectors.select_detector
+
+    def recording_select(y, fs, max_error, **kwargs):
+        calls.append((y, kwargs['thres']))
+        return(select_detector(y, fs, max_error, **kwargs))
+    monkeypatch.setattr(detectors, 'select_detector', recording_select)
+    a = HeartRateMonitor(csv_path, use_cache=False, lazy=True)
+    b = HeartRateMonitor(csv_path, use_cache=False, lazy=True,
+                         peak_detector='auto')
+    assert np.array_equal(b.beats, a.beats)
+    assert np.array_equal(calls[0][0], a.voltages) and calls[0][1] is None
+    # CRV the scored rule reproduces HeartRateMonitor's beats exactly
+    found = detectors.detect_beats(a.voltages, 'numpy', a.sampling_rate())
+    assert np.array_equal(a.timestamps[found], a.beats)
+
+    preprocess = Preprocessor(thres=0.5)
+    c = HeartRateMonitor(csv_path, use_cache=False, lazy=True,
+                         peak_detector='auto', preprocess=preprocess)
+    assert c.num_beats > 0
+    assert calls[-1][1] == 0.5
+    assert np.array_equal(calls[-1][0], preprocess.apply(c.timestamps,
+                                                         c.voltages))
@@ -7,6 +7,73 @@ def test_import_csv():
         ImportCSV('not_csv.txt')
 
 
+def test_import_csv_loaders():
+    import pytest
+    import numpy as np
+    from import_csv import ImportCSV, LOADERS
+    legacy = ImportCSV('test_data/test_data1.csv', loader='genfromtxt',
+                       use_cache=False)
+    for loader in LOADERS:
+        a = ImportCSV('test_data/test_data1.csv', loader=loader,
+                      use_cache=False)
+        assert np.array_equal(a.timestamps, legacy.timestamps)
+        assert np.array_equal(a.voltages, legacy.voltages)
+
+    with pytest.raises(ValueError):
+        ImportCSV('test_data/test_data1.csv', loader='not_a_loader')
+
+
+def test_csv_cache(tmpdir):
+    import os
+    import shutil
+    import numpy as np
+    from import_csv import ImportCSV, CSVCache
+    csv_path = str(tmpdir.join('cached.csv'))
+    shutil.copy('test_data/test_data1.csv', csv_path)
+    cache = CSVCache(cache_dir=str(tmpdir.join('cache')))
+    a = ImportCSV(csv_path, cache=cache)
+    assert len(cache.entries()) == 1
+    b = ImportCSV(csv_path, cache=cache)
+    assert isinstance(b.voltages, np.memmap)
+    assert np.array_equal(a.voltages, b.voltages)
+
+    # CRV editing the .csv invalidates its entry
+    with open(csv_path, 'a') as csv_file:
+        csv_file.write('27.778,0.5\n')
+    c = ImportCSV(csv_path, cache=cache)
+    assert len(c.voltages) == len(a.voltages) + 1
+    assert len(cache.entries()) == 1
+
+    # CRV another writer's temporary file is left alone, ours is renamed
+    other_tmp = cache.entry_path(csv_path) + '.tmp'
+    with open(other_tmp, 'w') as tmp_file:
+        tmp_file.write('other writer')
+    cache.invalidate(csv_path)
+    cache.store(csv_path, c.timestamps, c.voltages)
+    assert sorted(os.listdir(cache.cache_dir)) == sorted(
+        [os.path.basename(cache.entry_path(csv_path)),
+         os.path.basename(other_tmp)])
+    os.remove(other_tmp)
+
+    # CRV an entry removed by another process is a miss
+    os.remove(cache.entry_path(csv_path))
+    assert cache.load(csv_path) is None
+    cache.store(csv_path, c.timestamps, c.voltages)
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert cache.entries() == []
+
+
+def test_load_chunked_small_chunks():
+    import numpy as np
+    from import_csv import load_chunked, load_with_genfromtxt
+    a = load_chunked('test_data/test_data1.csv', chunk_rows=7)
+    b = load_with_genfromtxt('test_data/test_data1.csv')
+    assert np.array_equal(a[0], b[0])
+    assert np.array_equal(a[1], b[1])
+
+
 def test_voltage_extremes():
     import pytest
     from heart_rate_monitor import HeartRateMonitor
@@ -111,3 +178,213 @@ def test_detect_peaks():
 
     with pytest.raises(ImportError):
         HeartRateMonitor('fake_dir/not_real.csv').num_beats
+
+
+def test_peak_detectors_agree():
+    import pytest
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    a = HeartRateMonitor('test_data/test_data1.csv', peak_detector='numpy')
+    b = HeartRateMonitor('test_data/test_data1.csv',
+                         peak_detector='peakutils')
+    assert np.array_equal(a.beats, b.beats)
+    assert a.mean_hr_bpm == b.mean_hr_bpm
+
+    with pytest.raises(ValueError):
+        HeartRateMonitor('test_data/test_data1.csv', peak_detector='fake')
+
+
+def test_heart_beat_voltages():
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    a = HeartRateMonitor('test_data/test_data1.csv')
+    assert isinstance(a.heart_beat_voltages, np.ndarray)
+    assert len(a.heart_beat_voltages) == a.num_beats
+    beat_indexes = np.searchsorted(a.timestamps, a.beats)
+    assert np.array_equal(a.voltages[beat_indexes], a.heart_beat_voltages)
+
+
+def test_calc_hr_series():
+    import pytest
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    a = HeartRateMonitor('test_data/test_data1.csv')
+    starts = np.arange(0, 20, 0.5)
+    ends = starts + 7.5
+    b = a.calc_hr_series(starts, ends)
+    for start_ts, end_ts, hr_bpm in zip(starts, ends, b):
+        num_beats = np.sum((a.beats >= start_ts) & (a.beats <= end_ts))
+        assert hr_bpm == num_beats / ((end_ts - start_ts) / 60)
+    assert np.isnan(a.calc_hr_series([5.0], [5.0])[0])
+
+    with pytest.raises(ValueError):
+        a.calc_hr_series([0, 1], [2])
+
+
+def test_lazy():
+    import os
+    from heart_rate_monitor import HeartRateMonitor
+    output_dir = 'output_json_files/lazy_test/'
+    a = HeartRateMonitor('fake_dir/not_real.csv', lazy=True)
+    b = HeartRateMonitor('test_data/test_data1.csv', output_dir=output_dir,
+                         lazy=True)
+    assert b.duration == 27.775
+    assert b._HeartRateMonitor__beats is None
+    assert b.mean_hr_bpm == 75.60756075607561
+    assert b.num_beats == 35
+    assert not os.path.isdir(output_dir)
+
+
+def test_build_json_formats(tmpdir):
+    import os
+    import json
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    output_dir = str(tmpdir)
+    a = HeartRateMonitor('test_data/test_data1.csv', output_dir=output_dir)
+    with open(os.path.join(output_dir, 'test_data1.json')) as json_file:
+        b = json.load(json_file)
+    assert b['num_beats'] == 35
+    assert b['beats'] == a.beats.tolist()
+    assert b['voltage_extremes'] == [-0.68, 1.05]
+
+    HeartRateMonitor('test_data/test_data1.csv', output_dir=output_dir,
+                     output_format='npz')
+    c = np.load(os.path.join(output_dir, 'test_data1.npz'))
+    assert np.array_equal(c['beats'], a.beats)
+    assert c['mean_hr_bpm'] == a.mean_hr_bpm
+    assert sorted(os.listdir(output_dir)) == ['test_data1.json',
+                                              'test_data1.npz']
+
+
+def write_multi_lead_csv(csv_path):
+    import numpy as np
+    from import_csv import load_with_loadtxt
+    timestamps, voltages = load_with_loadtxt('test_data/test_data1.csv')
+    # CRV a scaled lead, an inverted (noisy) lead and a copy
+    leads = [voltages, 0.8 * voltages + 0.01, 0.3 - voltages, voltages]
+    np.savetxt(csv_path, np.column_stack([timestamps] + leads),
+               delimiter=',', fmt='%.6g')
+    return(timestamps, np.column_stack(leads))
+
+
+def test_import_csv_leads(tmpdir):
+    import numpy as np
+    import pytest
+    from import_csv import ImportCSV, CSVCache, LOADERS
+    csv_path = str(tmpdir.join('leads.csv'))
+    timestamps, voltages = write_multi_lead_csv(csv_path)
+    for loader in LOADERS:
+        a = ImportCSV(csv_path, loader=loader, use_cache=False,
+                      lead_columns='all')
+        assert a.lead_columns == (1, 2, 3, 4)
+        assert np.array_equal(a.timestamps, timestamps)
+        assert np.allclose(a.voltages, voltages)
+        b = ImportCSV(csv_path, loader=loader, use_cache=False,
+                      lead_columns=(3, 1))
+        assert np.allclose(b.voltages, voltages[:, [2, 0]])
+        c = ImportCSV(csv_path, loader=loader, use_cache=False,
+                      lead_columns=(2,))
+        assert c.voltages.ndim == 1
+        assert np.allclose(c.voltages, voltages[:, 1])
+
+    # CRV every lead selection of a .csv gets its own cache entry
+    cache = CSVCache(cache_dir=str(tmpdir.join('cache')))
+    ImportCSV(csv_path, cache=cache, lead_columns='all')
+    ImportCSV(csv_path, cache=cache)
+    assert len(cache.entries()) == 2
+    d = ImportCSV(csv_path, cache=cache, lead_columns='all')
+    assert d.voltages.shape == voltages.shape
+    assert np.allclose(d.voltages, voltages)
+
+    with pytest.raises(ValueError):
+        ImportCSV(csv_path, use_cache=False, lead_columns=(0,))
+
+
+def test_lead_beats(tmpdir):
+    import numpy as np
+    import pytest
+    from heart_rate_monitor import HeartRateMonitor
+    csv_path = str(tmpdir.join('leads.csv'))
+    write_multi_lead_csv(csv_path)
+    single = HeartRateMonitor('test_data/test_data1.csv', lazy=True)
+    a = HeartRateMonitor(csv_path, lazy=True, use_cache=False, leads='all')
+    assert a.num_leads == 4
+    for lead, lead_beats in enumerate(a.lead_beats):
+        b = HeartRateMonitor(csv_path, lazy=True, use_cache=False,
+                             leads=(lead + 1,))
+        assert b.num_leads == 1
+        assert np.array_equal(lead_beats, b.beats)
+    assert np.allclose(a.lead_beats[0], single.beats)
+    # CRV the noisy inverted lead is outvoted
+    assert np.allclose(a.beats, single.beats)
+    assert a.heart_beat_voltages.shape == (35, 4)
+    assert a.build_results()['lead_num_beats'].tolist() == [
+        len(lead_beats) for lead_beats in a.lead_beats]
+
+    with pytest.raises(ValueError):
+        HeartRateMonitor(csv_path, lazy=True, use_cache=False, leads='all',
+                         peak_detector='peakutils').beats
+
+
+def test_hrv(tmpdir):
+    import os
+    import json
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    output_dir = str(tmpdir)
+    a = HeartRateMonitor('test_data/test_data1.csv', output_dir=output_dir,
+                         hrv_window_secs=10.0)
+    rr = np.diff(a.beats)
+    assert np.allclose(a.hrv['rr_intervals'], rr)
+    assert np.isclose(a.hrv['sdnn_ms'], 1000 * np.std(rr, ddof=1))
+    assert len(a.hrv['window_start']) == 3
+    with open(os.path.join(output_dir, 'test_data1.json')) as json_file:
+        b = json.load(json_file)
+    assert b['rmssd_ms'] == a.hrv['rmssd_ms']
+    assert b['window_sdnn_ms'] == a.hrv['window_sdnn_ms'].tolist()
+    c = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         hrv_window_secs=None)
+    assert 'window_start' not in c.hrv
+
+
+def test_hrv_two_beats_json(tmpdir):
+    import os
+    import json
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    csv_path = str(tmpdir.join('two_beats.csv'))
+    voltages = np.zeros(1000)
+    voltages[[200, 500]] = 1.0
+    np.savetxt(csv_path, np.column_stack((np.arange(1000) / 250., voltages)),
+               delimiter=',')
+    a = HeartRateMonitor(csv_path, use_cache=False, output_dir=str(tmpdir))
+    assert a.num_beats == 2
+    assert np.isnan(a.hrv['sdnn_ms'])
+
+    def reject(constant):
+        raise ValueError('invalid JSON constant ' + constant)
+    with open(os.path.join(str(tmpdir), 'two_beats.json')) as json_file:
+        b = json.load(json_file, parse_constant=reject)
+    assert b['sdnn_ms'] is None
+    assert b['rmssd_ms'] is None
+    assert b['window_sdnn_ms'] == [None]
+
+
+def test_plot_ecg_and_beats(monkeypatch):
+    import pytest
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from heart_rate_monitor import HeartRateMonitor
+    monkeypatch.setattr(plt, 'show', lambda: None)
+    a = HeartRateMonitor('test_data/test_data1.csv', lazy=True)
+    assert isinstance(a.timestamps, np.ndarray)
+    a.plot_ecg_and_beats()
+    b = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         detect_uniform=True)
+    b.plot_ecg_and_beats()
+    lines = plt.gca().get_lines()
+    assert np.array_equal(lines[-2].get_xdata(), a.timestamps)
+    plt.close('all')
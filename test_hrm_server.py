@@ -0,0 +1,96 @@
+async def request(port, method, target, body=b''):
+    import asyncio
+    import json
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(('%s %s HTTP/1.1\r\nContent-Length: %d\r\n\r\n' %
+                  (method, target, len(body))).encode('ascii') + body)
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return(int(head.split()[1]), json.loads(payload.decode('utf-8')))
+
+
+async def exercise_server(port):
+    import asyncio
+    status, a = await request(port, 'POST', '/analyze?path=test_data1.csv')
+    assert status == 200
+    assert a['num_beats'] == 35
+    with open('test_data/test_data1.csv', 'rb') as csv_file:
+        status, b = await request(port, 'POST', '/analyze', csv_file.read())
+    assert b == a
+
+    # CRV max_pending=1: concurrent requests beyond the first are rejected
+    responses = await asyncio.gather(*[
+        request(port, 'POST', '/analyze?path=test_data1.csv')
+        for i in range(4)])
+    statuses = [status for status, c in responses]
+    assert 200 in statuses and 503 in statuses
+
+    # CRV an upload still sending its body holds the only slot
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'POST /analyze HTTP/1.1\r\nContent-Length: 1000\r\n\r\n')
+    await writer.drain()
+    await asyncio.sleep(0.1)
+    status, f = await request(port, 'POST', '/analyze', b'0,1\n' * 10)
+    assert status == 503
+    writer.close()
+    await asyncio.sleep(0.1)
+
+    status, d = await request(port, 'POST', '/analyze?path=fake.csv')
+    assert status == 422
+    # CRV path= only reads inside the data root
+    for path in ('../README.md', '/etc/passwd'):
+        status, g = await request(port, 'POST', '/analyze?path=' + path)
+        assert status == 403
+    status, e = await request(port, 'GET', '/metrics')
+    assert e['responses']['200'] == 2 + statuses.count(200)
+    assert e['responses']['rejected'] == statuses.count(503) + 1
+    assert e['pending'] == 0
+    assert 'p99' in e['latency_secs']
+
+
+def test_hrm_server():
+    import asyncio
+    from hrm_server import HRMServer
+    loop = asyncio.new_event_loop()
+    server = HRMServer(port=0, workers=1, max_pending=1,
+                       data_root='test_data')
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_until_complete(exercise_server(server.port))
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
+
+
+async def stall_upload(port):
+    import asyncio
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'POST /analyze HTTP/1.1\r\nContent-Length: 1000\r\n\r\n')
+    await writer.drain()
+    await asyncio.sleep(0.1)
+    status, a = await request(port, 'GET', '/metrics')
+    assert a['pending'] == 1
+    # CRV past read_timeout the server hangs up and frees the slot
+    assert await asyncio.wait_for(reader.read(), 5) == b''
+    writer.close()
+    status, b = await request(port, 'GET', '/metrics')
+    assert b['pending'] == 0
+    assert b['responses']['timeout'] == 1
+    with open('test_data/test_data1.csv', 'rb') as csv_file:
+        status, c = await request(port, 'POST', '/analyze', csv_file.read())
+    assert status == 200
+    assert c['num_beats'] == 35
+
+
+def test_hrm_server_read_timeout():
+    import asyncio
+    from hrm_server import HRMServer
+    loop = asyncio.new_event_loop()
+    server = HRMServer(port=0, workers=1, max_pending=1, read_timeout=0.5)
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_until_complete(stall_upload(server.port))
+    finally:
+        loop.run_until_complete(server.close())
+        loop.close()
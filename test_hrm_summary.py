@@ -0,0 +1,57 @@
+def test_summary_float64():
+    import pytest
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    a = HeartRateMonitor('test_data/test_data1.csv')
+    b = a.summary()
+    assert not hasattr(b, '__dict__')
+    assert b.num_beats == 35
+    assert b.voltage_extremes == (-0.68, 1.05)
+    assert b.mean_hr_bpm == a.mean_hr_bpm
+    assert np.array_equal(b.beats, a.beats)
+    assert b.timestamps is None
+
+    with pytest.raises(ValueError):
+        a.summary(storage='float16')
+
+
+def test_summary_compact():
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from uniform_grid import UniformTimestamps
+    a = HeartRateMonitor('test_data/test_data1.csv')
+    b = a.summary(storage='compact', keep_raw=True)
+    assert b.voltages.dtype == np.float32
+    # CRV test_data1.csv is uniformly sampled: an exact grid, no array
+    assert isinstance(b._timestamps, UniformTimestamps)
+    assert b._beats.dtype == np.int32
+    assert np.allclose(b.beats, a.beats, rtol=0, atol=1e-6)
+    assert np.array_equal(b.timestamps, a.timestamps)
+    assert b.nbytes < a.summary(keep_raw=True).nbytes
+    b.drop_raw()
+    assert b.voltages is None
+    assert b.nbytes == 35 * (4 + 4)
+
+
+def test_summary_compact_long_recording():
+    import numpy as np
+    from hrm_summary import HeartRateSummary
+    from uniform_grid import UniformTimestamps
+    # CRV 2 hours at 250 Hz, with jitter so the timestamps are not uniform
+    rng = np.random.RandomState(14)
+    timestamps = np.arange(2 * 3600 * 250) / 250.0 + rng.uniform(
+        0, 1e-3, 2 * 3600 * 250)
+    beats = timestamps[::200]
+    a = HeartRateSummary('long.csv', 75.0, (0.0, 1.0), timestamps[-1],
+                         beats, np.ones(len(beats)), timestamps,
+                         np.zeros(len(timestamps)), storage='compact')
+    assert a._timestamps.dtype == np.int32
+    assert a._beats.dtype == np.int32
+    assert np.allclose(a.timestamps, timestamps, rtol=0, atol=5e-6)
+    assert np.allclose(a.beats, beats, rtol=0, atol=5e-6)
+    uniform = np.arange(2 * 3600 * 250) / 250.0
+    b = HeartRateSummary('long.csv', 75.0, (0.0, 1.0), uniform[-1], beats,
+                         np.ones(len(beats)), uniform,
+                         np.zeros(len(uniform)), storage='compact')
+    assert isinstance(b._timestamps, UniformTimestamps)
+    assert np.array_equal(b.timestamps, uniform)
@@ -0,0 +1,50 @@
+def test_hrv_metrics():
+    import numpy as np
+    from hrv import hrv_metrics
+    beats = np.array([0.0, 0.8, 1.7, 2.5, 3.4, 4.0, 4.62])
+    rr = np.diff(beats)
+    metrics = hrv_metrics(beats, window_secs=None)
+    assert np.allclose(metrics['rr_intervals'], rr)
+    assert np.allclose(metrics['instantaneous_hr_bpm'], 60 / rr)
+    assert np.isclose(metrics['mean_rr_ms'], 1000 * rr.mean())
+    assert np.isclose(metrics['sdnn_ms'], 1000 * np.std(rr, ddof=1))
+    assert np.isclose(metrics['rmssd_ms'],
+                      1000 * np.sqrt(np.mean(np.diff(rr) ** 2)))
+    assert np.isclose(metrics['pnn50'], 100 * 4 / 5.)
+    assert 'window_start' not in metrics
+
+
+def test_windowed_hrv():
+    import numpy as np
+    from hrv import hrv_metrics
+    rng = np.random.RandomState(22)
+    beats = np.cumsum(0.8 + rng.normal(0, 0.06, 400))
+    metrics = hrv_metrics(beats, window_secs=30.0)
+    assert metrics['window_start'][0] == beats[0]
+    assert metrics['window_start'][-1] <= beats[-1]
+    for i, start in enumerate(metrics['window_start']):
+        # CRV intervals belong to the window of their closing beat
+        closing = (beats[1:] >= start) & (beats[1:] < start + 30.0)
+        rr = np.diff(beats)[closing]
+        assert np.isclose(metrics['window_sdnn_ms'][i],
+                          1000 * np.std(rr, ddof=1))
+        assert np.isclose(metrics['window_rmssd_ms'][i],
+                          1000 * np.sqrt(np.mean(np.diff(rr) ** 2)))
+        assert np.isclose(metrics['window_pnn50'][i],
+                          100 * np.mean(np.abs(np.diff(rr)) > 0.05))
+        assert np.isclose(metrics['window_mean_hr_bpm'][i], 60 / rr.mean())
+
+
+def test_hrv_few_beats():
+    import numpy as np
+    import pytest
+    from hrv import hrv_metrics
+    for beats in [[], [1.0], [1.0, 2.0]]:
+        metrics = hrv_metrics(beats)
+        assert np.isnan(metrics['sdnn_ms'])
+        assert np.isnan(metrics['rmssd_ms'])
+        assert len(metrics['rr_intervals']) == max(len(beats) - 1, 0)
+    assert np.isclose(hrv_metrics([1.0, 2.0])['window_mean_hr_bpm'][0], 60)
+
+    with pytest.raises(ValueError):
+        hrv_metrics([1.0, 2.0], window_secs=0)
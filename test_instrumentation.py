@@ -0,0 +1,49 @@
+def test_stage_disabled():
+    import instrumentation
+    instrumentation.disable_timers()
+    instrumentation.reset_timings()
+    with instrumentation.stage('find_beats', 10) as timer:
+        timer.samples = 20
+    assert timer is instrumentation.NULL_STAGE
+    assert instrumentation.timings() == {}
+
+
+def test_pipeline_stages():
+    import instrumentation
+    from heart_rate_monitor import HeartRateMonitor
+    instrumentation.enable_timers()
+    instrumentation.reset_timings()
+    try:
+        HeartRateMonitor('test_data/test_data1.csv')
+    finally:
+        instrumentation.disable_timers()
+    a = instrumentation.timings()
+    for name in ['import', 'extremes', 'duration', 'detect_peaks',
+                 'find_beats', 'mean_hr', 'json_write']:
+        assert a[name]['calls'] == 1
+    assert a['import']['samples'] == 10000
+    assert a['find_beats']['secs'] >= a['detect_peaks']['secs']
+    assert 'find_beats' in instrumentation.report()
+
+
+def test_configure_logging_deferred(tmpdir):
+    import logging
+    import instrumentation
+    log_path = str(tmpdir.join('logs', 'deferred.txt'))
+    instrumentation.configure_logging(log_path, 'test_deferred')
+    handler = instrumentation._listeners[('test_deferred', log_path)]
+    assert handler.listener is None
+    assert not tmpdir.join('logs').check()
+    logging.getLogger('test_deferred').info('first record')
+    handler.stop()
+    assert handler.listener is None
+    with open(log_path) as log_file:
+        assert 'first record' in log_file.read()
+
+
+def test_headless_imports():
+    import os
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'benchmarks'))
+    from bench_startup import headless_imports
+    assert headless_imports() == []
@@ -0,0 +1,64 @@
+import pytest
+
+
+def test_min_max_pyramid():
+    import numpy as np
+    from lod_plot import MinMaxPyramid
+    timestamps = np.arange(100001) / 333.0
+    voltages = np.random.RandomState(0).normal(size=100001)
+    a = MinMaxPyramid(timestamps, voltages)
+    for bin_samples, mins, maxs in a.levels:
+        assert mins[-1] == voltages[(len(mins) - 1) * bin_samples:].min()
+        assert maxs[3] == voltages[3 * bin_samples:4 * bin_samples].max()
+    assert len(a.levels[-1][1]) <= 256
+    assert a.nbytes < 2.1 * voltages.nbytes
+
+
+def test_envelope():
+    import numpy as np
+    from lod_plot import MinMaxPyramid
+    timestamps = np.arange(100001) / 333.0
+    voltages = np.random.RandomState(0).normal(size=100001)
+    voltages[54321] = 10.0
+    a = MinMaxPyramid(timestamps, voltages)
+    b, c = a.envelope(max_points=1000)
+    assert len(b) <= 1000
+    # CRV decimation never drops the extremes
+    assert c.max() == 10.0 and c.min() == voltages.min()
+    d, e = a.envelope(100.0, 101.0, max_points=1000)
+    assert np.array_equal(e, voltages[(timestamps >= 100.0) &
+                                      (timestamps <= 101.0)])
+    f, g = a.envelope(100.0, 200.0, max_points=1000)
+    assert len(f) <= 1000 and f[0] <= 100.0 and f[-1] <= 200.0
+
+
+def test_render_png(tmpdir):
+    pytest.importorskip('matplotlib')
+    import os
+    from heart_rate_monitor import HeartRateMonitor
+    a = HeartRateMonitor('test_data/test_data1.csv', lazy=True)
+    png_path = str(tmpdir.join('test_data1.png'))
+    a.plot_ecg_lod(png_path, width_px=400, height_px=200)
+    assert os.path.getsize(png_path) > 0
+
+
+def test_multi_lead_png(tmpdir):
+    pytest.importorskip('matplotlib')
+    import os
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from lod_plot import MinMaxPyramid
+    from test_heart_rate_monitor import write_multi_lead_csv
+    csv_path = str(tmpdir.join('leads.csv'))
+    timestamps, voltages = write_multi_lead_csv(csv_path)
+    a = MinMaxPyramid(timestamps, voltages)
+    b, c = a.envelope(max_points=1000)
+    assert c.shape == (len(b), 4)
+    for lead in range(4):
+        d, e = MinMaxPyramid(timestamps, voltages[:, lead]).envelope(
+            max_points=1000)
+        assert np.array_equal(e, c[:, lead])
+    f = HeartRateMonitor(csv_path, lazy=True, use_cache=False, leads='all')
+    png_path = str(tmpdir.join('leads.png'))
+    f.plot_ecg_lod(png_path, width_px=400, height_px=200)
+    assert os.path.getsize(png_path) > 0
@@ -0,0 +1,85 @@
+def test_out_of_core_matches_in_memory():
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from out_of_core import OutOfCoreHeartRateMonitor
+    a = HeartRateMonitor('test_data/test_data1.csv', use_cache=False)
+    for window_samples in [37, 500, 10 ** 6]:
+        b = OutOfCoreHeartRateMonitor('test_data/test_data1.csv',
+                                      window_samples=window_samples,
+                                      overlap_samples=10)
+        assert b.voltage_extremes == (-0.68, 1.05)
+        assert b.duration == a.duration
+        assert np.array_equal(b.beats, a.beats)
+        assert np.array_equal(b.heart_beat_voltages, a.heart_beat_voltages)
+        assert b.mean_hr_bpm == a.mean_hr_bpm
+
+
+def test_out_of_core_positive_baseline(tmpdir):
+    import pytest
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from out_of_core import OutOfCoreHeartRateMonitor
+    csv_path = str(tmpdir.join('positive.csv'))
+    timestamps = np.arange(20000) / 250.0
+    rng = np.random.RandomState(0)
+    voltages = (0.5 + (np.mod(timestamps, 0.8) < 0.02) +
+                rng.normal(0, 0.01, len(timestamps)))
+    np.savetxt(csv_path, np.column_stack((timestamps, voltages)),
+               delimiter=',', fmt='%.4f')
+    a = HeartRateMonitor(csv_path, use_cache=False, output_dir=str(tmpdir))
+    b = OutOfCoreHeartRateMonitor(csv_path, window_samples=1000,
+                                  overlap_samples=50)
+    assert np.array_equal(b.beats, a.beats)
+    assert b.mean_hr_bpm == a.mean_hr_bpm
+
+    with pytest.raises(ImportError):
+        OutOfCoreHeartRateMonitor('fake_dir/not_real.csv')
+
+
+def test_out_of_core_exact_median(tmpdir, monkeypatch):
+    import numpy as np
+    import out_of_core
+    csv_path = str(tmpdir.join('median.csv'))
+    medians = []
+    exact_median = out_of_core.OutOfCoreHeartRateMonitor.exact_median
+
+    def recording_median(self, shift):
+        medians.append(exact_median(self, shift))
+        return(medians[-1])
+    monkeypatch.setattr(out_of_core.OutOfCoreHeartRateMonitor,
+                        'exact_median', recording_median)
+    rng = np.random.RandomState(12)
+    # CRV heavy duplicates, a far outlier, then an even and an odd count
+    voltages = np.round(rng.normal(0, 1, 4000), 1)
+    voltages[7] = 1e6
+    for num_samples in [4000, 3999]:
+        np.savetxt(csv_path, np.column_stack((np.arange(num_samples) / 250.,
+                                              voltages[:num_samples])),
+                   delimiter=',', fmt='%.4f')
+        for window_samples in [25, 300, 10 ** 6]:
+            out_of_core.OutOfCoreHeartRateMonitor(
+                csv_path, window_samples=window_samples, overlap_samples=10)
+            assert medians[-1] == np.median(voltages[:num_samples] + 1)
+
+
+def test_out_of_core_validation(tmpdir):
+    import pytest
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from out_of_core import OutOfCoreHeartRateMonitor
+    csv_path = str(tmpdir.join('dirty.csv'))
+    with open('test_data/test_data1.csv') as csv_file:
+        lines = csv_file.read().splitlines()
+    lines[1234] = lines[1234].split(',')[0] + ',nan'
+    lines[2345] = lines[2344]
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('\n'.join(lines) + '\n')
+    with pytest.raises(ImportError):
+        OutOfCoreHeartRateMonitor(csv_path, window_samples=500)
+    a = HeartRateMonitor(csv_path, use_cache=False, on_invalid='repair',
+                         output_dir=str(tmpdir))
+    b = OutOfCoreHeartRateMonitor(csv_path, window_samples=500,
+                                  overlap_samples=10, on_invalid='repair')
+    assert b.validation == a.validation
+    assert np.array_equal(b.beats, a.beats)
+    assert b.mean_hr_bpm == a.mean_hr_bpm
@@ -0,0 +1,66 @@
+import pytest
+
+
+def test_indexes_matches_peakutils():
+    import numpy as np
+    import peakutils
+    from peak_detection import indexes
+    rng = np.random.RandomState(590)
+    for trial in range(500):
+        # CRV small integer levels give lots of plateaus and ties
+        y = rng.randint(0, 4, rng.randint(3, 40)).astype(float)
+        min_dist = rng.randint(1, 5)
+        assert np.array_equal(indexes(y, 0.2, min_dist),
+                              peakutils.indexes(y.copy(), 0.2, min_dist))
+
+
+def test_indexes_plateaus_and_edges():
+    import numpy as np
+    from peak_detection import indexes
+    assert len(indexes(np.array([1., 1., 1., 1.]), 0.)) == 0
+    assert len(indexes(np.array([2., 2., 1., 0.]), 0.)) == 0
+    assert indexes(np.array([0., 1., 1., 1., 1., 0.]), 0.).tolist() == [2]
+    assert indexes(np.array([0., 2., 0., 1., 0.]), 0.5).tolist() == [1]
+    a = indexes(np.array([0., 2., 0., 1., 0.]), 0., min_dist=3)
+    assert a.tolist() == [1]
+
+
+def test_fuse_column_peaks():
+    import numpy as np
+    from peak_detection import fuse_column_peaks
+    columns = np.array([0, 0, 1, 1, 2, 2, 2, 2])
+    peaks = np.array([10, 50, 11, 90, 9, 12, 15, 70])
+    assert fuse_column_peaks(columns, peaks, 2, 3).tolist() == [10]
+    fused = fuse_column_peaks(columns, peaks, 1, 3)
+    assert fused.tolist() == [11, 50, 70, 90]
+    assert len(fuse_column_peaks(columns, peaks, 4, 3)) == 0
+
+
+@pytest.mark.parametrize("segment_samples", [1, 2, 7, 64])
+def test_parallel_indexes(segment_samples):
+    import numpy as np
+    from peak_detection import indexes, parallel_indexes
+    rng = np.random.RandomState(segment_samples)
+    # CRV quantized noise and long plateaus cross the segment seams
+    for y in [rng.randint(0, 4, 500).astype(float), rng.rand(500),
+              np.repeat(rng.randint(0, 3, 50).astype(float), 10)]:
+        for min_dist in [1, 5]:
+            a = indexes(y, 0.4, min_dist)
+            b = parallel_indexes(y, 0.4, min_dist, workers=3,
+                                 segment_samples=segment_samples)
+            assert np.array_equal(a, b)
+        assert np.array_equal(
+            indexes(y, 1.5, thres_abs=True),
+            parallel_indexes(y, 1.5, thres_abs=True, workers=3,
+                             segment_samples=segment_samples))
+
+
+def test_detect_workers(monkeypatch):
+    import numpy as np
+    import peak_detection
+    from heart_rate_monitor import HeartRateMonitor
+    monkeypatch.setattr(peak_detection, 'MIN_SEGMENT_SAMPLES', 100)
+    a = HeartRateMonitor('test_data/test_data1.csv', lazy=True)
+    b = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         detect_workers=4)
+    assert np.array_equal(a.beats, b.beats)
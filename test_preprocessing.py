@@ -0,0 +1,70 @@
+import pytest
+
+
+def test_moving_average():
+    import numpy as np
+    from preprocessing import moving_average
+    a = np.random.RandomState(0).rand(3 * 2 ** 16 + 5)
+    b = moving_average(a, 101)
+    c = np.convolve(a, np.ones(101) / 101, 'same')
+    assert np.allclose(b[50:-50], c[50:-50])
+    # CRV windows shrink at the edges
+    assert b[0] == pytest.approx(a[:51].mean())
+    assert b[-1] == pytest.approx(a[-51:].mean())
+
+
+@pytest.mark.parametrize("candidate, expected", [
+    ((333.0, 1.0), 333),
+    ((333.0, 0.025), 9),
+    ((333.0, 0.001), 1),
+])
+def test_odd_window(candidate, expected):
+    from preprocessing import odd_window
+    assert odd_window(*candidate) == expected
+
+
+def test_bandpass_removes_baseline():
+    import numpy as np
+    from preprocessing import bandpass, remove_baseline
+    t = np.arange(0, 20, 1 / 333.0)
+    a = 0.8 * np.sin(2 * np.pi * 0.05 * t) + 3.0
+    for b in [bandpass(a, 333.0, 1.0, 40.0), remove_baseline(a, 667)]:
+        assert np.abs(b[1000:-1000]).max() < 0.05
+    with pytest.raises(ValueError):
+        bandpass(a, 333.0, 40.0, 1.0)
+
+
+def test_refine_peaks():
+    import numpy as np
+    from preprocessing import Preprocessor
+    a = np.zeros(100)
+    a[[10, 41, 77]] = 1.0
+    b = Preprocessor(downsample_factor=4)
+    assert np.array_equal(b.refine_peaks(a, np.array([2, 10, 19])),
+                          [10, 41, 77])
+    with pytest.raises(ValueError):
+        Preprocessor(downsample_factor=0)
+
+
+def test_preprocessed_find_beats(tmpdir):
+    import os
+    import sys
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from preprocessing import Preprocessor
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'benchmarks'))
+    from synthetic_ecg import synthetic_ecg
+    timestamps, voltages = synthetic_ecg(333 * 60, noise=0.15, seed=3)
+    voltages += 0.8 * np.sin(2 * np.pi * 0.15 * timestamps)
+    csv_path = str(tmpdir.join('wander.csv'))
+    np.savetxt(csv_path, np.column_stack((timestamps, voltages)),
+               fmt='%.4f', delimiter=',')
+    a = HeartRateMonitor(csv_path, use_cache=False, lazy=True)
+    assert a.num_beats < 30
+    for factor in [1, 3]:
+        b = HeartRateMonitor(csv_path, use_cache=False, lazy=True,
+                             preprocess=Preprocessor(
+                                 downsample_factor=factor))
+        # CRV 75 R waves; the shrinking window may add a T wave at the end
+        assert b.num_beats in (75, 76)
+        assert np.all(np.abs(np.diff(b.beats[:75]) - 0.8) < 0.02)
@@ -0,0 +1,92 @@
+def test_result_cache(tmpdir):
+    import shutil
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from result_cache import ResultCache
+    a = ResultCache(str(tmpdir.join('results')))
+    b = HeartRateMonitor('test_data/test_data1.csv', use_cache=False,
+                         output_dir=str(tmpdir), result_cache=a)
+    assert not b.result_cache_hit
+    # CRV same contents under another name hit the same entry
+    copy_path = str(tmpdir.join('copy.csv'))
+    shutil.copy('test_data/test_data1.csv', copy_path)
+    c = HeartRateMonitor(copy_path, use_cache=False, output_dir=str(tmpdir),
+                         result_cache=a)
+    assert c.result_cache_hit
+    assert np.array_equal(c.beats, b.beats)
+    assert c.num_beats == b.num_beats
+    assert c.mean_hr_bpm == b.mean_hr_bpm
+    assert c.voltage_extremes == b.voltage_extremes
+    assert c.duration == b.duration
+    assert tmpdir.join('copy.json').check()
+    d = HeartRateMonitor(copy_path, use_cache=False, peak_detector='peakutils',
+                         lazy=True, result_cache=a)
+    assert d.num_beats == b.num_beats
+    assert not d.result_cache_hit
+    assert a.stats()['hits'] == 1
+    assert a.stats()['misses'] == 2
+    assert a.stats()['entries'] == 1
+    d.build_results()
+    assert a.stats()['entries'] == 2
+
+
+def test_result_cache_windowed_mean_hr(tmpdir):
+    from heart_rate_monitor import HeartRateMonitor
+    from result_cache import ResultCache
+    a = ResultCache(str(tmpdir.join('results')))
+    b = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         result_cache=a)
+    b.calc_mean_hr_bpm(5.0, 15.0)
+    windowed = b.mean_hr_bpm
+    b.build_results()
+    assert b.mean_hr_bpm == windowed
+    c = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         result_cache=a)
+    assert c.mean_hr_bpm == 75.60756075607561
+    assert c.result_cache_hit
+    assert windowed != c.mean_hr_bpm
+
+
+def test_result_cache_leads(tmpdir):
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from result_cache import ResultCache
+    from test_heart_rate_monitor import write_multi_lead_csv
+    csv_path = str(tmpdir.join('leads.csv'))
+    write_multi_lead_csv(csv_path)
+    a = ResultCache(str(tmpdir.join('results')))
+    b = HeartRateMonitor(csv_path, use_cache=False, output_dir=str(tmpdir),
+                         result_cache=a, leads='all')
+    c = HeartRateMonitor(csv_path, use_cache=False, lazy=True,
+                         result_cache=a, leads='all')
+    results = c.build_results()
+    assert c.result_cache_hit
+    # CRV a hit never imports the .csv or detects beats again
+    assert c._HeartRateMonitor__voltages is None
+    assert c.num_leads == 4
+    assert np.array_equal(results['beats'], b.beats)
+    assert results['lead_num_beats'].tolist() == [
+        len(lead_beats) for lead_beats in b.lead_beats]
+    for cached, found in zip(c.lead_beats, b.lead_beats):
+        assert np.array_equal(cached, found)
+
+
+def test_result_cache_eviction(tmpdir):
+    import os
+    import time
+    import numpy as np
+    from result_cache import ResultCache
+    a = ResultCache(str(tmpdir))
+    results = {'beats': np.arange(3.0), 'heart_beat_voltages': np.ones(3),
+               'num_beats': 3, 'mean_hr_bpm': 60.0,
+               'voltage_extremes': (0.0, 1.0), 'duration': 3.0}
+    a.store('old', results)
+    past = time.time() - 100
+    os.utime(a.entry_path('old'), (past, past))
+    a.store('new', results)
+    assert a.load('new')['voltage_extremes'] == (0.0, 1.0)
+    a.max_bytes = os.path.getsize(a.entry_path('new'))
+    a.evict()
+    assert a.load('old') is None
+    assert a.load('new')['num_beats'] == 3
+    assert (a.hits, a.misses) == (2, 1)
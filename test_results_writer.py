@@ -0,0 +1,34 @@
+def test_encode_results():
+    import json
+    import pytest
+    import numpy as np
+    from results_writer import encode_results
+    results = {'num_beats': 2, 'mean_hr_bpm': np.float64(60.0),
+               'voltage_extremes': (np.float64(-1.0), np.float64(1.0)),
+               'beats': np.array([0.5, 1.5])}
+    a = json.loads(encode_results(results).decode('utf-8'))
+    assert a == {'num_beats': 2, 'mean_hr_bpm': 60.0,
+                 'voltage_extremes': [-1.0, 1.0], 'beats': [0.5, 1.5]}
+
+    msgpack = pytest.importorskip('msgpack')
+    assert msgpack.unpackb(encode_results(results, 'msgpack')) == a
+
+    with pytest.raises(ValueError):
+        encode_results(results, 'xml')
+
+
+def test_write_atomic(tmpdir):
+    import os
+    from results_writer import write_atomic
+    path = str(tmpdir.join('results.json'))
+    write_atomic(path, b'old')
+    write_atomic(path, b'new')
+    with open(path, 'rb') as results_file:
+        assert results_file.read() == b'new'
+    assert os.listdir(str(tmpdir)) == ['results.json']
+    # CRV same permissions as a file created with open()
+    plain_path = str(tmpdir.join('plain.json'))
+    with open(plain_path, 'wb'):
+        pass
+    assert (os.stat(path).st_mode & 0o777 ==
+            os.stat(plain_path).st_mode & 0o777)
@@ -0,0 +1,22 @@
+def test_streaming_matches_batch():
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from stream_monitor import StreamingHeartRateMonitor, iter_csv_chunks
+    batch = HeartRateMonitor('test_data/test_data1.csv')
+    for chunk_rows in [1, 333, 10000]:
+        a = StreamingHeartRateMonitor()
+        with open('test_data/test_data1.csv') as csv_stream:
+            beats = list(a.consume(iter_csv_chunks(csv_stream, chunk_rows)))
+        assert np.array_equal(beats, batch.beats)
+        assert a.num_beats == 35
+        assert a.mean_hr_bpm == batch.mean_hr_bpm
+
+
+def test_streaming_bad_chunk():
+    import pytest
+    from stream_monitor import StreamingHeartRateMonitor
+    a = StreamingHeartRateMonitor()
+    assert len(a.feed([], [])) == 0
+    assert a.mean_hr_bpm == 0.0
+    with pytest.raises(ValueError):
+        a.feed([0.0, 0.1], [1.0])
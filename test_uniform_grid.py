@@ -0,0 +1,71 @@
+def test_detect_uniform():
+    import numpy as np
+    from import_csv import load_with_loadtxt
+    from uniform_grid import detect_uniform
+    # CRV 360 Hz rounded to whole milliseconds
+    timestamps, voltages = load_with_loadtxt('test_data/test_data1.csv')
+    a = detect_uniform(timestamps)
+    assert (a.scale, a.den) == (1000, 9)
+    assert np.isclose(a.dt, 1 / 360.)
+    assert np.array_equal(np.asarray(a), timestamps)
+    b = detect_uniform((7 + np.arange(5000)) / 333.0)
+    assert b.scale == 333.0
+    assert b.t0 == 7 / 333.0
+    assert detect_uniform(np.round(np.arange(1000) / 250. + 0.1234, 4))
+    rng = np.random.RandomState(24)
+    assert detect_uniform(np.cumsum(rng.rand(1000))) is None
+    assert detect_uniform(np.zeros(10)) is None
+    assert detect_uniform([1.0]) is None
+
+
+def test_uniform_indexing():
+    import numpy as np
+    import pytest
+    from import_csv import load_with_loadtxt
+    from uniform_grid import detect_uniform
+    timestamps, voltages = load_with_loadtxt('test_data/test_data1.csv')
+    a = detect_uniform(timestamps)
+    assert len(a) == len(timestamps)
+    assert a[-1] == timestamps[-1]
+    assert a.max() - a.min() == 27.775
+    assert np.array_equal(a[10:500:7], timestamps[10:500:7])
+    assert np.array_equal(a[np.array([3, -2])], timestamps[[3, -2]])
+    mask = voltages > 0.5
+    assert np.array_equal(a[mask], timestamps[mask])
+    with pytest.raises(IndexError):
+        a[len(timestamps)]
+    with pytest.raises(IndexError):
+        a[np.array([0.5])]
+
+
+def test_uniform_searchsorted():
+    import numpy as np
+    from import_csv import load_with_loadtxt
+    from uniform_grid import detect_uniform
+    timestamps, voltages = load_with_loadtxt('test_data/test_data1.csv')
+    a = detect_uniform(timestamps)
+    rng = np.random.RandomState(7)
+    # CRV exact sample times and their neighbours are the edge cases
+    values = np.concatenate((rng.uniform(-1, 29, 1000), timestamps,
+                             np.nextafter(timestamps, -np.inf),
+                             np.nextafter(timestamps, np.inf)))
+    for side in ['left', 'right']:
+        assert np.array_equal(np.searchsorted(a, values, side),
+                              np.searchsorted(timestamps, values, side))
+    assert np.searchsorted(a, 5.0) == np.searchsorted(timestamps, 5.0)
+
+
+def test_uniform_monitor():
+    import numpy as np
+    from heart_rate_monitor import HeartRateMonitor
+    from uniform_grid import UniformTimestamps
+    a = HeartRateMonitor('test_data/test_data1.csv', lazy=True,
+                         detect_uniform=True)
+    b = HeartRateMonitor('test_data/test_data1.csv', lazy=True)
+    assert isinstance(a.timestamps, UniformTimestamps)
+    assert isinstance(b.timestamps, np.ndarray)
+    assert a.duration == b.duration
+    assert np.array_equal(a.beats, b.beats)
+    assert a.mean_hr_bpm == b.mean_hr_bpm
+    assert a.sample_range(1.0, 2.0) == b.sample_range(1.0, 2.0)
+    assert a.sample_range() == (0, 10000)
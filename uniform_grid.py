@@ -0,0 +1,200 @@
+"""
+Uniformly sampled timestamps stored as a grid instead of an array
+
+Most devices sample at a fixed rate, so the timestamps column is a
+rounded uniform grid: tick i is floor((start + i * step) / den) for
+integers start, step, den, and the timestamp is ticks / scale with a scale
+such as 1000 (millisecond text) or the sampling rate itself (i / fs).
+E.g. test_data1.csv is 360 Hz written in whole milliseconds: ticks of
+i * 25 / 9 rounded, so its spacing alternates between 2 and 3 ms. Integer
+ticks and one correctly rounded division reproduce the parsed float64
+timestamps bit for bit, so a recording detected as uniform gives exactly
+the results it gave with the full array, while the timestamps take no
+memory and duration, beat timestamps and time-to-index lookups are O(1).
+"""
+from fractions import Fraction
+import numpy as np
+
+# CRV timestamps checked at a time (bounds the temporary grid values)
+CHECK_SAMPLES = 2 ** 16
+# CRV decimal scales tried: seconds down to nanoseconds
+DECIMAL_SCALES = tuple(10 ** digits for digits in range(10))
+# CRV ticks must stay exact in float64 and start + i * step fit int64
+MAX_TICKS = 2 ** 53
+MAX_GRID = 2 ** 62
+
+
+class UniformTimestamps:
+    """
+    Read-only, array-like timestamps t[i] = ((start + i * step) // den) /
+    scale
+
+    Integer indexes give floats; slices and index arrays give numpy arrays.
+    np.asarray(grid) materializes every timestamp.
+
+    :param start: ticks of the first timestamp (int)
+    :param step: den-ths of a tick between samples (int > 0)
+    :param scale: ticks per second
+    :param size: number of samples
+    :param den: denominator of the (rational) tick step. Default: 1
+    :attr t0: first timestamp (seconds)
+    :attr dt: sample spacing (seconds)
+    """
+    ndim = 1
+    dtype = np.dtype(np.float64)
+    # CRV nothing is held per sample
+    nbytes = 0
+
+    def __init__(self, start, step, scale, size, den=1):
+        self.start = int(start)
+        self.step = int(step)
+        self.scale = scale
+        self.size = int(size)
+        self.den = int(den)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def shape(self):
+        return (self.size,)
+
+    @property
+    def t0(self):
+        return self[0]
+
+    @property
+    def dt(self):
+        return self.step / (self.den * self.scale)
+
+    def values(self, indexes):
+        """
+        :param indexes: int or numpy array of sample indexes (not bounds
+                        checked)
+        :returns timestamps: float64 timestamps at those indexes
+        """
+        ticks = ((self.start + np.asarray(indexes, dtype=np.int64) *
+                  self.step) // self.den)
+        return(ticks / self.scale)
+
+    def __getitem__(self, key):
+        if(isinstance(key, slice)):
+            return(self.values(np.arange(*key.indices(self.size))))
+        indexes = np.asarray(key)
+        if(indexes.dtype == bool):
+            if(indexes.shape != self.shape):
+                raise IndexError('boolean index does not match timestamps')
+            return(self.values(np.flatnonzero(indexes)))
+        if(indexes.dtype.kind not in 'iu'):
+            raise IndexError('timestamps are indexed by integers')
+        indexes = np.where(indexes < 0, indexes + self.size, indexes)
+        if(indexes.size and (indexes.min() < 0 or
+                             indexes.max() >= self.size)):
+            raise IndexError('timestamp index out of range')
+        return(self.values(indexes))
+
+    def __array__(self, dtype=None, copy=None):
+        timestamps = self.values(np.arange(self.size))
+        return(timestamps if dtype is None else timestamps.astype(dtype))
+
+    def min(self):
+        return self[0]
+
+    def max(self):
+        return self[-1]
+
+    def searchsorted(self, v, side='left', sorter=None):
+        """
+        np.searchsorted for the grid, computed in O(1) per value
+
+        :param v: float or numpy array of timestamps
+        :param side: 'left' or 'right', as for np.searchsorted
+        :returns indexes: insertion indexes keeping the grid sorted
+        """
+        v = np.asarray(v, dtype=np.float64)
+        guess = np.floor((v * self.scale * self.den - self.start) /
+                         self.step)
+        indexes = np.clip(np.nan_to_num(guess), -1, self.size).astype(
+            np.int64)
+        # CRV the guess is within a sample; settle it on exact values
+        if(side == 'left'):
+            indexes += 1
+            for _ in range(2):
+                below = (indexes > 0) & (self.values(indexes - 1) >= v)
+                indexes -= below
+                above = (indexes < self.size) & (self.values(indexes) < v)
+                indexes += above
+        else:
+            indexes += 1
+            for _ in range(2):
+                below = (indexes > 0) & (self.values(indexes - 1) > v)
+                indexes -= below
+                above = (indexes < self.size) & (self.values(indexes) <= v)
+                indexes += above
+        indexes = np.clip(indexes, 0, self.size)
+        return(indexes if indexes.ndim else np.int64(indexes))
+
+
+def grid_matches(grid, timestamps):
+    """
+    :param grid: UniformTimestamps
+    :param timestamps: numpy array of parsed timestamps
+    :returns matches: True if every grid value equals the parsed one exactly
+    """
+    for start in range(0, len(timestamps), CHECK_SAMPLES):
+        stop = min(start + CHECK_SAMPLES, len(timestamps))
+        if(not np.array_equal(grid.values(np.arange(start, stop)),
+                              timestamps[start:stop])):
+            return(False)
+    return(True)
+
+
+def detect_uniform(timestamps):
+    """
+    Finds the uniform grid that reproduces timestamps exactly, if any
+
+    Tries decimal scales (timestamps written with a fixed number of
+    decimals) and the rounded sampling rate (timestamps computed as i / fs).
+    The tick step is the exact fraction between the first and last ticks;
+    each candidate is rejected on the first block before checking the rest.
+
+    :param timestamps: numpy array of timestamps (seconds)
+    :returns grid: UniformTimestamps, or None if timestamps are not uniform
+    """
+    if(isinstance(timestamps, UniformTimestamps)):
+        return(timestamps)
+    timestamps = np.asanyarray(timestamps)
+    if(timestamps.ndim != 1 or len(timestamps) < 2 or
+       timestamps.dtype != np.float64):
+        return(None)
+    span = float(timestamps[-1] - timestamps[0])
+    if(not span > 0):
+        return(None)
+    fs = round((len(timestamps) - 1) / span)
+    head = timestamps[:CHECK_SAMPLES]
+    for scale in DECIMAL_SCALES + ((float(fs),) if fs >= 1 else ()):
+        first, last = np.rint(timestamps[[0, -1]] * scale)
+        if(max(abs(first), abs(last)) >= MAX_TICKS or
+           first / scale != timestamps[0] or last / scale != timestamps[-1]):
+            continue
+        step = Fraction(int(last - first), len(timestamps) - 1)
+        # CRV + den // 2 rounds each tick to the nearest integer
+        start = int(first) * step.denominator + step.denominator // 2
+        if(abs(start) + len(timestamps) * step.numerator >= MAX_GRID):
+            continue
+        grid = UniformTimestamps(start, step.numerator, scale,
+                                 len(timestamps), step.denominator)
+        if(np.array_equal(grid.values(np.arange(len(head))), head) and
+           grid_matches(grid, timestamps)):
+            return(grid)
+    return(None)
+
+
+def as_timestamps(timestamps):
+    """
+    :param timestamps: UniformTimestamps, numpy array or list
+    :returns timestamps: the grid unchanged, anything else as a numpy array
+    """
+    if(isinstance(timestamps, UniformTimestamps)):
+        return(timestamps)
+    return(np.asarray(timestamps))